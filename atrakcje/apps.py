@@ -5,7 +5,13 @@ class AtrakcjeConfig(AppConfig):
     Configuration class for the 'atrakcje' application.
     
     This class defines metadata and default settings for the attractions app,
-    such as the default auto primary key field and the app name.
+    such as the default auto primary key field and the app name, and registers
+    the app's signal handlers.
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'atrakcje'
+
+    def ready(self):
+        # Register signal handlers (spatial index catalog version)
+        from . import signals  # noqa: F401
+
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:09
+
+from django.db import migrations, models
+
+from atrakcje.utils.geohash import geohash_encode
+
+
+def wypelnij_geohash(apps, schema_editor):
+    Lokalizacja = apps.get_model('atrakcje', 'Lokalizacja')
+    partia = []
+    for lok in Lokalizacja.objects.filter(szerokosc_geo__isnull=False, dlugosc_geo__isnull=False).iterator():
+        lok.geohash = geohash_encode(lok.szerokosc_geo, lok.dlugosc_geo)
+        partia.append(lok)
+        if len(partia) >= 1000:
+            Lokalizacja.objects.bulk_update(partia, ['geohash'])
+            partia = []
+    Lokalizacja.objects.bulk_update(partia, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atrakcje', '0009_alter_godzinyotwarcia_dzien_tygodnia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lokalizacja',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(wypelnij_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:21
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+from atrakcje.utils.availability import weekly_bitmap
+
+
+def wypelnij_dostepnosc(apps, schema_editor):
+    Atrakcja = apps.get_model('atrakcje', 'Atrakcja')
+    GodzinyOtwarcia = apps.get_model('atrakcje', 'GodzinyOtwarcia')
+    godziny = defaultdict(list)
+    for atrakcja_id, *wiersz in GodzinyOtwarcia.objects.values_list(
+        'atrakcja_id', 'dzien_tygodnia', 'godzina_otwarcia', 'godzina_zamkniecia', 'czy_otwarte'
+    ).iterator():
+        godziny[atrakcja_id].append(wiersz)
+    for atrakcja_id, wiersze in godziny.items():
+        Atrakcja.objects.filter(id=atrakcja_id).update(dostepnosc=weekly_bitmap(wiersze))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atrakcje', '0010_lokalizacja_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='atrakcja',
+            name='dostepnosc',
+            field=models.BinaryField(blank=True, help_text='Tygodniowa mapa bitowa godzin otwarcia (15-minutowe przedziały)', max_length=84, null=True),
+        ),
+        migrations.RunPython(wypelnij_dostepnosc, migrations.RunPython.noop),
+    ]
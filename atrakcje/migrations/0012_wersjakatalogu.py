@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atrakcje', '0011_atrakcja_dostepnosc'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WersjaKatalogu',
+            fields=[
+                ('nazwa', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('wersja', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Wersja katalogu',
+                'verbose_name_plural': 'Wersje katalogu',
+            },
+        ),
+    ]
@@ -1,11 +1,12 @@
+from django.conf import settings
 from django.db import models
 from django.utils.timezone import now
 from django.utils.html import format_html
-import googlemaps
-from django.conf import settings
 from datetime import date
 import logging
 
+from .utils.geohash import geohash_encode
+
 logger = logging.getLogger(__name__)
 
 class Kategoria(models.Model):
@@ -38,6 +39,10 @@ class Atrakcja(models.Model):
     blank=True,
     help_text="Szacowany czas zwiedzania (w minutach)"
 )
+    dostepnosc = models.BinaryField(
+        max_length=84, null=True, blank=True, editable=False,
+        help_text="Tygodniowa mapa bitowa godzin otwarcia (15-minutowe przedziały)"
+    )
     @property
     def statystyki_cen(self):
         """Returns related pricing statistics if available."""
@@ -82,6 +87,7 @@ class Lokalizacja(models.Model):
     kod_pocztowy = models.CharField(max_length=10)
     szerokosc_geo = models.FloatField(null=True, blank=True)
     dlugosc_geo = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
 
     class Meta:
         verbose_name = "Lokalizacja"
@@ -97,22 +103,44 @@ class Lokalizacja(models.Model):
         return f"{self.ulica} {self.numer_budynku}, {self.kod_pocztowy} {self.miasto}"
 
     def save(self, *args, **kwargs):
-        """Automatically geocodes address if coordinates are missing."""
+        """
+        Fills in missing coordinates from the shared geocoding cache and keeps the geohash
+        in sync with the coordinates. Addresses not in the cache are queued for the
+        background worker (manage.py geocode_worker) instead of blocking the save;
+        with GEOCODING_ASYNC = False they are geocoded right away.
+        """
+        do_kolejki = None
         if (not self.szerokosc_geo or not self.dlugosc_geo) and self.miasto and self.ulica and self.numer_budynku and self.kod_pocztowy:
-            gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
-            adres = f"{self.ulica} {self.numer_budynku}, {self.kod_pocztowy} {self.miasto}"
-            try:
-                rezultat = gmaps.geocode(adres)
-                if rezultat:
-                    location = rezultat[0]['geometry']['location']
-                    self.szerokosc_geo = location['lat']
-                    self.dlugosc_geo = location['lng']
-                    logger.info(f"Zgeokodowano lokalizację '{adres}' → ({self.szerokosc_geo}, {self.dlugosc_geo})")
-                else:
-                    logger.warning(f"Brak wyników geokodowania dla adresu: {adres}")
-            except Exception as e:
-                logger.error(f"Błąd geokodowania adresu: {adres} - {e}", exc_info=True)
+            from plany.services.geocoding import geocode, geocode_cached
+
+            adres = self.pelny_adres()
+            if getattr(settings, 'GEOCODING_ASYNC', True):
+                coords = geocode_cached(adres)
+                if coords is None:
+                    do_kolejki = adres
+                    coords = (None, None)
+            else:
+                from plany.services.gmaps_client import get_gmaps_client
+                coords = geocode(adres, get_gmaps_client())
+            lat, lng = coords
+            if lat is not None and lng is not None:
+                self.szerokosc_geo = lat
+                self.dlugosc_geo = lng
+                logger.info(f"Zgeokodowano lokalizację '{adres}' → ({self.szerokosc_geo}, {self.dlugosc_geo})")
+            elif do_kolejki:
+                logger.debug(f"Geokodowanie adresu '{adres}' dodane do kolejki")
+            else:
+                logger.warning(f"Brak wyników geokodowania dla adresu: {adres}")
+        if self.szerokosc_geo is not None and self.dlugosc_geo is not None:
+            self.geohash = geohash_encode(self.szerokosc_geo, self.dlugosc_geo)
+        else:
+            self.geohash = ''
+        if kwargs.get('update_fields') is not None and {'szerokosc_geo', 'dlugosc_geo'} & set(kwargs['update_fields']):
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'geohash'}
         super().save(*args, **kwargs)
+        if do_kolejki:
+            from plany.services.geocoding_queue import enqueue_geocoding
+            enqueue_geocoding(self, do_kolejki)
 
 class StatusAtrakcji(models.Model):
     """Tracks status changes of an attraction (e.g., available, under renovation)."""
@@ -217,3 +245,19 @@ class CennikStatystykiMV(models.Model):
         managed = False  # to jest widok, nie tabela
         db_table = 'mv_cennik_statystyki'
 
+
+
+class WersjaKatalogu(models.Model):
+    """
+    Counter bumped on every change of the attraction catalog, shared by all processes,
+    so each of them knows when to rebuild its in-memory indexes.
+    """
+    nazwa = models.CharField(max_length=50, primary_key=True)
+    wersja = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Wersja katalogu"
+        verbose_name_plural = "Wersje katalogu"
+
+    def __str__(self):
+        return f"{self.nazwa}: {self.wersja}"
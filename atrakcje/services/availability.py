@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+
+import numpy as np
+from django.utils.timezone import localtime
+
+from atrakcje.utils.availability import (
+    BITMAP_BYTES, SLOT_MINUTES, SLOTS_PER_DAY, slot_of, unpack_bitmap, weekly_bitmap
+)
+from .spatial import bump_catalog_version, catalog_version
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_availability(atrakcja_ids):
+    """
+    Recomputes the stored weekly availability bitmap (Atrakcja.dostepnosc) of attractions
+    from their GodzinyOtwarcia rows.
+
+    Args:
+        atrakcja_ids (iterable): IDs of the attractions to refresh.
+    """
+    from atrakcje.models import Atrakcja, GodzinyOtwarcia
+
+    atrakcja_ids = list(atrakcja_ids)
+    godziny = {a: [] for a in atrakcja_ids}
+    for atrakcja_id, *wiersz in GodzinyOtwarcia.objects.filter(atrakcja_id__in=atrakcja_ids).values_list(
+        'atrakcja_id', 'dzien_tygodnia', 'godzina_otwarcia', 'godzina_zamkniecia', 'czy_otwarte'
+    ):
+        godziny[atrakcja_id].append(wiersz)
+    for atrakcja_id, wiersze in godziny.items():
+        # update() - the bitmap is derived data and must not bump updated_at or fire signals.
+        Atrakcja.objects.filter(id=atrakcja_id).update(dostepnosc=weekly_bitmap(wiersze))
+    bump_catalog_version()
+
+
+def earliest_visit(dostepnosc, przyjazd, minuty):
+    """
+    Finds the earliest start of a visit, on the arrival day, during which the attraction
+    stays open for the whole visit.
+
+    Args:
+        dostepnosc (bytes | None): Stored weekly bitmap (None: always open).
+        przyjazd (datetime): Arrival time.
+        minuty (int): Length of the visit.
+
+    Returns:
+        datetime | None: Start of the visit (>= przyjazd), or None if it does not fit that day.
+    """
+    if dostepnosc is None:
+        return przyjazd
+    lokalny = localtime(przyjazd)
+    dzien = unpack_bitmap(dostepnosc)[lokalny.weekday() * SLOTS_PER_DAY:(lokalny.weekday() + 1) * SLOTS_PER_DAY]
+    od = lokalny.hour * 60 + lokalny.minute + (1 if lokalny.second or lokalny.microsecond else 0)
+
+    sloty = np.arange(od // SLOT_MINUTES, SLOTS_PER_DAY)
+    poczatki = np.maximum(od, sloty * SLOT_MINUTES)
+    konce = -(-(poczatki + minuty) // SLOT_MINUTES)
+    zamkniete = np.concatenate([[0], np.cumsum(~dzien)])
+    w_dniu = konce <= SLOTS_PER_DAY
+    pasuje = w_dniu & (zamkniete[np.minimum(konce, SLOTS_PER_DAY)] - zamkniete[sloty] == 0)
+    if not pasuje.any():
+        return None
+    start = int(poczatki[np.argmax(pasuje)])
+    if start == od:
+        return przyjazd
+    return lokalny.replace(hour=start // 60, minute=start % 60, second=0, microsecond=0)
+
+
+class AvailabilityIndex:
+    """
+    Packed availability bitmaps of all attractions, one row per attraction, so
+    "open at T" is a single column test over the whole catalog.
+    """
+
+    def __init__(self, atrakcja_ids, bitmapy):
+        self.atrakcja_ids = np.asarray(atrakcja_ids, dtype=np.int64)
+        self.bity = np.frombuffer(b''.join(bitmapy), dtype=np.uint8).reshape(-1, BITMAP_BYTES)
+
+    def __len__(self):
+        return len(self.atrakcja_ids)
+
+    def open_at(self, chwila):
+        """
+        Returns IDs of attractions open at a moment (attractions without known hours included).
+
+        Returns:
+            list: Attraction IDs.
+        """
+        slot = slot_of(localtime(chwila))
+        otwarte = (self.bity[:, slot // 8] >> (7 - slot % 8)) & 1
+        return self.atrakcja_ids[otwarte.astype(bool)].tolist()
+
+
+_index = None
+_index_version = None
+_index_built = 0.0
+_index_lock = threading.Lock()
+# Rebuilt on every catalog change anyway; the age limit only guards against a lost version bump.
+INDEX_MAX_AGE = 300.0
+
+
+def _build_index():
+    from atrakcje.models import Atrakcja
+
+    ids, bitmapy = [], []
+    pelna = unpack_bitmap(None)
+    for atrakcja_id, dostepnosc in Atrakcja.objects.values_list('id', 'dostepnosc').iterator():
+        ids.append(atrakcja_id)
+        bitmapy.append(np.packbits(pelna).tobytes() if dostepnosc is None else bytes(dostepnosc))
+    return AvailabilityIndex(ids, bitmapy)
+
+
+def get_availability_index():
+    """
+    Returns the process-wide availability index, rebuilt when the catalog version changes.
+
+    Returns:
+        AvailabilityIndex: Current index.
+    """
+    global _index, _index_version, _index_built
+    wersja = catalog_version()
+    if _index is not None and _index_version == wersja and time.monotonic() - _index_built < INDEX_MAX_AGE:
+        return _index
+    with _index_lock:
+        if _index is None or _index_version != wersja or time.monotonic() - _index_built >= INDEX_MAX_AGE:
+            start = time.perf_counter()
+            _index = _build_index()
+            _index_version = wersja
+            _index_built = time.monotonic()
+            logger.info(
+                f"Zbudowano indeks godzin otwarcia: {len(_index)} atrakcji, wersja {wersja}, "
+                f"{(time.perf_counter() - start) * 1000:.0f} ms"
+            )
+    return _index
+
+
+def open_at(chwila):
+    """
+    Returns IDs of attractions open at a moment.
+
+    Args:
+        chwila (datetime): The moment to check (aware).
+
+    Returns:
+        list: Attraction IDs.
+    """
+    return get_availability_index().open_at(chwila)
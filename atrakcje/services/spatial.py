@@ -0,0 +1,224 @@
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'atrakcje'
+DEFAULT_CELL_KM = 1.0
+DEFAULT_RADIUS_KM = 1.0
+DEFAULT_MAX_AGE = 300.0
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+MAX_SCANNED_ROWS = 1000
+# Grid rows are packed into one int64 key: ix * _KEY_STRIDE + iy.
+_KEY_STRIDE = 1 << 32
+
+
+def catalog_version():
+    """Returns the current catalog version (bumped by atrakcje.signals on every change)."""
+    from atrakcje.models import WersjaKatalogu
+
+    return WersjaKatalogu.objects.filter(pk=CATALOG_VERSION_KEY).values_list('wersja', flat=True).first() or 0
+
+
+def bump_catalog_version():
+    """
+    Marks the catalog as changed, so every process rebuilds its spatial index. The
+    counter lives in the database (not the per-process cache), so all workers see it.
+    """
+    from atrakcje.models import WersjaKatalogu
+
+    wersje = WersjaKatalogu.objects.filter(pk=CATALOG_VERSION_KEY)
+    if not wersje.update(wersja=F('wersja') + 1):
+        _, utworzona = WersjaKatalogu.objects.get_or_create(pk=CATALOG_VERSION_KEY, defaults={'wersja': 1})
+        if not utworzona:
+            wersje.update(wersja=F('wersja') + 1)
+
+
+class SpatialIndex:
+    """
+    In-memory uniform grid over the coordinates of all attractions.
+
+    Points are sorted by grid cell, so a query only has to binary-search the cells
+    overlapping the search circle and compute exact distances for their points.
+    """
+
+    def __init__(self, atrakcja_ids, kategoria_ids, coords, cell_km=DEFAULT_CELL_KM):
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        klucze = self._keys(coords[:, 0], coords[:, 1]) if len(coords) else np.empty(0, dtype=np.int64)
+        order = np.argsort(klucze, kind='stable')
+        self.klucze = klucze[order]
+        self.atrakcja_ids = np.asarray(atrakcja_ids, dtype=np.int64)[order]
+        self.kategoria_ids = np.asarray(kategoria_ids, dtype=np.int64)[order]
+        self.coords = coords[order]
+        self.radians = np.radians(self.coords)
+        self.wiersze = {int(a): i for i, a in enumerate(self.atrakcja_ids)}
+
+    def __len__(self):
+        return len(self.atrakcja_ids)
+
+    def _cells(self, lat, lng):
+        return (np.floor(np.asarray(lat) / self.cell_deg).astype(np.int64),
+                np.floor(np.asarray(lng) / self.cell_deg).astype(np.int64))
+
+    def _keys(self, lat, lng):
+        ix, iy = self._cells(lat, lng)
+        return ix * _KEY_STRIDE + (iy + _KEY_STRIDE // 2)
+
+    def coords_of(self, atrakcja_id):
+        """Returns (lat, lng) of an indexed attraction or None."""
+        wiersz = self.wiersze.get(int(atrakcja_id))
+        return None if wiersz is None else tuple(self.coords[wiersz])
+
+    def _candidates(self, lat, lng, radius):
+        dlat = radius / KM_PER_DEGREE
+        # Towards the poles the longitude span of the circle grows without bound; 180° covers every meridian.
+        dlng = min(radius / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6)), 180.0)
+        lng_od, lng_do = lng - dlng, lng + dlng
+        if lng_od < -180.0 or lng_do > 180.0:
+            # The circle crosses the antimeridian - scan whole grid rows.
+            lng_od, lng_do = -180.0, 180.0
+        ix0, iy0 = self._cells(lat - dlat, lng_od)
+        ix1, iy1 = self._cells(lat + dlat, lng_do)
+        if ix1 - ix0 + 1 > MAX_SCANNED_ROWS:
+            # Very large radius: the whole latitude band is one contiguous key range.
+            lewe = np.searchsorted(self.klucze, [ix0 * _KEY_STRIDE], side='left')
+            prawe = np.searchsorted(self.klucze, [(ix1 + 1) * _KEY_STRIDE], side='left')
+        else:
+            # Cells of one grid row are contiguous in key order, so each row is a single range.
+            wiersze = np.arange(ix0, ix1 + 1) * _KEY_STRIDE + _KEY_STRIDE // 2
+            lewe = np.searchsorted(self.klucze, wiersze + iy0, side='left')
+            prawe = np.searchsorted(self.klucze, wiersze + iy1, side='right')
+        niepuste = prawe > lewe
+        if not niepuste.any():
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(a, b) for a, b in zip(lewe[niepuste], prawe[niepuste])])
+
+    def query(self, lat, lng, radius, kategoria=None, limit=10, exclude=()):
+        """
+        Returns attractions within `radius` km of a point, nearest first.
+
+        Returns:
+            list: (atrakcja_id, distance in km) tuples.
+        """
+        if not len(self):
+            return []
+        kandydaci = self._candidates(lat, lng, radius)
+        if kategoria is not None and len(kandydaci):
+            kandydaci = kandydaci[self.kategoria_ids[kandydaci] == int(kategoria)]
+        if exclude and len(kandydaci):
+            kandydaci = kandydaci[~np.isin(self.atrakcja_ids[kandydaci], list(exclude))]
+        if not len(kandydaci):
+            return []
+
+        p = np.radians([lat, lng])
+        q = self.radians[kandydaci]
+        h = (np.sin((q[:, 0] - p[0]) / 2) ** 2
+             + math.cos(p[0]) * np.cos(q[:, 0]) * np.sin((q[:, 1] - p[1]) / 2) ** 2)
+        dystans = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+        w_zasiegu = dystans <= radius
+        kandydaci, dystans = kandydaci[w_zasiegu], dystans[w_zasiegu]
+        if limit and len(dystans) > limit:
+            najblizsze = np.argpartition(dystans, limit - 1)[:limit]
+            kandydaci, dystans = kandydaci[najblizsze], dystans[najblizsze]
+        order = np.argsort(dystans, kind='stable')
+        return [(int(self.atrakcja_ids[k]), float(d)) for k, d in zip(kandydaci[order], dystans[order])]
+
+
+_index = None
+_index_version = None
+_index_built = 0.0
+_index_lock = threading.Lock()
+
+
+def _build_index():
+    from atrakcje.models import Lokalizacja
+
+    wiersze = list(
+        Lokalizacja.objects
+        .filter(atrakcja__isnull=False, szerokosc_geo__isnull=False, dlugosc_geo__isnull=False)
+        .values_list('atrakcja_id', 'atrakcja__kategoria_id', 'szerokosc_geo', 'dlugosc_geo')
+    )
+    coords = np.array([(w[2], w[3]) for w in wiersze], dtype=np.float64).reshape(-1, 2)
+    return SpatialIndex(
+        [w[0] for w in wiersze],
+        [w[1] if w[1] is not None else -1 for w in wiersze],
+        coords,
+        cell_km=getattr(settings, 'SPATIAL_INDEX_CELL_KM', DEFAULT_CELL_KM),
+    )
+
+
+def get_spatial_index():
+    """
+    Returns the process-wide spatial index, rebuilding it when the catalog version
+    changed or it is older than SPATIAL_INDEX_MAX_AGE seconds.
+
+    Returns:
+        SpatialIndex: Current index.
+    """
+    global _index, _index_version, _index_built
+    wersja = catalog_version()
+    max_age = getattr(settings, 'SPATIAL_INDEX_MAX_AGE', DEFAULT_MAX_AGE)
+    if _index is not None and _index_version == wersja and time.monotonic() - _index_built < max_age:
+        return _index
+    with _index_lock:
+        if _index is None or _index_version != wersja or time.monotonic() - _index_built >= max_age:
+            start = time.perf_counter()
+            _index = _build_index()
+            _index_version = wersja
+            _index_built = time.monotonic()
+            logger.info(
+                f"Zbudowano indeks przestrzenny: {len(_index)} atrakcji, wersja {wersja}, "
+                f"{(time.perf_counter() - start) * 1000:.0f} ms"
+            )
+    return _index
+
+
+def nearby(lat, lng, radius, kategoria=None, limit=10, exclude=()):
+    """
+    Finds attractions near a point.
+
+    Args:
+        lat (float): Latitude of the point.
+        lng (float): Longitude of the point.
+        radius (float): Search radius in kilometres.
+        kategoria (int): Optional Kategoria id to filter by.
+        limit (int): Maximum number of results.
+        exclude (iterable): Attraction ids to leave out.
+
+    Returns:
+        list: (atrakcja_id, distance in km) tuples, nearest first.
+    """
+    return get_spatial_index().query(lat, lng, radius, kategoria=kategoria, limit=limit, exclude=exclude)
+
+
+def nearby_attractions(atrakcja_ids, radius, kategoria=None, limit=10):
+    """
+    Finds attractions near any of the given ones (e.g. suggestions for the plan cart).
+
+    Args:
+        atrakcja_ids (iterable): Attractions already chosen (excluded from the result).
+        radius (float): Search radius in kilometres.
+        kategoria (int): Optional Kategoria id to filter by.
+        limit (int): Maximum number of results.
+
+    Returns:
+        list: (atrakcja_id, distance in km to the closest chosen attraction), nearest first.
+    """
+    index = get_spatial_index()
+    wybrane = {int(a) for a in atrakcja_ids}
+    najblizsze = {}
+    for atrakcja_id in wybrane:
+        punkt = index.coords_of(atrakcja_id)
+        if punkt is None:
+            continue
+        for kandydat, dystans in index.query(punkt[0], punkt[1], radius, kategoria=kategoria, limit=limit, exclude=wybrane):
+            if dystans < najblizsze.get(kandydat, math.inf):
+                najblizsze[kandydat] = dystans
+    return sorted(najblizsze.items(), key=lambda x: x[1])[:limit]
@@ -0,0 +1,22 @@
+import logging
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Atrakcja, GodzinyOtwarcia, Lokalizacja
+from .services.availability import refresh_availability
+from .services.spatial import bump_catalog_version
+
+logger = logging.getLogger(__name__)
+
+
+@receiver([post_save, post_delete], sender=Lokalizacja)
+@receiver([post_save, post_delete], sender=Atrakcja)
+def katalog_changed(sender, instance, **kwargs):
+    """Bumps the catalog version so every process rebuilds its spatial and availability indexes."""
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=GodzinyOtwarcia)
+def godziny_otwarcia_changed(sender, instance, **kwargs):
+    """Recomputes the weekly availability bitmap of the attraction whose opening hours changed."""
+    refresh_availability([instance.atrakcja_id])
@@ -1,3 +1,156 @@
-from django.test import TestCase
+import math
+import random
+from datetime import datetime, time
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+from django.utils.timezone import make_aware
+
+from atrakcje.services.availability import earliest_visit
+from atrakcje.services.spatial import EARTH_RADIUS_KM, SpatialIndex
+from atrakcje.utils.availability import BITMAP_BYTES, SLOTS_PER_DAY, slot_of, unpack_bitmap, weekly_bitmap
+
+
+def _open_slots(godziny):
+    return set(np.flatnonzero(unpack_bitmap(weekly_bitmap(godziny))).tolist())
+
+
+def _slot(dzien, godzina, minuta=0):
+    return (dzien - 1) * SLOTS_PER_DAY + (godzina * 60 + minuta) // 15
+
+
+class WeeklyBitmapTests(SimpleTestCase):
+    def test_unknown_hours_mean_always_open(self):
+        self.assertIsNone(weekly_bitmap([]))
+        self.assertTrue(unpack_bitmap(None).all())
+
+    def test_opening_hours_are_encoded_as_slots(self):
+        dane = weekly_bitmap([('1', time(9, 0), time(17, 0), True)])
+
+        self.assertEqual(len(dane), BITMAP_BYTES)
+        self.assertEqual(_open_slots([('1', time(9, 0), time(17, 0), True)]), set(range(_slot(1, 9), _slot(1, 17))))
+
+    def test_partial_slots_are_closed(self):
+        sloty = _open_slots([('2', time(9, 10), time(10, 20), True)])
+
+        self.assertEqual(sloty, set(range(_slot(2, 9, 15), _slot(2, 10, 15))))
+
+    def test_closed_days_are_skipped(self):
+        self.assertEqual(_open_slots([('3', time(9, 0), time(17, 0), False)]), set())
+
+    def test_closing_after_midnight_continues_on_the_next_day(self):
+        sloty = _open_slots([('5', time(22, 0), time(2, 0), True)])
+
+        self.assertEqual(sloty, set(range(_slot(5, 22), _slot(6, 2))))
+
+    def test_sunday_night_spills_over_to_monday(self):
+        sloty = _open_slots([('7', time(23, 0), time(1, 0), True)])
+
+        self.assertEqual(sloty, set(range(_slot(7, 23), _slot(7, 24))) | set(range(_slot(1, 0), _slot(1, 1))))
+
+    def test_slot_of(self):
+        # 2026-10-21 is a Wednesday.
+        self.assertEqual(slot_of(datetime(2026, 10, 21, 13, 40)), _slot(3, 13, 30))
+
+
+class EarliestVisitTests(SimpleTestCase):
+    # Monday to Friday 10:00-16:00.
+    dostepnosc = weekly_bitmap([(str(d), time(10, 0), time(16, 0), True) for d in range(1, 6)])
+
+    def _chwila(self, dzien, godzina, minuta=0):
+        # 2026-10-19 is a Monday.
+        return make_aware(datetime(2026, 10, 18 + dzien, godzina, minuta))
+
+    def test_always_open_without_known_hours(self):
+        przyjazd = self._chwila(7, 3, 17)
+
+        self.assertEqual(earliest_visit(None, przyjazd, 600), przyjazd)
+
+    def test_arrival_during_opening_hours(self):
+        przyjazd = self._chwila(2, 11, 7)
+
+        self.assertEqual(earliest_visit(self.dostepnosc, przyjazd, 60), przyjazd)
+
+    def test_arrival_before_opening_waits_for_it(self):
+        self.assertEqual(earliest_visit(self.dostepnosc, self._chwila(1, 8, 20), 90), self._chwila(1, 10))
+
+    def test_visit_must_end_before_closing(self):
+        self.assertEqual(earliest_visit(self.dostepnosc, self._chwila(3, 15, 0), 60), self._chwila(3, 15))
+        self.assertIsNone(earliest_visit(self.dostepnosc, self._chwila(3, 15, 1), 60))
+        self.assertIsNone(earliest_visit(self.dostepnosc, self._chwila(3, 9, 0), 7 * 60))
+
+    def test_closed_day(self):
+        self.assertIsNone(earliest_visit(self.dostepnosc, self._chwila(6, 9, 0), 30))
+
+
+def _haversine(a, b):
+    lat1, lng1, lat2, lng2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(h, 1.0)))
+
+
+class SpatialIndexTests(SimpleTestCase):
+    """Compares SpatialIndex.query with a brute-force scan over the same points."""
+
+    def setUp(self):
+        self.rng = random.Random(11)
+
+    def _index(self, punkty, kategorie=None):
+        kategorie = kategorie or [1] * len(punkty)
+        return SpatialIndex(list(range(len(punkty))), kategorie, np.array(punkty, dtype=float))
+
+    def _brute_force(self, punkty, srodek, radius, kategorie=None, kategoria=None, exclude=()):
+        wynik = [
+            (i, _haversine(srodek, p)) for i, p in enumerate(punkty)
+            if i not in exclude and (kategoria is None or kategorie[i] == kategoria)
+        ]
+        return sorted(((i, d) for i, d in wynik if d <= radius), key=lambda x: x[1])
+
+    def assertSameResults(self, wynik, oczekiwane):
+        self.assertEqual([i for i, _ in wynik], [i for i, _ in oczekiwane])
+        for (_, d), (_, e) in zip(wynik, oczekiwane):
+            self.assertAlmostEqual(d, e, places=6)
+
+    def test_matches_brute_force_in_a_city(self):
+        punkty = [(50.06 + self.rng.uniform(-0.1, 0.1), 19.94 + self.rng.uniform(-0.15, 0.15)) for _ in range(500)]
+        index = self._index(punkty)
+
+        for _ in range(30):
+            srodek = (50.06 + self.rng.uniform(-0.1, 0.1), 19.94 + self.rng.uniform(-0.15, 0.15))
+            for radius in (0.3, 1.0, 2.5, 8.0):
+                self.assertSameResults(
+                    index.query(*srodek, radius, limit=None), self._brute_force(punkty, srodek, radius)
+                )
+
+    def test_category_exclude_and_limit(self):
+        punkty = [(50.06 + self.rng.uniform(-0.05, 0.05), 19.94 + self.rng.uniform(-0.05, 0.05)) for _ in range(200)]
+        kategorie = [self.rng.choice([1, 2, 3]) for _ in punkty]
+        index = self._index(punkty, kategorie)
+        srodek, wykluczone = (50.06, 19.94), {0, 1, 2, 3}
+
+        wynik = index.query(*srodek, 3.0, kategoria=2, limit=5, exclude=wykluczone)
+
+        self.assertSameResults(wynik, self._brute_force(punkty, srodek, 3.0, kategorie, 2, wykluczone)[:5])
+
+    def test_matches_brute_force_worldwide(self):
+        punkty = [(self.rng.uniform(-89, 89), self.rng.uniform(-180, 180)) for _ in range(500)]
+        index = self._index(punkty)
+
+        for srodek in [(0.0, 179.9), (0.0, -179.9), (88.5, 10.0), (-89.5, -120.0), (45.0, 0.0)]:
+            for radius in (50.0, 500.0, 3000.0, 25000.0):
+                self.assertSameResults(
+                    index.query(*srodek, radius, limit=None), self._brute_force(punkty, srodek, radius)
+                )
+
+    def test_circle_crossing_the_antimeridian(self):
+        punkty = [(self.rng.uniform(-1, 1), self.rng.choice([-1, 1]) * self.rng.uniform(179.0, 180.0)) for _ in range(200)]
+        index = self._index(punkty)
+
+        for srodek in [(0.0, 179.95), (0.0, -179.95), (0.5, 180.0)]:
+            for radius in (5.0, 40.0, 150.0):
+                self.assertSameResults(
+                    index.query(*srodek, radius, limit=None), self._brute_force(punkty, srodek, radius)
+                )
+
+    def test_empty_index(self):
+        self.assertEqual(self._index([]).query(50.06, 19.94, 5.0), [])
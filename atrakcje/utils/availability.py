@@ -0,0 +1,60 @@
+import numpy as np
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+WEEK_SLOTS = 7 * SLOTS_PER_DAY
+BITMAP_BYTES = WEEK_SLOTS // 8
+
+
+def _minutes(t):
+    return t.hour * 60 + t.minute + (1 if t.second or t.microsecond else 0)
+
+
+def weekly_bitmap(godziny):
+    """
+    Encodes weekly opening hours as a bitmap of 15-minute slots, Monday 00:00 first.
+
+    A slot is open only if it lies entirely within opening hours (opening times are
+    rounded up and closing times down to a slot boundary). A closing time not after
+    the opening time means the attraction closes after midnight, on the next day.
+
+    Args:
+        godziny (iterable): (dzien_tygodnia '1'-'7', godzina_otwarcia, godzina_zamkniecia,
+            czy_otwarte) tuples, e.g. GodzinyOtwarcia values_list rows.
+
+    Returns:
+        bytes | None: BITMAP_BYTES packed bits, or None if no hours are known
+        (such attractions are treated as always open).
+    """
+    godziny = list(godziny)
+    if not godziny:
+        return None
+    bity = np.zeros(WEEK_SLOTS + SLOTS_PER_DAY, dtype=bool)
+    for dzien, otwarcie, zamkniecie, czy_otwarte in godziny:
+        if not czy_otwarte:
+            continue
+        poczatek = (int(dzien) - 1) * SLOTS_PER_DAY * SLOT_MINUTES + _minutes(otwarcie)
+        koniec = (int(dzien) - 1) * SLOTS_PER_DAY * SLOT_MINUTES + zamkniecie.hour * 60 + zamkniecie.minute
+        if koniec <= poczatek:
+            koniec += 24 * 60
+        bity[-(-poczatek // SLOT_MINUTES):koniec // SLOT_MINUTES] = True
+    # Sunday night spills over to Monday morning.
+    bity[:SLOTS_PER_DAY] |= bity[WEEK_SLOTS:]
+    return np.packbits(bity[:WEEK_SLOTS]).tobytes()
+
+
+def unpack_bitmap(dane):
+    """
+    Decodes a bitmap from weekly_bitmap.
+
+    Returns:
+        np.ndarray: (WEEK_SLOTS,) booleans, all True for None (no known hours).
+    """
+    if dane is None:
+        return np.ones(WEEK_SLOTS, dtype=bool)
+    return np.unpackbits(np.frombuffer(bytes(dane), dtype=np.uint8))[:WEEK_SLOTS].astype(bool)
+
+
+def slot_of(chwila):
+    """Returns the weekly slot index of a (local) datetime."""
+    return chwila.weekday() * SLOTS_PER_DAY + (chwila.hour * 60 + chwila.minute) // SLOT_MINUTES
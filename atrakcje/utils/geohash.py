@@ -0,0 +1,38 @@
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+DEFAULT_PRECISION = 9
+
+
+def geohash_encode(lat, lng, precision=DEFAULT_PRECISION):
+    """
+    Encodes coordinates as a geohash string.
+
+    Args:
+        lat (float): Latitude in degrees.
+        lng (float): Longitude in degrees.
+        precision (int): Number of characters (9 ≈ 5 m cells).
+
+    Returns:
+        str: Geohash; points sharing a prefix lie in the same cell.
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    znaki = []
+    bity = 0
+    liczba_bitow = 0
+    parzysty = True
+    while len(znaki) < precision:
+        zakres, wartosc = (lng_range, lng) if parzysty else (lat_range, lat)
+        srodek = (zakres[0] + zakres[1]) / 2
+        if wartosc >= srodek:
+            bity = (bity << 1) | 1
+            zakres[0] = srodek
+        else:
+            bity <<= 1
+            zakres[1] = srodek
+        parzysty = not parzysty
+        liczba_bitow += 1
+        if liczba_bitow == 5:
+            znaki.append(_BASE32[bity])
+            bity = 0
+            liczba_bitow = 0
+    return ''.join(znaki)
@@ -1,44 +1,86 @@
 import logging
+import math
 from django.shortcuts import render, get_object_or_404
+from django.http import JsonResponse
+from django.contrib import messages
 from .models import Atrakcja, CennikStatystykiMV
+from .services.availability import open_at
+from .services.spatial import DEFAULT_RADIUS_KM, nearby, get_spatial_index
 from django.conf import settings
 from django.db import connection
 from django.core.paginator import Paginator
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, now
+from urllib.parse import urlencode
 
 logger = logging.getLogger(__name__)
 
+NEARBY_MAX_RADIUS = 50.0
+NEARBY_MAX_LIMIT = 50
 
 
 
 def lista_atrakcji(request):
     """
     Renders a paginated list of attractions.
-    Supports optional filtering by city (via 'miasto' GET parameter).
+    Supports optional filtering by city (via 'miasto' GET parameter) and by opening
+    hours: open now ('otwarte') or open at a given time ('otwarte_o', YYYY-MM-DDTHH:MM),
+    answered from the weekly availability index instead of per-row SQL comparisons.
     Also attaches pricing statistics from materialized view.
 
     Template: atrakcje/lista_atrakcji.html
     """
     miasto = request.GET.get('miasto', '').strip()
+    otwarte = bool(request.GET.get('otwarte'))
+    otwarte_o = request.GET.get('otwarte_o', '').strip()
     atrakcje_qs = Atrakcja.objects.all().select_related('lokalizacja', 'kategoria')
 
     if miasto:
         atrakcje_qs = atrakcje_qs.filter(lokalizacja__miasto__icontains=miasto)
         logger.info(f"Filtruję atrakcje po mieście: {miasto}")
 
+    chwila = None
+    if otwarte_o:
+        try:
+            chwila = parse_datetime(otwarte_o)
+        except ValueError:
+            # Well-formed but impossible dates (e.g. 2026-02-30T10:00) - the filter is ignored.
+            chwila = None
+        if chwila is None:
+            messages.warning(request, f"Nieprawidłowa data: {otwarte_o}. Pominięto filtr godzin otwarcia.")
+        elif is_naive(chwila):
+            chwila = make_aware(chwila)
+    elif otwarte:
+        chwila = now()
+
     statystyki_dict = {
         stat.atrakcja_id: stat
         for stat in CennikStatystykiMV.objects.all()
     }
 
-    paginator = Paginator(atrakcje_qs, 10)  # 10 attractions per page
     page_number = request.GET.get("page")
-    atrakcje_page = paginator.get_page(page_number)
+    if chwila is not None:
+        # Filtered in Python and paginated over IDs: an IN list of every open attraction would
+        # exceed Oracle's bind variable limit on a large catalog. Only the page is fetched by ID.
+        otwarte_ids = set(open_at(chwila))
+        ids = [a for a in atrakcje_qs.values_list('id', flat=True) if a in otwarte_ids]
+        atrakcje_page = Paginator(ids, 10).get_page(page_number)
+        po_id = atrakcje_qs.in_bulk(atrakcje_page.object_list)
+        atrakcje_page.object_list = [po_id[a] for a in atrakcje_page.object_list if a in po_id]
+        logger.info(f"Filtruję atrakcje otwarte o {chwila}")
+    else:
+        paginator = Paginator(atrakcje_qs, 10)  # 10 attractions per page
+        atrakcje_page = paginator.get_page(page_number)
 
     logger.debug(f"Wyświetlam stronę {page_number} z listą atrakcji (miasto='{miasto}')")
 
+    filtry = {k: v for k, v in (('miasto', miasto), ('otwarte', '1' if otwarte else ''), ('otwarte_o', otwarte_o)) if v}
     return render(request, 'atrakcje/lista_atrakcji.html', {
         'atrakcje': atrakcje_page,
         'miasto': miasto,
+        'otwarte': otwarte,
+        'otwarte_o': otwarte_o,
+        'filtry': urlencode(filtry),
         'statystyki_dict': statystyki_dict,
     })
 
@@ -90,6 +132,53 @@ def szczegoly_atrakcji(request, id):
     })
 
 
+def atrakcje_w_poblizu(request):
+    """
+    Returns attractions near a point or near another attraction as JSON.
+
+    GET parameters: 'lat' and 'lng' or 'atrakcja' (ID), optional 'promien' (km),
+    'kategoria' (ID) and 'limit'.
+
+    Returns:
+        JsonResponse: {'wyniki': [...]} nearest first, or {'blad': ...} with status 400.
+    """
+    try:
+        promien = min(float(request.GET.get('promien', getattr(settings, 'NEARBY_RADIUS_KM', DEFAULT_RADIUS_KM))), NEARBY_MAX_RADIUS)
+        limit = max(1, min(int(request.GET.get('limit', 10)), NEARBY_MAX_LIMIT))
+        kategoria = int(request.GET['kategoria']) if request.GET.get('kategoria') else None
+        atrakcja_id = int(request.GET['atrakcja']) if request.GET.get('atrakcja') else None
+        if atrakcja_id is not None:
+            punkt = get_spatial_index().coords_of(atrakcja_id)
+            if punkt is None:
+                return JsonResponse({'blad': 'Atrakcja nie ma lokalizacji.'}, status=404)
+            lat, lng = punkt
+        else:
+            lat, lng = float(request.GET['lat']), float(request.GET['lng'])
+    except (KeyError, ValueError):
+        return JsonResponse({'blad': "Podaj 'lat' i 'lng' albo 'atrakcja'."}, status=400)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return JsonResponse({'blad': "Współrzędne poza zakresem (lat -90..90, lng -180..180)."}, status=400)
+    if not (math.isfinite(promien) and promien >= 0):
+        return JsonResponse({'blad': "Nieprawidłowy promień."}, status=400)
+
+    wyniki = nearby(lat, lng, promien, kategoria=kategoria, limit=limit,
+                    exclude=(atrakcja_id,) if atrakcja_id is not None else ())
+    atrakcje = Atrakcja.objects.select_related('kategoria', 'lokalizacja').in_bulk([a for a, _ in wyniki])
+    logger.debug(f"Atrakcje w pobliżu ({lat}, {lng}), promień {promien} km: {len(wyniki)}")
+    return JsonResponse({'wyniki': [
+        {
+            'id': a.id,
+            'nazwa': a.nazwa,
+            'kategoria': a.kategoria.nazwa,
+            'adres': a.adres(),
+            'lat': a.lokalizacja.szerokosc_geo,
+            'lng': a.lokalizacja.dlugosc_geo,
+            'odleglosc_km': round(dystans, 3),
+        }
+        for a, dystans in ((atrakcje.get(i), d) for i, d in wyniki) if a is not None
+    ]})
+
+
 def strona_glowna(request):
     """
     Renders the homepage of the application.
@@ -123,6 +123,9 @@ DATABASES = {
         'PASSWORD': 'student',
     }
 }
+# Separate connection to the same database for the Google Maps rate limiter, so its
+# row lock is never held by a request's transaction
+DATABASES['limity'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -154,6 +157,106 @@ LOGIN_URL = '/konta/login/'
 LOGIN_REDIRECT_URL = '/'
 GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY')
 
+# Geocoding cache (plany.services.geocoding): TTLs in seconds, LRU size per worker
+GEOCODE_CACHE_TTL = 60 * 60 * 24 * 30
+GEOCODE_CACHE_NEGATIVE_TTL = 60 * 60 * 24
+GEOCODE_CACHE_LRU_SIZE = 2048
+
+# Directions cache (plany.services.routes): TTL in seconds, max rows kept
+ROUTE_CACHE_TTL = 60 * 60 * 24 * 7
+ROUTE_CACHE_MAX_ENTRIES = 5000
+
+# Static map image store (plany.services.static_maps), defaults to MEDIA_ROOT/mapy_statyczne
+STATIC_MAP_CACHE_DIR = os.environ.get('STATIC_MAP_CACHE_DIR') or None
+STATIC_MAP_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Rendered plan PDFs (plany.services.pdf_cache), stored by plan content hash; defaults to BASE_DIR/pdf_planow
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR') or None
+PDF_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+# PDFs not in the cache are rendered in the background (manage.py pdf_worker) and the export
+# page polls them; False renders within the request. Either way WeasyPrint runs in its own
+# process limited in memory (MB) and CPU/wall time (seconds); lease in seconds
+PDF_RENDER_ASYNC = True
+PDF_RENDER_MEMORY_LIMIT_MB = 1024
+PDF_RENDER_TIME_LIMIT = 60
+PDF_RENDER_JOB_MAX_ATTEMPTS = 2
+PDF_RENDER_JOB_RETRY_DELAY = 10
+PDF_RENDER_JOB_LEASE = 300
+
+# How stored files (plan PDFs, static maps) are sent: None streams them from Django in chunks;
+# 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache mod_xsendfile, lighttpd) hands them to the
+# web server. X-Accel-Redirect needs an internal nginx location per directory, e.g.
+# {str(BASE_DIR / 'pdf_planow'): '/_pliki/pdf/', str(MEDIA_ROOT / 'mapy_statyczne'): '/_pliki/mapy/'}
+FILE_SERVE_BACKEND = os.environ.get('FILE_SERVE_BACKEND') or None
+FILE_SERVE_ACCEL_LOCATIONS = {}
+
+# Distance Matrix API elements (origins x destinations) per request
+DISTANCE_MATRIX_MAX_ELEMENTS = 100
+
+# Routing backend (plany.services.routing): 'google', 'local' or 'auto' (Google with local fallback)
+ROUTING_BACKEND = os.environ.get('ROUTING_BACKEND', 'auto')
+ROUTING_PRIMARY_TIMEOUT = 5.0  # seconds before 'auto' falls back to the local estimate
+ROUTING_SPEED_PROFILES = {  # km/h, used by the local estimate
+    'driving': 30.0,
+    'walking': 4.5,
+    'bicycling': 14.0,
+    'transit': 20.0,
+}
+ROUTING_DETOUR_FACTOR = 1.3  # road distance / straight-line distance
+
+# Precomputed attraction-to-attraction travel times (manage.py precompute_travel_matrix)
+TRAVEL_MATRIX_ENABLED = True
+TRAVEL_MATRIX_DIR = os.environ.get('TRAVEL_MATRIX_DIR') or BASE_DIR / 'macierze_dojazdu'
+TRAVEL_MATRIX_REFRESH_INTERVAL = 60.0  # seconds between checks for a newer matrix version
+
+# Background geocoding of locations saved without coordinates (manage.py geocode_worker);
+# retry delay doubles after every failed attempt, lease in seconds
+GEOCODING_ASYNC = True
+GEOCODING_JOB_MAX_ATTEMPTS = 5
+GEOCODING_JOB_RETRY_DELAY = 30
+GEOCODING_JOB_LEASE = 300
+
+# Plans saved from the cart are built in the background (manage.py plan_worker)
+# and the cart page polls their progress; False builds them within the request.
+# Each *_ASYNC flag needs its worker running - see the Procfile
+PLAN_BUILD_ASYNC = True
+PLAN_BUILD_JOB_MAX_ATTEMPTS = 3
+PLAN_BUILD_JOB_RETRY_DELAY = 10
+PLAN_BUILD_JOB_LEASE = 300
+
+# Daily time budget (visits + travel, minutes) used when the cart is split into days automatically
+PLAN_DAY_BUDGET_MINUTES = 480
+# Hour at which the second and following days of a plan start (visits are placed within opening hours)
+PLAN_DAY_START_HOUR = 9
+
+# Spatial index of attractions (atrakcje.services.spatial): grid cell size, rebuild
+# interval in seconds (also rebuilt on every catalog change) and default search radius
+SPATIAL_INDEX_CELL_KM = 1.0
+SPATIAL_INDEX_MAX_AGE = 300.0
+NEARBY_RADIUS_KM = 1.0
+
+# Concurrent per-etap map/route computation in plan views (plany.services.parallel), seconds
+PLAN_MAPS_MAX_WORKERS = 8
+PLAN_MAPS_DEADLINE = 15.0
+PLAN_MAPS_ETAP_TIMEOUT = 10.0
+
+# Shared Google Maps client (plany.services.gmaps_client): timeouts in seconds,
+# keep-alive pool size per worker and the cross-process query limit
+GOOGLE_MAPS_CONNECT_TIMEOUT = 3.05
+GOOGLE_MAPS_READ_TIMEOUT = 10.0
+GOOGLE_MAPS_RETRY_TIMEOUT = 15
+GOOGLE_MAPS_POOL_SIZE = 20
+GOOGLE_MAPS_QPS = 50
+GOOGLE_MAPS_RATE_LIMIT_BURST = 50
+GOOGLE_MAPS_RATE_LIMIT_MAX_WAIT = 10.0
+GOOGLE_MAPS_RATE_LIMIT_DB = 'limity'
+# Offline runs: point the client at a local stand-in (manage.py gmaps_standin) and/or
+# record responses to files ('record') and serve them back without network ('replay')
+GOOGLE_MAPS_BASE_URL = os.environ.get('GOOGLE_MAPS_BASE_URL') or None
+GOOGLE_MAPS_TRANSPORT = os.environ.get('GOOGLE_MAPS_TRANSPORT') or None
+GOOGLE_MAPS_RECORDINGS_DIR = os.environ.get('GOOGLE_MAPS_RECORDINGS_DIR') or BASE_DIR / 'nagrania_gmaps'
+
 IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.jfif']
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
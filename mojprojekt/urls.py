@@ -7,7 +7,7 @@ from django.conf.urls.static import static
 import debug_toolbar
 
 # Regular views
-from atrakcje.views import strona_glowna, lista_atrakcji, szczegoly_atrakcji
+from atrakcje.views import strona_glowna, lista_atrakcji, szczegoly_atrakcji, atrakcje_w_poblizu
 
 urlpatterns = [
     # Admin panel
@@ -17,6 +17,7 @@ urlpatterns = [
     path('', strona_glowna, name='strona_glowna'),
     path('atrakcje/', lista_atrakcji, name='lista_atrakcji'),
     path('atrakcja/<int:id>/', szczegoly_atrakcji, name='szczegoly'),
+    path('atrakcje/w-poblizu/', atrakcje_w_poblizu, name='atrakcje_w_poblizu'),  # JSON
     
     # App-specific routes
     path('plany/', include('plany.urls')),
@@ -1,5 +1,10 @@
 from django.contrib import admin
-from .models import PlanZwiedzania, PlanUzytkownika, EtapPlanu, ElementEtapu
+from django.http import StreamingHttpResponse
+from django.utils.timezone import now
+from .models import (
+    PlanZwiedzania, PlanUzytkownika, EtapPlanu, ElementEtapu, WynikGeokodowania, WynikTrasy, ZadanieGeokodowania,
+    ZadanieBudowyPlanu, ZadanieEksportuPdf
+)
 
 @admin.register(PlanZwiedzania)
 class PlanZwiedzaniaAdmin(admin.ModelAdmin):
@@ -8,10 +13,25 @@ class PlanZwiedzaniaAdmin(admin.ModelAdmin):
 
     Displays basic metadata such as name, status, visibility, and timestamps.
     Allows filtering and searching by status, visibility, name, and description.
+    Selected plans can be downloaded as one ZIP of PDFs.
     """
     list_display = ('nazwa', 'status', 'is_public', 'data_utworzenia', 'data_modyfikacji')
     list_filter = ('status', 'is_public')
     search_fields = ('nazwa', 'opis')
+    actions = ['eksportuj_pdf_zip']
+
+    @admin.action(description="Eksportuj wybrane plany do PDF (ZIP)")
+    def eksportuj_pdf_zip(self, request, queryset):
+        # Imported here so loading the admin (e.g. in every manage.py command) does not load WeasyPrint.
+        from .services.gmaps_client import get_gmaps_client
+        from .services.pdf_export import PlanZipExporter
+
+        eksport = PlanZipExporter(
+            queryset.order_by('id').values_list('id', flat=True), get_gmaps_client(), request.build_absolute_uri('/')
+        )
+        response = StreamingHttpResponse(eksport, content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="plany.zip"'
+        return response
 
 
 @admin.register(PlanUzytkownika)
@@ -47,3 +67,102 @@ class ElementEtapuAdmin(admin.ModelAdmin):
     list_display = ('etap', 'atrakcja', 'kolejnosc', 'planowana_data', 'czas_wizyty', 'czas_dojazdu')
     list_filter = ('etap__plan',)
     search_fields = ('etap__nazwa', 'atrakcja__nazwa')
+
+
+@admin.register(WynikGeokodowania)
+class WynikGeokodowaniaAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the WynikGeokodowania model.
+
+    Shows cached geocoding results with their age and hit counters; deleting a row
+    forces the address to be geocoded again.
+    """
+    list_display = ('adres', 'szerokosc_geo', 'dlugosc_geo', 'data_pobrania', 'liczba_trafien')
+    search_fields = ('adres',)
+    readonly_fields = ('klucz', 'data_pobrania', 'liczba_trafien')
+
+
+@admin.register(WynikTrasy)
+class WynikTrasyAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the WynikTrasy model.
+
+    Lists cached Directions results; deleting a row forces the route to be fetched again.
+    """
+    list_display = ('klucz', 'etap', 'tryb', 'optymalizacja', 'czas_laczny', 'data_utworzenia', 'data_uzycia')
+    list_filter = ('tryb', 'optymalizacja')
+    readonly_fields = ('klucz', 'data_utworzenia')
+
+
+@admin.register(ZadanieGeokodowania)
+class ZadanieGeokodowaniaAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the ZadanieGeokodowania model.
+
+    Shows the geocoding queue with attempts and errors; failed jobs can be queued again.
+    """
+    list_display = ('adres', 'status', 'liczba_prob', 'nastepna_proba', 'data_aktualizacji')
+    list_filter = ('status',)
+    search_fields = ('adres', 'blad')
+    readonly_fields = ('lokalizacja', 'liczba_prob', 'zablokowane_do', 'blad', 'data_utworzenia', 'data_aktualizacji')
+    actions = ['ponow']
+
+    @admin.action(description="Ponów wybrane zadania")
+    def ponow(self, request, queryset):
+        liczba = queryset.exclude(status=ZadanieGeokodowania.Status.W_TOKU).update(
+            status=ZadanieGeokodowania.Status.OCZEKUJACE, liczba_prob=0, nastepna_proba=now(), blad=''
+        )
+        self.message_user(request, f"Ponowiono {liczba} zadań geokodowania.")
+
+
+@admin.register(ZadanieBudowyPlanu)
+class ZadanieBudowyPlanuAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the ZadanieBudowyPlanu model.
+
+    Shows plans being built in the background with their progress and errors;
+    failed jobs can be queued again and pending ones cancelled.
+    """
+    list_display = ('nazwa', 'uzytkownik', 'status', 'postep', 'liczba_prob', 'plan', 'data_aktualizacji')
+    list_filter = ('status',)
+    search_fields = ('nazwa', 'uzytkownik__username', 'blad')
+    readonly_fields = ('uzytkownik', 'plan', 'postep', 'opis_postepu', 'liczba_prob', 'zablokowane_do', 'blad',
+                       'data_utworzenia', 'data_aktualizacji')
+    actions = ['ponow', 'anuluj']
+
+    @admin.action(description="Ponów wybrane zadania")
+    def ponow(self, request, queryset):
+        liczba = queryset.filter(status=ZadanieBudowyPlanu.Status.BLAD).update(
+            status=ZadanieBudowyPlanu.Status.OCZEKUJACE, liczba_prob=0, nastepna_proba=now(), blad='', postep=0
+        )
+        self.message_user(request, f"Ponowiono {liczba} zadań budowy planu.")
+
+    @admin.action(description="Anuluj wybrane zadania")
+    def anuluj(self, request, queryset):
+        liczba = queryset.filter(
+            status__in=[ZadanieBudowyPlanu.Status.OCZEKUJACE, ZadanieBudowyPlanu.Status.W_TOKU]
+        ).update(status=ZadanieBudowyPlanu.Status.ANULOWANE, zablokowane_do=None, opis_postepu="Anulowano")
+        self.message_user(request, f"Anulowano {liczba} zadań budowy planu.")
+
+
+@admin.register(ZadanieEksportuPdf)
+class ZadanieEksportuPdfAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the ZadanieEksportuPdf model.
+
+    Shows PDF exports rendered in the background with their errors (including renders
+    stopped by the memory or time limit); failed jobs can be queued again.
+    """
+    list_display = ('plan', 'uzytkownik', 'status', 'liczba_prob', 'data_aktualizacji')
+    list_filter = ('status',)
+    search_fields = ('plan__nazwa', 'uzytkownik__username', 'blad')
+    readonly_fields = ('plan', 'uzytkownik', 'base_url', 'klucz', 'liczba_prob', 'zablokowane_do', 'blad',
+                       'data_utworzenia', 'data_aktualizacji')
+    actions = ['ponow']
+
+    @admin.action(description="Ponów wybrane zadania")
+    def ponow(self, request, queryset):
+        liczba = queryset.filter(status=ZadanieEksportuPdf.Status.BLAD).update(
+            status=ZadanieEksportuPdf.Status.OCZEKUJACE, liczba_prob=0, nastepna_proba=now(), blad=''
+        )
+        self.message_user(request, f"Ponowiono {liczba} zadań eksportu PDF.")
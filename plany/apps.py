@@ -5,7 +5,11 @@ class PlanyConfig(AppConfig):
     Configuration class for the 'plany' application.
 
     This class defines the default primary key field type and
-    the name of the application module.
+    the name of the application module, and registers the app's signal handlers.
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'plany'
+
+    def ready(self):
+        # Register signal handlers (route cache invalidation)
+        from . import signals  # noqa: F401
@@ -0,0 +1,145 @@
+# Uzupełnia brakujące współrzędne lokalizacji: równolegle, partiami, z możliwością wznowienia
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from atrakcje.models import Lokalizacja
+from atrakcje.services.spatial import bump_catalog_version
+from atrakcje.utils.geohash import geohash_encode
+from plany.models import ZadanieGeokodowania
+from plany.services.geocoding import geocode_cache_stats, geocode_many, normalize_address
+from plany.services.gmaps_client import get_gmaps_client
+
+
+class Command(BaseCommand):
+    help = 'Geokoduje wszystkie lokalizacje bez współrzędnych (partiami, z punktem kontrolnym)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partia', type=int, default=500, help='Lokalizacje w jednej partii (bulk_update)')
+        parser.add_argument('--watki', type=int, default=8, help='Równoległe zapytania do API')
+        parser.add_argument('--limit', type=int, help='Zakończ po tylu lokalizacjach')
+        parser.add_argument('--checkpoint', default=str(Path(settings.BASE_DIR) / 'logs' / 'geokodowanie_checkpoint.json'),
+                            help='Plik punktu kontrolnego')
+        parser.add_argument('--od-nowa', action='store_true', help='Zignoruj punkt kontrolny')
+
+    def _wczytaj(self, path, od_nowa):
+        if od_nowa or not path.exists():
+            return {'ostatnie_id': 0, 'przetworzone': 0, 'uzupelnione': 0, 'brak_wynikow': 0, 'do_ponowienia': []}
+        with open(path, encoding='utf-8') as f:
+            stan = json.load(f)
+        stan.setdefault('do_ponowienia', [])
+        stan.pop('bledy', None)
+        return stan
+
+    def _zapisz(self, path, stan):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(stan, f)
+        os.replace(tmp, path)
+
+    def _przetworz(self, partia, gmaps, watki):
+        # Geocodes one batch and stores the found coordinates; returns (filled, no result, errored ids).
+        wyniki = geocode_many([lok.pelny_adres() for lok in partia], gmaps, workers=watki)
+        brak_wynikow = 0
+        bledne = []
+        do_zapisu = []
+        for lok in partia:
+            coords, blad = wyniki.get(normalize_address(lok.pelny_adres()), ((None, None), None))
+            if blad is not None:
+                bledne.append(lok.id)
+            elif coords[0] is None:
+                brak_wynikow += 1
+            else:
+                lok.szerokosc_geo, lok.dlugosc_geo = coords
+                lok.geohash = geohash_encode(*coords)
+                do_zapisu.append(lok)
+
+        with transaction.atomic():
+            Lokalizacja.objects.bulk_update(do_zapisu, ['szerokosc_geo', 'dlugosc_geo', 'geohash'])
+            # Queued jobs for these rows have nothing left to do.
+            ZadanieGeokodowania.objects.filter(
+                lokalizacja__in=do_zapisu, status=ZadanieGeokodowania.Status.OCZEKUJACE
+            ).update(status=ZadanieGeokodowania.Status.ZAKONCZONE)
+        return len(do_zapisu), brak_wynikow, bledne
+
+    def handle(self, *args, **options):
+        path = Path(options['checkpoint'])
+        stan = self._wczytaj(path, options['od_nowa'])
+        if stan['ostatnie_id']:
+            self.stdout.write(f"Wznawiam od ID {stan['ostatnie_id']} ({stan['przetworzone']} już przetworzonych)")
+
+        gmaps = get_gmaps_client()
+        brakujace = Lokalizacja.objects.filter(szerokosc_geo__isnull=True).order_by('id')
+        pozostalo = brakujace.filter(id__gt=stan['ostatnie_id']).count()
+        self.stdout.write(f"Lokalizacje do geokodowania: {pozostalo}")
+
+        start = time.monotonic()
+        w_tym_przebiegu = 0
+        uzupelnione_przed = stan['uzupelnione']
+        zapytania_przed = geocode_cache_stats().get('miss', 0)
+        try:
+            while options['limit'] is None or w_tym_przebiegu < options['limit']:
+                rozmiar = options['partia']
+                if options['limit'] is not None:
+                    rozmiar = min(rozmiar, options['limit'] - w_tym_przebiegu)
+                partia = list(brakujace.filter(id__gt=stan['ostatnie_id'])[:rozmiar])
+                if not partia:
+                    self._ponow(path, stan, gmaps, options)
+                    break
+
+                uzupelnione, brak_wynikow, bledne = self._przetworz(partia, gmaps, options['watki'])
+                # The checkpoint moves past every row; rows with API errors are retried at the end.
+                stan['ostatnie_id'] = partia[-1].id
+                stan['przetworzone'] += len(partia)
+                stan['uzupelnione'] += uzupelnione
+                stan['brak_wynikow'] += brak_wynikow
+                stan['do_ponowienia'] += bledne
+                self._zapisz(path, stan)
+
+                w_tym_przebiegu += len(partia)
+                czas = time.monotonic() - start
+                self.stdout.write(
+                    f"{w_tym_przebiegu}/{pozostalo}: uzupełniono {uzupelnione}, brak wyników {brak_wynikow}, "
+                    f"błędy {len(bledne)} | {w_tym_przebiegu / czas:.1f} lok./s, "
+                    f"{geocode_cache_stats().get('miss', 0) - zapytania_przed} zapytań do API"
+                )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(f"Przerwano - wznowienie od ID {stan['ostatnie_id']}"))
+        finally:
+            if stan['uzupelnione'] > uzupelnione_przed:
+                bump_catalog_version()
+
+        czas = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Zakończono: {w_tym_przebiegu} lokalizacji w {czas:.1f} s "
+            f"({w_tym_przebiegu / czas if czas else 0:.1f} lok./s); łącznie uzupełniono {stan['uzupelnione']}, "
+            f"brak wyników {stan['brak_wynikow']}, błędy (do ponowienia) {len(stan['do_ponowienia'])}"
+        ))
+        if (options['limit'] is None and not stan['do_ponowienia']
+                and not brakujace.filter(id__gt=stan['ostatnie_id']).exists()):
+            path.unlink(missing_ok=True)
+
+    def _ponow(self, path, stan, gmaps, options):
+        # One more attempt for rows that failed with API errors; the ones failing again stay in the checkpoint.
+        pozostale = list(stan['do_ponowienia'])
+        if not pozostale:
+            return
+        self.stdout.write(f"Ponawiam {len(pozostale)} lokalizacji z błędami API")
+        nadal_bledne = []
+        while pozostale:
+            ids, pozostale = pozostale[:options['partia']], pozostale[options['partia']:]
+            partia = list(Lokalizacja.objects.filter(id__in=ids, szerokosc_geo__isnull=True).order_by('id'))
+            uzupelnione, brak_wynikow, bledne = self._przetworz(partia, gmaps, options['watki'])
+            nadal_bledne += bledne
+            stan['uzupelnione'] += uzupelnione
+            stan['brak_wynikow'] += brak_wynikow
+            stan['do_ponowienia'] = nadal_bledne + pozostale
+            self._zapisz(path, stan)
+            self.stdout.write(f"Ponowiono {len(ids)}: uzupełniono {uzupelnione}, nadal błędy {len(bledne)}")
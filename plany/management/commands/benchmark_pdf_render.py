@@ -0,0 +1,76 @@
+# Mierzy czas renderowania PDF planu: zimny renderer (jak dotąd) i rozgrzany PdfRenderer
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from weasyprint import HTML
+
+from plany.models import PlanZwiedzania
+from plany.services.pdf_generator import (
+    PDF_STYLESHEET, get_renderer, render_pdf_isolated, render_plan_html
+)
+from plany.services.pdf_jobs import load_plan_for_pdf
+from plany.services.snapshots import valid_snapshot
+from plany.services.static_maps import static_map_file_uri
+
+
+class Command(BaseCommand):
+    help = 'Benchmark renderowania PDF planu: czas na jeden plik przed i po rozgrzaniu renderera'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plan', type=int, help='ID planu (domyślnie pierwszy w bazie)')
+        parser.add_argument('--powtorzenia', type=int, default=20, help='Liczba renderowań w każdym wariancie')
+        parser.add_argument('--izolowany', action='store_true',
+                            help='Zmierz też renderowanie w osobnym procesie (jak pdf_worker)')
+
+    def handle(self, *args, **options):
+        plan_id = options['plan'] or PlanZwiedzania.objects.order_by('id').values_list('id', flat=True).first()
+        if plan_id is None:
+            raise CommandError("Brak planu do wyrenderowania")
+        plan = load_plan_for_pdf(plan_id)
+        # Only maps of stored, up-to-date routes - the benchmark makes no API calls.
+        mapy_etapow = {}
+        for etap in plan.etapy.all():
+            trasa = valid_snapshot(etap)
+            if trasa is not None and trasa.klucz_mapy:
+                mapy_etapow[etap.id] = static_map_file_uri(trasa.klucz_mapy)
+        base_url = PDF_STYLESHEET.parent.as_uri() + '/'
+        css = PDF_STYLESHEET.read_text(encoding='utf-8')
+        self.stdout.write(f"Plan {plan.id} ({plan.etapy.count()} etapów, {len(mapy_etapow)} map), "
+                          f"{options['powtorzenia']} powtórzeń")
+
+        def zimny():
+            # As before: styles inline in the template, fonts and CSS resolved from scratch on every call.
+            html_string = render_plan_html(plan, mapy_etapow).replace('</head>', f'<style>{css}</style></head>', 1)
+            HTML(string=html_string, base_url=base_url).write_pdf()
+
+        def cieply():
+            get_renderer().write_pdf(render_plan_html(plan, mapy_etapow), base_url)
+
+        start = time.perf_counter()
+        get_renderer()
+        self.stdout.write(f"Rozgrzanie renderera: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        with tempfile.TemporaryDirectory() as katalog:
+            warianty = [('zimny (dotychczas)', zimny), ('rozgrzany PdfRenderer', cieply)]
+            if options['izolowany']:
+                def izolowany():
+                    render_pdf_isolated(render_plan_html(plan, mapy_etapow), base_url, Path(katalog) / 'plan.pdf')
+
+                izolowany()  # starts the fork server
+                warianty.append(('osobny proces (fork server)', izolowany))
+
+            for nazwa, funkcja in warianty:
+                czasy = []
+                for _ in range(options['powtorzenia']):
+                    start = time.perf_counter()
+                    funkcja()
+                    czasy.append((time.perf_counter() - start) * 1000)
+                czasy.sort()
+                self.stdout.write(
+                    f"{nazwa:>30}: p50 {statistics.median(czasy):7.1f} ms, "
+                    f"p95 {czasy[max(0, int(len(czasy) * 0.95) - 1)]:7.1f} ms, "
+                    f"średnio {statistics.mean(czasy):7.1f} ms"
+                )
@@ -0,0 +1,68 @@
+# Mierzy liczbę zapytań i czas budowy planu przez PlanBuilder (zmiany są wycofywane)
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from atrakcje.models import Atrakcja
+from konta.models import User
+from plany.services.plan_builder import PlanBuilder
+from plany.services.routing import get_routing_backend
+
+
+class Command(BaseCommand):
+    help = 'Benchmark zapisu planu: liczba zapytań SQL i czas budowy dla różnych rozmiarów koszyka'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rozmiary', type=int, nargs='+', default=[5, 20, 40],
+                            help='Liczby atrakcji w koszyku')
+        parser.add_argument('--dni', type=int, default=2, help='Liczba dni planu')
+        parser.add_argument('--powtorzenia', type=int, default=5, help='Powtórzenia dla każdego rozmiaru')
+        parser.add_argument('--uzytkownik', help='Nazwa użytkownika (domyślnie pierwszy w bazie)')
+        parser.add_argument('--adres', help='Adres startowy pierwszego dnia (wymaga geokodowania)')
+        parser.add_argument('--backend', choices=['auto', 'google', 'local'], default='local',
+                            help='Backend czasów dojazdu (domyślnie local - bez zapytań do API)')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        user = users.filter(username=options['uzytkownik']).first() if options['uzytkownik'] else users.first()
+        if user is None:
+            raise CommandError("Brak użytkownika do przypisania planu")
+
+        ids = list(
+            Atrakcja.objects.filter(lokalizacja__szerokosc_geo__isnull=False)
+            .order_by('id').values_list('id', flat=True)[:max(options['rozmiary'])]
+        )
+        backend = get_routing_backend(wybor=options['backend'])
+        gmaps = None
+        if options['adres']:
+            from plany.services.gmaps_client import get_gmaps_client
+            gmaps = get_gmaps_client()
+
+        for rozmiar in options['rozmiary']:
+            koszyk = ids[:rozmiar]
+            if len(koszyk) < rozmiar:
+                self.stdout.write(self.style.WARNING(f"Za mało atrakcji z lokalizacją: {len(koszyk)} < {rozmiar}"))
+            dni = max(1, min(options['dni'], len(koszyk)))
+            przypisane = {d + 1: koszyk[d::dni] for d in range(dni)}
+
+            czasy = []
+            zapytania = []
+            for _ in range(options['powtorzenia']):
+                with transaction.atomic():
+                    with CaptureQueriesContext(connection) as ctx:
+                        start = time.perf_counter()
+                        PlanBuilder(
+                            user=user, koszyk_ids=koszyk, nazwa="Benchmark", adres_startowy=options['adres'],
+                            przypisane_atrakcje=przypisane, gmaps=gmaps, backend=backend
+                        ).build()
+                        czasy.append((time.perf_counter() - start) * 1000)
+                    zapytania.append(len(ctx.captured_queries))
+                    transaction.set_rollback(True)
+
+            self.stdout.write(
+                f"{len(koszyk):>4} atrakcji, {dni} dni: {max(zapytania)} zapytań, "
+                f"mediana {statistics.median(czasy):.1f} ms, max {max(czasy):.1f} ms"
+            )
@@ -0,0 +1,47 @@
+# Eksportuje wiele planów do jednego pliku ZIP z plikami PDF (renderowanie równoległe)
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from plany.models import PlanUzytkownika, PlanZwiedzania
+from plany.services.gmaps_client import get_gmaps_client
+from plany.services.pdf_export import PlanZipExporter
+
+
+class Command(BaseCommand):
+    help = 'Eksport wielu planów do archiwum ZIP z plikami PDF (równoległe renderowanie w osobnych procesach)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plany', type=int, nargs='*', help='ID planów')
+        parser.add_argument('--wszystkie', action='store_true', help='Eksportuj wszystkie plany')
+        parser.add_argument('--uzytkownik', help='Eksportuj plany tego użytkownika (nazwa użytkownika)')
+        parser.add_argument('--plik', required=True, help='Ścieżka docelowego pliku ZIP')
+        parser.add_argument('--procesy', type=int, help='Liczba równoczesnych renderowań (domyślnie liczba CPU)')
+        parser.add_argument('--base-url', default='http://localhost/',
+                            help='Adres bazowy do rozwiązywania ścieżek w HTML')
+
+    def handle(self, *args, **options):
+        plan_ids = list(options['plany'])
+        if options['wszystkie']:
+            plan_ids += PlanZwiedzania.objects.order_by('id').values_list('id', flat=True)
+        if options['uzytkownik']:
+            plan_ids += PlanUzytkownika.objects.filter(
+                uzytkownik__username=options['uzytkownik']
+            ).order_by('plan_id').values_list('plan_id', flat=True)
+        plan_ids = list(dict.fromkeys(plan_ids))
+        if not plan_ids:
+            raise CommandError("Podaj ID planów, --wszystkie lub --uzytkownik")
+
+        eksport = PlanZipExporter(plan_ids, get_gmaps_client(), options['base_url'], procesy=options['procesy'])
+        start = time.perf_counter()
+        with open(options['plik'], 'wb') as plik:
+            for fragment in eksport:
+                plik.write(fragment)
+        czas = time.perf_counter() - start
+
+        for plan_id, blad in eksport.bledy.items():
+            self.stdout.write(self.style.WARNING(f"Plan {plan_id}: {blad}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Zapisano {options['plik']}: {eksport.gotowe} planów ({eksport.z_pamieci} z pamięci podręcznej, "
+            f"{len(eksport.bledy)} błędów) w {czas:.1f} s, {eksport.procesy} procesów"
+        ))
@@ -0,0 +1,37 @@
+# Pracownik kolejki geokodowania: uzupełnia współrzędne lokalizacji zapisanych bez nich
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from plany.services.geocoding_queue import DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, claim_jobs, process_jobs
+from plany.services.gmaps_client import get_gmaps_client
+
+
+class Command(BaseCommand):
+    help = 'Przetwarza kolejkę zadań geokodowania (ZadanieGeokodowania)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--raz', action='store_true', help='Przetwórz dostępne zadania i zakończ')
+        parser.add_argument('--partia', type=int, default=DEFAULT_BATCH_SIZE, help='Liczba zadań pobieranych naraz')
+        parser.add_argument('--watki', type=int, default=DEFAULT_WORKERS, help='Równoległe zapytania do API')
+        parser.add_argument('--przerwa', type=float, default=5.0, help='Sekundy oczekiwania na nowe zadania')
+
+    def handle(self, *args, **options):
+        gmaps = get_gmaps_client()
+        razem = Counter()
+        self.stdout.write("Pracownik geokodowania uruchomiony")
+        try:
+            while True:
+                zadania = claim_jobs(limit=options['partia'])
+                if not zadania:
+                    if options['raz']:
+                        break
+                    connections.close_all()
+                    time.sleep(options['przerwa'])
+                    continue
+                razem.update(process_jobs(zadania, gmaps, workers=options['watki']))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Zakończono: {dict(razem)}"))
@@ -0,0 +1,37 @@
+# Lokalny zastępnik Google Maps API do testów i pomiarów bez dostępu do sieci
+from django.core.management.base import BaseCommand
+
+from plany.services.gmaps_standin import GmapsStandinServer
+
+
+class Command(BaseCommand):
+    help = 'Uruchamia lokalny zastępnik Google Maps API (geocode, directions, distancematrix, staticmap)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.0, help='Opóźnienie każdej odpowiedzi w sekundach')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Losowe odchylenie opóźnienia (±s)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Odsetek odpowiedzi z błędem (0-1)')
+        parser.add_argument('--error-status', type=int, default=500, help='Kod HTTP wstrzykiwanych błędów')
+        parser.add_argument('--seed', type=int, default=0, help='Ziarno losowania opóźnień i błędów')
+
+    def handle(self, *args, **options):
+        server = GmapsStandinServer(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Zastępnik Google Maps działa na {server.base_url} - ustaw GOOGLE_MAPS_BASE_URL={server.base_url}"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Zapytania: {dict(server.stats)}")
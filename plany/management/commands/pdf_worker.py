@@ -0,0 +1,37 @@
+# Pracownik kolejki eksportu PDF: renderuje pliki PDF planów w tle, w osobnych procesach z limitami
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from plany.services.gmaps_client import get_gmaps_client
+from plany.services.pdf_jobs import DEFAULT_BATCH_SIZE, claim_pdf_jobs, run_pdf_job
+
+
+class Command(BaseCommand):
+    help = 'Przetwarza kolejkę zadań eksportu PDF (ZadanieEksportuPdf)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--raz', action='store_true', help='Przetwórz dostępne zadania i zakończ')
+        parser.add_argument('--partia', type=int, default=DEFAULT_BATCH_SIZE, help='Liczba zadań pobieranych naraz')
+        parser.add_argument('--przerwa', type=float, default=1.0, help='Sekundy oczekiwania na nowe zadania')
+
+    def handle(self, *args, **options):
+        gmaps = get_gmaps_client()
+        razem = Counter()
+        self.stdout.write("Pracownik eksportu PDF uruchomiony")
+        try:
+            while True:
+                zadania = claim_pdf_jobs(limit=options['partia'])
+                if not zadania:
+                    if options['raz']:
+                        break
+                    connections.close_all()
+                    time.sleep(options['przerwa'])
+                    continue
+                for zadanie in zadania:
+                    razem[run_pdf_job(zadanie, gmaps)] += 1
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Zakończono: {dict(razem)}"))
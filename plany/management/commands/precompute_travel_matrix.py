@@ -0,0 +1,66 @@
+# Przelicza macierze czasów dojazdu między atrakcjami (w obrębie miasta) dla wybranych trybów
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from atrakcje.models import Lokalizacja
+from plany.services.routing import get_routing_backend
+from plany.services.travel_matrix import DEFAULT_MODES, city_slug, matrix_dir, update_city_matrix
+
+
+class Command(BaseCommand):
+    help = 'Przelicza macierze czasów dojazdu między atrakcjami w każdym mieście (przyrostowo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--miasto', action='append', help='Tylko wybrane miasto (można powtórzyć)')
+        parser.add_argument('--tryb', action='append', choices=['driving', 'walking', 'bicycling', 'transit'],
+                            help=f"Tryb podróży (domyślnie: {', '.join(DEFAULT_MODES)})")
+        parser.add_argument('--backend', choices=['google', 'local'],
+                            help="Backend wyznaczania czasów (domyślnie google, local przy ROUTING_BACKEND='local')")
+        parser.add_argument('--pelne', action='store_true', help='Przelicz wszystko od nowa zamiast przyrostowo')
+
+    def handle(self, *args, **options):
+        tryby = tuple(options['tryb'] or DEFAULT_MODES)
+        wybrane = {city_slug(m) for m in options['miasto'] or []}
+
+        miasta = defaultdict(list)
+        nazwy = {}
+        lokalizacje = (
+            Lokalizacja.objects
+            .filter(szerokosc_geo__isnull=False, dlugosc_geo__isnull=False)
+            .values_list('id', 'miasto', 'szerokosc_geo', 'dlugosc_geo')
+        )
+        for lok_id, miasto, lat, lng in lokalizacje.iterator():
+            slug = city_slug(miasto)
+            if wybrane and slug not in wybrane:
+                continue
+            nazwy.setdefault(slug, miasto)
+            miasta[slug].append((lok_id, lat, lng))
+
+        # Google directly, without the 'auto' timeout and fallback: a local estimate must not be
+        # stored as a precomputed time. Legs Google has no time for stay unknown (NaN).
+        wybor = options['backend'] or ('local' if getattr(settings, 'ROUTING_BACKEND', 'auto') == 'local' else 'google')
+        backend = get_routing_backend(use_matrix=False, wybor=wybor)
+
+        for slug, punkty in sorted(miasta.items()):
+            start = time.monotonic()
+            wynik = update_city_matrix(nazwy[slug], punkty, backend, modes=tryby, full=options['pelne'])
+            self.stdout.write(
+                f"{nazwy[slug]}: {wynik['lokalizacje']} lokalizacji, {wynik['bez_zmian']} bez zmian, "
+                f"policzono {wynik['policzone']} odcinków w {time.monotonic() - start:.1f} s"
+            )
+
+        if not wybrane:
+            # Cities without any geocoded lokalizacja left.
+            katalog = matrix_dir()
+            for index in katalog.glob('*.json') if katalog.is_dir() else []:
+                slug = index.stem
+                if slug not in miasta:
+                    index.unlink()
+                    for path in katalog.glob(f"{slug}.*.npy"):
+                        path.unlink(missing_ok=True)
+                    self.stdout.write(f"Usunięto macierz miasta {slug}")
+
+        self.stdout.write(self.style.SUCCESS(f"Zaktualizowano macierze dojazdu: {len(miasta)} miast"))
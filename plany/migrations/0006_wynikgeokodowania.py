@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plany', '0005_etapplanu_adres_startowy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WynikGeokodowania',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('klucz', models.CharField(help_text='SHA-256 znormalizowanego adresu', max_length=64, unique=True)),
+                ('adres', models.CharField(max_length=255)),
+                ('szerokosc_geo', models.FloatField(blank=True, null=True)),
+                ('dlugosc_geo', models.FloatField(blank=True, null=True)),
+                ('data_pobrania', models.DateTimeField()),
+                ('liczba_trafien', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Wynik geokodowania',
+                'verbose_name_plural': 'Wyniki geokodowania',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plany', '0006_wynikgeokodowania'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WynikTrasy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('klucz', models.CharField(help_text='SHA-256 punktów, trybu i optymalizacji', max_length=64, unique=True)),
+                ('tryb', models.CharField(default='driving', max_length=20)),
+                ('optymalizacja', models.BooleanField(default=False)),
+                ('odcinki', models.JSONField(default=list, help_text="Lista {'czas': s, 'dystans': m} dla kolejnych odcinków")),
+                ('kolejnosc_punktow', models.JSONField(default=list, help_text='waypoint_order zwrócone przez API')),
+                ('polyline', models.TextField(blank=True)),
+                ('czas_laczny', models.PositiveIntegerField(default=0, help_text='Czas w sekundach')),
+                ('data_utworzenia', models.DateTimeField(auto_now_add=True)),
+                ('data_uzycia', models.DateTimeField(db_index=True)),
+                ('etap', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='trasy', to='plany.etapplanu')),
+            ],
+            options={
+                'verbose_name': 'Wynik trasy',
+                'verbose_name_plural': 'Wyniki tras',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plany', '0007_wyniktrasy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LimitZapytan',
+            fields=[
+                ('nazwa', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('tokeny', models.FloatField()),
+                ('aktualizacja', models.FloatField(help_text='Znacznik czasu ostatniego uzupełnienia (time.time())')),
+            ],
+            options={
+                'verbose_name': 'Limit zapytań',
+                'verbose_name_plural': 'Limity zapytań',
+            },
+        ),
+    ]
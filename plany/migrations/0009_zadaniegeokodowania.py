@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atrakcje', '0010_lokalizacja_geohash'),
+        ('plany', '0008_limitzapytan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZadanieGeokodowania',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('O', 'Oczekujące'), ('W', 'W toku'), ('Z', 'Zakończone'), ('B', 'Błąd')], default='O', max_length=1)),
+                ('liczba_prob', models.PositiveIntegerField(default=0)),
+                ('nastepna_proba', models.DateTimeField(db_index=True, help_text='Najwcześniejszy czas (ponownego) wykonania')),
+                ('zablokowane_do', models.DateTimeField(blank=True, help_text='Koniec dzierżawy pracownika', null=True)),
+                ('blad', models.TextField(blank=True)),
+                ('data_utworzenia', models.DateTimeField(auto_now_add=True)),
+                ('data_aktualizacji', models.DateTimeField(auto_now=True)),
+                ('adres', models.CharField(max_length=255)),
+                ('lokalizacja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='zadania_geokodowania', to='atrakcje.lokalizacja')),
+            ],
+            options={
+                'verbose_name': 'Zadanie geokodowania',
+                'verbose_name_plural': 'Zadania geokodowania',
+                'indexes': [models.Index(fields=['status', 'nastepna_proba'], name='plany_zadan_status_6a8cb0_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plany', '0009_zadaniegeokodowania'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrasaEtapu',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('skrot', models.CharField(help_text='SHA-256 danych wejściowych trasy', max_length=64)),
+                ('punkty', models.JSONField(default=list, help_text="Lista {'label', 'lat', 'lng'} w kolejności trasy")),
+                ('czasy_odcinkow', models.JSONField(default=list, help_text='Czasy kolejnych odcinków w sekundach')),
+                ('czas_laczny', models.PositiveIntegerField(default=0, help_text='Czas w sekundach')),
+                ('polyline', models.TextField(blank=True)),
+                ('klucz_mapy', models.CharField(blank=True, help_text='Klucz mapy statycznej', max_length=64)),
+                ('nieaktualna', models.BooleanField(default=False)),
+                ('data_obliczenia', models.DateTimeField(auto_now=True)),
+                ('etap', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trasa_etapu', to='plany.etapplanu')),
+            ],
+            options={
+                'verbose_name': 'Trasa etapu',
+                'verbose_name_plural': 'Trasy etapów',
+            },
+        ),
+    ]
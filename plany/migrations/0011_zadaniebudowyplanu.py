@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plany', '0010_trasaetapu'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='zadaniegeokodowania',
+            name='status',
+            field=models.CharField(choices=[('O', 'Oczekujące'), ('W', 'W toku'), ('Z', 'Zakończone'), ('B', 'Błąd'), ('A', 'Anulowane')], default='O', max_length=1),
+        ),
+        migrations.CreateModel(
+            name='ZadanieBudowyPlanu',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('O', 'Oczekujące'), ('W', 'W toku'), ('Z', 'Zakończone'), ('B', 'Błąd'), ('A', 'Anulowane')], default='O', max_length=1)),
+                ('liczba_prob', models.PositiveIntegerField(default=0)),
+                ('nastepna_proba', models.DateTimeField(db_index=True, help_text='Najwcześniejszy czas (ponownego) wykonania')),
+                ('zablokowane_do', models.DateTimeField(blank=True, help_text='Koniec dzierżawy pracownika', null=True)),
+                ('blad', models.TextField(blank=True)),
+                ('data_utworzenia', models.DateTimeField(auto_now_add=True)),
+                ('data_aktualizacji', models.DateTimeField(auto_now=True)),
+                ('nazwa', models.CharField(max_length=100)),
+                ('adres_startowy', models.CharField(blank=True, max_length=255, null=True)),
+                ('koszyk', models.JSONField(default=list, help_text='ID atrakcji z koszyka')),
+                ('przypisane_atrakcje', models.JSONField(default=dict, help_text='Dzień -> lista ID atrakcji')),
+                ('starty', models.JSONField(default=dict, help_text='Dzień -> adres startowy')),
+                ('postep', models.PositiveSmallIntegerField(default=0, help_text='Procent wykonania')),
+                ('opis_postepu', models.CharField(blank=True, max_length=100)),
+                ('plan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='plany.planzwiedzania')),
+                ('uzytkownik', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='zadania_budowy_planu', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Zadanie budowy planu',
+                'verbose_name_plural': 'Zadania budowy planów',
+                'indexes': [models.Index(fields=['status', 'nastepna_proba'], name='plany_zadan_status_7d87c3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plany', '0011_zadaniebudowyplanu'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zadaniebudowyplanu',
+            name='liczba_dni',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Automatyczny podział na tyle dni', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plany', '0012_zadaniebudowyplanu_liczba_dni'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='elementetapu',
+            name='poza_godzinami',
+            field=models.BooleanField(default=False, help_text='Wizyta nie mieści się w godzinach otwarcia'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plany', '0013_elementetapu_poza_godzinami'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZadanieEksportuPdf',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('O', 'Oczekujące'), ('W', 'W toku'), ('Z', 'Zakończone'), ('B', 'Błąd'), ('A', 'Anulowane')], default='O', max_length=1)),
+                ('liczba_prob', models.PositiveIntegerField(default=0)),
+                ('nastepna_proba', models.DateTimeField(db_index=True, help_text='Najwcześniejszy czas (ponownego) wykonania')),
+                ('zablokowane_do', models.DateTimeField(blank=True, help_text='Koniec dzierżawy pracownika', null=True)),
+                ('blad', models.TextField(blank=True)),
+                ('data_utworzenia', models.DateTimeField(auto_now_add=True)),
+                ('data_aktualizacji', models.DateTimeField(auto_now=True)),
+                ('base_url', models.CharField(help_text='Adres bazowy do rozwiązywania ścieżek w HTML', max_length=500)),
+                ('klucz', models.CharField(blank=True, help_text='Klucz gotowego PDF w pamięci podręcznej', max_length=64)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='zadania_eksportu_pdf', to='plany.planzwiedzania')),
+                ('uzytkownik', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='zadania_eksportu_pdf', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Zadanie eksportu PDF',
+                'verbose_name_plural': 'Zadania eksportu PDF',
+                'indexes': [models.Index(fields=['status', 'nastepna_proba'], name='plany_zadan_status_66247b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plany', '0014_zadanieeksportupdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trasaetapu',
+            name='zrodlo',
+            field=models.CharField(blank=True, help_text='Backend, który obliczył trasę', max_length=20),
+        ),
+    ]
@@ -67,6 +67,11 @@ class EtapPlanu(models.Model):
         ordering = ['kolejnosc']
         unique_together = ('plan', 'kolejnosc')
 
+    @property
+    def poza_godzinami(self):
+        """True if any visit of this etap does not fit into the attraction's opening hours."""
+        return any(el.poza_godzinami for el in self.elementy.all())
+
     def __str__(self):
         result = f"{self.plan.nazwa} - {self.nazwa}"
         logger.debug(f"__str__ EtapPlanu: {result}")
@@ -83,6 +88,7 @@ class ElementEtapu(models.Model):
     planowana_data = models.DateTimeField()
     czas_wizyty = models.PositiveIntegerField(help_text="Czas w minutach")
     czas_dojazdu = models.PositiveIntegerField(help_text="Czas w minutach", null=True, blank=True)
+    poza_godzinami = models.BooleanField(default=False, help_text="Wizyta nie mieści się w godzinach otwarcia")
 
     class Meta:
         verbose_name = "Element etapu"
@@ -118,3 +124,192 @@ class PlanPodglad(models.Model):
         result = f"{self.plan_nazwa} / {self.etap_nazwa} / {self.atrakcja_nazwa}"
         logger.debug(f"__str__ PlanPodglad: {result}")
         return result
+
+
+class WynikGeokodowania(models.Model):
+    """
+    Cached geocoding result for a normalized address, shared by all workers.
+
+    A row with empty coordinates is a negative result (the API returned nothing).
+    """
+    klucz = models.CharField(max_length=64, unique=True, help_text="SHA-256 znormalizowanego adresu")
+    adres = models.CharField(max_length=255)
+    szerokosc_geo = models.FloatField(null=True, blank=True)
+    dlugosc_geo = models.FloatField(null=True, blank=True)
+    data_pobrania = models.DateTimeField()
+    liczba_trafien = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Wynik geokodowania"
+        verbose_name_plural = "Wyniki geokodowania"
+
+    def __str__(self):
+        result = self.adres
+        logger.debug(f"__str__ WynikGeokodowania: {result}")
+        return result
+
+
+class WynikTrasy(models.Model):
+    """
+    Cached Directions API result for an ordered list of coordinates, travel mode and
+    optimize flag. Only the parts the application uses are stored (per-leg durations
+    and distances, waypoint order and the overview polyline).
+    """
+    klucz = models.CharField(max_length=64, unique=True, help_text="SHA-256 punktów, trybu i optymalizacji")
+    etap = models.ForeignKey(EtapPlanu, on_delete=models.CASCADE, related_name='trasy', null=True, blank=True)
+    tryb = models.CharField(max_length=20, default='driving')
+    optymalizacja = models.BooleanField(default=False)
+    odcinki = models.JSONField(default=list, help_text="Lista {'czas': s, 'dystans': m} dla kolejnych odcinków")
+    kolejnosc_punktow = models.JSONField(default=list, help_text="waypoint_order zwrócone przez API")
+    polyline = models.TextField(blank=True)
+    czas_laczny = models.PositiveIntegerField(default=0, help_text="Czas w sekundach")
+    data_utworzenia = models.DateTimeField(auto_now_add=True)
+    data_uzycia = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Wynik trasy"
+        verbose_name_plural = "Wyniki tras"
+
+    def __str__(self):
+        result = f"{self.tryb} ({len(self.odcinki)} odcinków, {self.czas_laczny // 60} min)"
+        logger.debug(f"__str__ WynikTrasy: {result}")
+        return result
+
+
+class LimitZapytan(models.Model):
+    """
+    State of a token bucket shared by all worker processes (rate limiting of external APIs).
+    """
+    nazwa = models.CharField(max_length=50, primary_key=True)
+    tokeny = models.FloatField()
+    aktualizacja = models.FloatField(help_text="Znacznik czasu ostatniego uzupełnienia (time.time())")
+
+    class Meta:
+        verbose_name = "Limit zapytań"
+        verbose_name_plural = "Limity zapytań"
+
+    def __str__(self):
+        result = f"{self.nazwa}: {self.tokeny:.1f}"
+        logger.debug(f"__str__ LimitZapytan: {result}")
+        return result
+
+
+class Zadanie(models.Model):
+    """
+    Base of the DB-backed background job queues: status, retries with backoff and a
+    lease, so a job claimed by a worker that died is picked up again.
+    """
+    class Status(models.TextChoices):
+        OCZEKUJACE = 'O', 'Oczekujące'
+        W_TOKU = 'W', 'W toku'
+        ZAKONCZONE = 'Z', 'Zakończone'
+        BLAD = 'B', 'Błąd'
+        ANULOWANE = 'A', 'Anulowane'
+
+    status = models.CharField(max_length=1, choices=Status.choices, default=Status.OCZEKUJACE)
+    liczba_prob = models.PositiveIntegerField(default=0)
+    nastepna_proba = models.DateTimeField(db_index=True, help_text="Najwcześniejszy czas (ponownego) wykonania")
+    zablokowane_do = models.DateTimeField(null=True, blank=True, help_text="Koniec dzierżawy pracownika")
+    blad = models.TextField(blank=True)
+    data_utworzenia = models.DateTimeField(auto_now_add=True)
+    data_aktualizacji = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class ZadanieGeokodowania(Zadanie):
+    """
+    Pending geocoding of a Lokalizacja saved without coordinates
+    (processed by manage.py geocode_worker).
+    """
+    lokalizacja = models.ForeignKey('atrakcje.Lokalizacja', on_delete=models.CASCADE, related_name='zadania_geokodowania')
+    adres = models.CharField(max_length=255)
+
+    class Meta:
+        verbose_name = "Zadanie geokodowania"
+        verbose_name_plural = "Zadania geokodowania"
+        indexes = [models.Index(fields=['status', 'nastepna_proba'])]
+
+    def __str__(self):
+        result = f"{self.adres} ({self.get_status_display()})"
+        logger.debug(f"__str__ ZadanieGeokodowania: {result}")
+        return result
+
+
+class ZadanieBudowyPlanu(Zadanie):
+    """
+    Plan saved from the cart and built in the background by manage.py plan_worker;
+    the cart page polls its progress until the plan is ready.
+    """
+    uzytkownik = models.ForeignKey('konta.User', on_delete=models.CASCADE, related_name='zadania_budowy_planu')
+    nazwa = models.CharField(max_length=100)
+    adres_startowy = models.CharField(max_length=255, blank=True, null=True)
+    koszyk = models.JSONField(default=list, help_text="ID atrakcji z koszyka")
+    przypisane_atrakcje = models.JSONField(default=dict, help_text="Dzień -> lista ID atrakcji")
+    starty = models.JSONField(default=dict, help_text="Dzień -> adres startowy")
+    liczba_dni = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Automatyczny podział na tyle dni")
+    plan = models.ForeignKey(PlanZwiedzania, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    postep = models.PositiveSmallIntegerField(default=0, help_text="Procent wykonania")
+    opis_postepu = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        verbose_name = "Zadanie budowy planu"
+        verbose_name_plural = "Zadania budowy planów"
+        indexes = [models.Index(fields=['status', 'nastepna_proba'])]
+
+    def __str__(self):
+        result = f"{self.nazwa} ({self.get_status_display()})"
+        logger.debug(f"__str__ ZadanieBudowyPlanu: {result}")
+        return result
+
+
+class ZadanieEksportuPdf(Zadanie):
+    """
+    PDF export of a plan rendered in the background by manage.py pdf_worker; the export
+    page polls it until the file is stored in the PDF cache under `klucz`.
+    """
+    plan = models.ForeignKey(PlanZwiedzania, on_delete=models.CASCADE, related_name='zadania_eksportu_pdf')
+    uzytkownik = models.ForeignKey('konta.User', on_delete=models.CASCADE, related_name='zadania_eksportu_pdf')
+    base_url = models.CharField(max_length=500, help_text="Adres bazowy do rozwiązywania ścieżek w HTML")
+    klucz = models.CharField(max_length=64, blank=True, help_text="Klucz gotowego PDF w pamięci podręcznej")
+
+    class Meta:
+        verbose_name = "Zadanie eksportu PDF"
+        verbose_name_plural = "Zadania eksportu PDF"
+        indexes = [models.Index(fields=['status', 'nastepna_proba'])]
+
+    def __str__(self):
+        result = f"PDF planu {self.plan_id} ({self.get_status_display()})"
+        logger.debug(f"__str__ ZadanieEksportuPdf: {result}")
+        return result
+
+
+class TrasaEtapu(models.Model):
+    """
+    Persisted route of an etap as shown on the plan pages and in the PDF: ordered points,
+    per-leg travel times, polyline and the stored static map.
+
+    `skrot` is a hash of the inputs (start address, order of attractions and their
+    coordinates); the snapshot is recomputed only when it no longer matches or when
+    a signal marked it as outdated. A fallback estimate is stored already outdated.
+    """
+    etap = models.OneToOneField(EtapPlanu, on_delete=models.CASCADE, related_name='trasa_etapu')
+    skrot = models.CharField(max_length=64, help_text="SHA-256 danych wejściowych trasy")
+    punkty = models.JSONField(default=list, help_text="Lista {'label', 'lat', 'lng'} w kolejności trasy")
+    czasy_odcinkow = models.JSONField(default=list, help_text="Czasy kolejnych odcinków w sekundach")
+    czas_laczny = models.PositiveIntegerField(default=0, help_text="Czas w sekundach")
+    polyline = models.TextField(blank=True)
+    klucz_mapy = models.CharField(max_length=64, blank=True, help_text="Klucz mapy statycznej")
+    nieaktualna = models.BooleanField(default=False)
+    zrodlo = models.CharField(max_length=20, blank=True, help_text="Backend, który obliczył trasę")
+    data_obliczenia = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Trasa etapu"
+        verbose_name_plural = "Trasy etapów"
+
+    def __str__(self):
+        result = f"{self.etap_id}: {len(self.punkty)} punktów, {self.czas_laczny // 60} min"
+        logger.debug(f"__str__ TrasaEtapu: {result}")
+        return result
@@ -0,0 +1,167 @@
+import logging
+
+import numpy as np
+from django.conf import settings
+
+from .route_optimizer import optimize_order
+from .routing import LocalRoutingBackend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DAY_BUDGET = 480
+# Upper bound of the automatic split; the work of assign_days and PlanBuilder grows with the number of days.
+MAX_DAYS = 30
+DEFAULT_VISIT_MINUTES = 30
+MAX_ITERATIONS = 30
+# Extra room over an even split when the attractions do not fit into the daily budget.
+OVERFLOW_SLACK = 1.1
+
+
+def _initial_medoids(odleglosci, k):
+    # Deterministic max-min seeding: the most central point, then repeatedly the one farthest from all chosen.
+    # Stops early once every point coincides with a medoid (fewer distinct points than k).
+    medoidy = [int(np.argmin(odleglosci.sum(axis=1)))]
+    najblizszy = odleglosci[medoidy[0]].copy()
+    while len(medoidy) < k and najblizszy.max() > 0:
+        nastepny = int(np.argmax(najblizszy))
+        medoidy.append(nastepny)
+        najblizszy = np.minimum(najblizszy, odleglosci[nastepny])
+    return np.array(medoidy)
+
+
+def _balanced_assignment(odleglosci, medoidy, wizyty, pojemnosc):
+    """
+    Assigns every point to the nearest medoid that still has room. Points with the
+    largest regret (second-best minus best distance) choose first.
+    """
+    do_medoidow = odleglosci[:, medoidy]
+    kolejnosc_medoidow = np.argsort(do_medoidow, axis=1, kind='stable')
+    if len(medoidy) > 1:
+        posortowane = np.take_along_axis(do_medoidow, kolejnosc_medoidow[:, :2], axis=1)
+        zal = posortowane[:, 1] - posortowane[:, 0]
+    else:
+        zal = np.zeros(len(odleglosci))
+
+    etykiety = np.empty(len(odleglosci), dtype=np.int64)
+    obciazenie = np.zeros(len(medoidy))
+    for i in np.argsort(-zal, kind='stable'):
+        koszty = wizyty[i] + do_medoidow[i]
+        for j in kolejnosc_medoidow[i]:
+            if obciazenie[j] + koszty[j] <= pojemnosc:
+                break
+        else:
+            # Nowhere left with room: the least loaded day takes it.
+            j = int(np.argmin(obciazenie + koszty))
+        etykiety[i] = j
+        obciazenie[j] += koszty[j]
+    return etykiety, obciazenie
+
+
+def balanced_k_medoids(odleglosci, wizyty, k, pojemnosc, max_iter=MAX_ITERATIONS):
+    """
+    Clusters points into k groups of similar workload with a capacity-constrained k-medoids.
+
+    Args:
+        odleglosci (np.ndarray): (n, n) travel times in minutes.
+        wizyty (np.ndarray): (n,) visit times in minutes.
+        k (int): Maximum number of clusters; fewer are used if there are fewer distinct points.
+        pojemnosc (float): Workload limit of a cluster in minutes (visits plus the
+            travel estimate, i.e. the time from each point's medoid).
+        max_iter (int): Maximum number of assignment / medoid update rounds.
+
+    Returns:
+        tuple: (labels array of shape (n,), workload per cluster in minutes); a cluster may be empty.
+    """
+    medoidy = _initial_medoids(odleglosci, k)
+    k = len(medoidy)
+    etykiety = None
+    for _ in range(max_iter):
+        nowe, obciazenie = _balanced_assignment(odleglosci, medoidy, wizyty, pojemnosc)
+        if etykiety is not None and np.array_equal(nowe, etykiety):
+            break
+        etykiety = nowe
+        for j in range(k):
+            czlonkowie = np.flatnonzero(etykiety == j)
+            if len(czlonkowie):
+                wewnatrz = odleglosci[np.ix_(czlonkowie, czlonkowie)].sum(axis=1)
+                medoidy[j] = czlonkowie[int(np.argmin(wewnatrz))]
+    return etykiety, obciazenie
+
+
+def assign_days(atrakcje, liczba_dni, starty=None, budzet=None, backend=None, mode="driving"):
+    """
+    Splits attractions into days by location and orders each day.
+
+    Attractions are grouped with balanced_k_medoids over estimated travel times, so every
+    day stays local and days get a similar share of visiting plus travel time, within
+    PLAN_DAY_BUDGET_MINUTES where possible. Each day is then ordered with the in-process
+    route optimizer, starting from that day's start point if one is given. Attractions
+    without coordinates go to the least loaded days, after the located ones.
+
+    Args:
+        atrakcje (list): Atrakcja objects with lokalizacja selected.
+        liczba_dni (int): Number of days.
+        starty (dict): Optional day -> (lat, lng) of the day's start point.
+        budzet (int): Daily time budget in minutes; defaults to PLAN_DAY_BUDGET_MINUTES.
+        backend (RoutingBackend): Travel time estimate; the local one by default (no API calls).
+        mode (str): Travel mode.
+
+    Returns:
+        dict: Day number (1..liczba_dni) -> ordered list of attraction ids; empty days are left out.
+    """
+    if budzet is None:
+        budzet = getattr(settings, 'PLAN_DAY_BUDGET_MINUTES', DEFAULT_DAY_BUDGET)
+    backend = backend or LocalRoutingBackend()
+    starty = starty or {}
+
+    z_lokalizacja, bez_lokalizacji = [], []
+    for atrakcja in atrakcje:
+        lok = getattr(atrakcja, 'lokalizacja', None)
+        if lok and lok.szerokosc_geo is not None and lok.dlugosc_geo is not None:
+            z_lokalizacja.append(atrakcja)
+        else:
+            bez_lokalizacji.append(atrakcja)
+
+    liczba_dni = max(1, min(liczba_dni, MAX_DAYS, len(atrakcje)))
+    dni = [[] for _ in range(liczba_dni)]
+    obciazenie = np.zeros(len(dni))
+
+    if z_lokalizacja:
+        punkty = [(a.lokalizacja.szerokosc_geo, a.lokalizacja.dlugosc_geo) for a in z_lokalizacja]
+        # Attractions at one address cannot be split by location, so they count as one point.
+        k = min(liczba_dni, len(set(punkty)))
+        odleglosci = np.asarray(backend.duration_matrix(punkty, mode=mode), dtype=np.float64) / 60
+        odleglosci = np.where(np.isfinite(odleglosci), odleglosci, odleglosci[np.isfinite(odleglosci)].max(initial=0) * 10)
+        wizyty = np.array([a.czas_zwiedzania or DEFAULT_VISIT_MINUTES for a in z_lokalizacja], dtype=np.float64)
+
+        # Rough workload: visits plus the mean travel time to the other attractions, per day.
+        szacunek = wizyty.sum() + odleglosci.mean(axis=1).sum() / k
+        pojemnosc = max(budzet, szacunek / k * OVERFLOW_SLACK)
+        etykiety, obciazenie_klastrow = balanced_k_medoids(odleglosci, wizyty, k, pojemnosc)
+
+        # Days in a stable geographic order (by each cluster's southernmost point); empty clusters are dropped.
+        klastry = sorted(
+            (j for j in range(len(obciazenie_klastrow)) if (etykiety == j).any()),
+            key=lambda j: min(punkty[i] for i in np.flatnonzero(etykiety == j))
+        )
+        for dzien, j in enumerate(klastry):
+            czlonkowie = np.flatnonzero(etykiety == j).tolist()
+            obciazenie[dzien] = obciazenie_klastrow[j]
+            start = starty.get(dzien + 1)
+            if start is not None and start[0] is not None:
+                macierz = np.asarray(backend.duration_matrix([start] + [punkty[i] for i in czlonkowie], mode=mode))
+                order = [i - 1 for i in optimize_order(macierz, start=0)[1:]]
+            else:
+                order = optimize_order(odleglosci[np.ix_(czlonkowie, czlonkowie)])
+            dni[dzien] = [z_lokalizacja[czlonkowie[i]].id for i in order]
+
+    for atrakcja in bez_lokalizacji:
+        dzien = int(np.argmin(obciazenie))
+        dni[dzien].append(atrakcja.id)
+        obciazenie[dzien] += atrakcja.czas_zwiedzania or DEFAULT_VISIT_MINUTES
+
+    logger.info(
+        f"Automatyczny podział {len(atrakcje)} atrakcji na {liczba_dni} dni: "
+        f"obciążenie {[int(o) for o in obciazenie]} min (budżet {budzet} min)"
+    )
+    return {dzien: ids for dzien, ids in enumerate(dni, start=1) if ids}
@@ -0,0 +1,67 @@
+import logging
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.http import content_disposition_header
+
+logger = logging.getLogger(__name__)
+
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+
+
+def _accel_uri(path):
+    # Internal nginx location serving the directory the file is in, if one is configured.
+    for katalog, prefiks in getattr(settings, 'FILE_SERVE_ACCEL_LOCATIONS', {}).items():
+        try:
+            wzgledna = path.relative_to(Path(katalog).resolve())
+        except ValueError:
+            continue
+        return prefiks.rstrip('/') + '/' + quote(wzgledna.as_posix())
+    return None
+
+
+def file_response(path, content_type, filename=None, as_attachment=False):
+    """
+    Sends a stored file without reading it into memory. With FILE_SERVE_BACKEND set, the
+    web server sends it (nginx X-Accel-Redirect or Apache/lighttpd X-Sendfile) and the
+    Django worker is free right away; otherwise it is streamed in chunks by FileResponse.
+
+    Args:
+        path (Path): Path of the file.
+        content_type (str): MIME type.
+        filename (str): File name offered to the browser.
+        as_attachment (bool): Whether the browser should download the file.
+
+    Returns:
+        HttpResponse: Response without a body (web server backends) or a FileResponse.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    path = Path(path).resolve()
+    backend = getattr(settings, 'FILE_SERVE_BACKEND', None)
+    naglowek = None
+    if backend == X_ACCEL_REDIRECT:
+        uri = _accel_uri(path)
+        if uri is not None:
+            naglowek = ('X-Accel-Redirect', uri)
+        else:
+            logger.warning(f"Brak lokalizacji X-Accel-Redirect dla {path} - plik wysyła Django")
+    elif backend == X_SENDFILE:
+        naglowek = ('X-Sendfile', str(path))
+
+    if naglowek is None:
+        return FileResponse(
+            open(path, 'rb'), as_attachment=as_attachment, filename=filename or '', content_type=content_type
+        )
+    if not path.is_file():
+        raise FileNotFoundError(path)
+    response = HttpResponse(content_type=content_type)
+    response[naglowek[0]] = naglowek[1]
+    disposition = content_disposition_header(as_attachment, filename)
+    if disposition:
+        response['Content-Disposition'] = disposition
+    return response
@@ -0,0 +1,257 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, connections
+from django.db.models import F
+from django.utils.timezone import now
+
+from plany.models import WynikGeokodowania
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60 * 60 * 24 * 30
+DEFAULT_NEGATIVE_TTL = 60 * 60 * 24
+DEFAULT_LRU_SIZE = 2048
+
+
+class _LRUCache:
+    """
+    Small thread-safe in-process LRU with per-entry expiry (monotonic clock).
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_lru = _LRUCache(getattr(settings, 'GEOCODE_CACHE_LRU_SIZE', DEFAULT_LRU_SIZE))
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def geocode_cache_stats():
+    """
+    Returns this worker's geocoding cache counters.
+
+    Returns:
+        dict: Counts of 'lru_hit', 'db_hit', 'negative_hit', 'miss' and 'error'.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def clear_local_cache():
+    """Drops the in-process LRU (the database table is left untouched)."""
+    _lru.clear()
+
+
+def normalize_address(address):
+    """
+    Normalizes an address so that trivially different spellings share a cache entry.
+
+    Args:
+        address (str): Raw address as typed by the user or built from Lokalizacja.
+
+    Returns:
+        str: Lower-cased, NFC-normalized address with collapsed whitespace.
+    """
+    if not address:
+        return ""
+    adres = unicodedata.normalize("NFC", str(address)).lower().strip()
+    adres = re.sub(r"\s*,\s*", ", ", adres)
+    adres = re.sub(r"\s+", " ", adres)
+    return adres.strip(" ,")
+
+
+def _cache_key(normalized):
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _ttl(negative):
+    if negative:
+        return getattr(settings, 'GEOCODE_CACHE_NEGATIVE_TTL', DEFAULT_NEGATIVE_TTL)
+    return getattr(settings, 'GEOCODE_CACHE_TTL', DEFAULT_TTL)
+
+
+def _lookup_db(klucz):
+    """Returns ((lat, lng), remaining_ttl) for a fresh DB row, otherwise None."""
+    wynik = WynikGeokodowania.objects.filter(klucz=klucz).first()
+    if wynik is None:
+        return None
+    negative = wynik.szerokosc_geo is None or wynik.dlugosc_geo is None
+    age = (now() - wynik.data_pobrania).total_seconds()
+    remaining = _ttl(negative) - age
+    if remaining <= 0:
+        return None
+    WynikGeokodowania.objects.filter(pk=wynik.pk).update(liczba_trafien=F('liczba_trafien') + 1)
+    return (wynik.szerokosc_geo, wynik.dlugosc_geo), remaining
+
+
+def _store(klucz, normalized, coords):
+    lat, lng = coords
+    try:
+        WynikGeokodowania.objects.update_or_create(
+            klucz=klucz,
+            defaults={
+                'adres': normalized[:255],
+                'szerokosc_geo': lat,
+                'dlugosc_geo': lng,
+                'data_pobrania': now(),
+            },
+        )
+    except IntegrityError:
+        # Another worker stored the same address concurrently - its row is just as good.
+        logger.debug(f"Równoległy zapis geokodowania dla adresu: {normalized}")
+
+
+def _cached(klucz):
+    """Returns cached coordinates ((None, None) for a negative result) or None if unknown."""
+    coords = _lru.get(klucz)
+    if coords is not None:
+        _count('negative_hit' if coords[0] is None else 'lru_hit')
+        return coords
+
+    cached = _lookup_db(klucz)
+    if cached is not None:
+        coords, remaining = cached
+        _count('negative_hit' if coords[0] is None else 'db_hit')
+        _lru.set(klucz, coords, remaining)
+        return coords
+    return None
+
+
+def geocode_cached(address):
+    """
+    Looks an address up in the geocoding cache only, without calling the API.
+
+    Args:
+        address (str): The address to look up.
+
+    Returns:
+        tuple | None: (latitude, longitude), (None, None) for a cached negative result,
+        or None if the address has not been geocoded yet.
+    """
+    normalized = normalize_address(address)
+    if not normalized:
+        return None, None
+    return _cached(_cache_key(normalized))
+
+
+def geocode(address, gmaps, raise_errors=False):
+    """
+    Geocodes an address through the shared cache: in-process LRU, then the
+    WynikGeokodowania table, and only then the Google Maps Geocoding API.
+
+    Empty API results are cached for GEOCODE_CACHE_NEGATIVE_TTL seconds; API errors
+    are not cached, so a transient failure is retried on the next call.
+
+    Args:
+        address (str): The address to geocode.
+        gmaps (googlemaps.Client): Authenticated Google Maps client, used on a miss.
+        raise_errors (bool): Re-raise API errors instead of returning (None, None),
+            so callers with their own retry logic can tell them from empty results.
+
+    Returns:
+        tuple: (latitude, longitude) if known, otherwise (None, None).
+    """
+    normalized = normalize_address(address)
+    if not normalized:
+        return None, None
+    klucz = _cache_key(normalized)
+
+    coords = _cached(klucz)
+    if coords is not None:
+        return coords
+
+    _count('miss')
+    try:
+        result = gmaps.geocode(address)
+    except Exception as e:
+        _count('error')
+        logger.warning(f"Geocoding error: {e}", exc_info=True)
+        if raise_errors:
+            raise
+        return None, None
+
+    if result:
+        loc = result[0]['geometry']['location']
+        coords = (loc['lat'], loc['lng'])
+        logger.info(f"Zgeokodowano adres '{address}' → {coords}")
+    else:
+        coords = (None, None)
+        logger.warning(f"Brak wyników geokodowania dla adresu: {address}")
+
+    _store(klucz, normalized, coords)
+    _lru.set(klucz, coords, _ttl(coords[0] is None))
+    return coords
+
+
+def _geocode_in_thread(address, gmaps):
+    try:
+        return geocode(address, gmaps, raise_errors=True), None
+    except Exception as e:
+        return None, e
+    finally:
+        # Pool threads open their own DB connections (cache lookups) - close them.
+        connections.close_all()
+
+
+def geocode_many(addresses, gmaps, workers=4):
+    """
+    Geocodes many addresses concurrently through the shared cache, one lookup per
+    distinct normalized address. The request rate is bounded by the shared client's limiter.
+
+    Args:
+        addresses (iterable): Addresses to geocode.
+        gmaps (googlemaps.Client): Authenticated Google Maps client.
+        workers (int): Number of concurrent lookups.
+
+    Returns:
+        dict: normalized address -> (coords, error); coords is (lat, lng) or (None, None)
+        for an empty result, error is the exception of a failed lookup (coords None).
+    """
+    unikalne = {}
+    for address in addresses:
+        unikalne.setdefault(normalize_address(address), address)
+    unikalne.pop("", None)
+    if not unikalne:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='geokodowanie') as executor:
+        wyniki = executor.map(lambda a: _geocode_in_thread(a, gmaps), unikalne.values())
+        return dict(zip(unikalne, wyniki))
@@ -0,0 +1,131 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+from atrakcje.models import Lokalizacja
+from atrakcje.services.spatial import bump_catalog_version
+from atrakcje.utils.geohash import geohash_encode
+from plany.models import TrasaEtapu, ZadanieGeokodowania
+from .geocoding import geocode_many, normalize_address
+from .jobs import claim_due_jobs, claimed_job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 30
+DEFAULT_LEASE = 300
+
+Status = ZadanieGeokodowania.Status
+
+
+def enqueue_geocoding(lokalizacja, adres):
+    """
+    Queues geocoding of a Lokalizacja. At most one pending job is kept per
+    lokalizacja; a newer address replaces the pending one.
+
+    Args:
+        lokalizacja (Lokalizacja): Saved location without coordinates.
+        adres (str): Address to geocode.
+
+    Returns:
+        ZadanieGeokodowania | None: The created job, or None if an existing one was reused.
+    """
+    aktywne = ZadanieGeokodowania.objects.filter(lokalizacja=lokalizacja)
+    if aktywne.filter(status=Status.OCZEKUJACE).update(adres=adres[:255]):
+        return None
+    if aktywne.filter(status=Status.W_TOKU, adres=adres[:255]).exists():
+        return None
+    zadanie = ZadanieGeokodowania.objects.create(lokalizacja=lokalizacja, adres=adres[:255], nastepna_proba=now())
+    logger.debug(f"Dodano zadanie geokodowania {zadanie.id}: {adres}")
+    return zadanie
+
+
+def claim_jobs(limit=DEFAULT_BATCH_SIZE, lease=None):
+    """
+    Claims due geocoding jobs for this worker (see jobs.claim_due_jobs).
+
+    Returns:
+        list: Claimed ZadanieGeokodowania objects (status W_TOKU).
+    """
+    if lease is None:
+        lease = getattr(settings, 'GEOCODING_JOB_LEASE', DEFAULT_LEASE)
+    return claim_due_jobs(ZadanieGeokodowania, limit, lease)
+
+
+def process_jobs(zadania, gmaps, workers=DEFAULT_WORKERS):
+    """
+    Geocodes a batch of claimed jobs and writes the coordinates back.
+
+    Jobs with the same (normalized) address share one lookup. Empty results end the job
+    with an error; API errors are retried with exponential backoff until
+    GEOCODING_JOB_MAX_ATTEMPTS is reached. Jobs re-claimed by another worker in the
+    meantime (lease expired) are left to that worker.
+
+    Returns:
+        Counter: Numbers of 'zakonczone', 'brak_wynikow', 'ponowione', 'bledy' and 'przejete' jobs.
+    """
+    max_attempts = getattr(settings, 'GEOCODING_JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    retry_delay = getattr(settings, 'GEOCODING_JOB_RETRY_DELAY', DEFAULT_RETRY_DELAY)
+    wg_adresu = defaultdict(list)
+    for zadanie in zadania:
+        wg_adresu[normalize_address(zadanie.adres)].append(zadanie)
+
+    wyniki = geocode_many([grupa[0].adres for grupa in wg_adresu.values()], gmaps, workers=workers)
+
+    stats = Counter()
+    teraz = now()
+    atrakcje, zlokalizowane = [], 0
+    with transaction.atomic():
+        for adres, grupa in wg_adresu.items():
+            coords, blad = wyniki.get(adres, ((None, None), None))
+            if blad is None and coords[0] is not None:
+                lat, lng = coords
+                wlasne = [
+                    z for z in grupa
+                    if claimed_job(ZadanieGeokodowania, z).update(status=Status.ZAKONCZONE, zablokowane_do=None, blad='')
+                ]
+                stats['przejete'] += len(grupa) - len(wlasne)
+                stats['zakonczone'] += len(wlasne)
+                # Coordinates entered by hand in the meantime win.
+                lokalizacje = Lokalizacja.objects.filter(
+                    pk__in=[z.lokalizacja_id for z in wlasne], szerokosc_geo__isnull=True
+                )
+                atrakcje += [a for a in lokalizacje.values_list('atrakcja_id', flat=True) if a is not None]
+                zlokalizowane += lokalizacje.update(szerokosc_geo=lat, dlugosc_geo=lng, geohash=geohash_encode(lat, lng))
+            elif blad is None:
+                for zadanie in grupa:
+                    if claimed_job(ZadanieGeokodowania, zadanie).update(
+                        status=Status.BLAD, zablokowane_do=None, blad="Brak wyników geokodowania"
+                    ):
+                        stats['brak_wynikow'] += 1
+                    else:
+                        stats['przejete'] += 1
+            else:
+                for zadanie in grupa:
+                    if zadanie.liczba_prob >= max_attempts:
+                        zmiany, wynik = {'status': Status.BLAD}, 'bledy'
+                    else:
+                        opoznienie = retry_delay * 2 ** (zadanie.liczba_prob - 1)
+                        zmiany = {'status': Status.OCZEKUJACE, 'nastepna_proba': teraz + timedelta(seconds=opoznienie)}
+                        wynik = 'ponowione'
+                    if claimed_job(ZadanieGeokodowania, zadanie).update(zablokowane_do=None, blad=str(blad)[:2000], **zmiany):
+                        stats[wynik] += 1
+                    else:
+                        stats['przejete'] += 1
+        # The bulk update skips the Lokalizacja post_save receivers - do their work here:
+        # outdate route snapshots visiting the located attractions and bump the catalog version.
+        if atrakcje:
+            TrasaEtapu.objects.filter(etap__elementy__atrakcja_id__in=atrakcje).update(nieaktualna=True)
+    if zlokalizowane:
+        bump_catalog_version()
+
+    logger.info(
+        f"Przetworzono {len(zadania)} zadań geokodowania ({len(wg_adresu)} adresów): {dict(stats)}"
+    )
+    return stats
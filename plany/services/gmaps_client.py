@@ -0,0 +1,313 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import googlemaps
+import requests
+from django.conf import settings
+from django.db import transaction, DatabaseError
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+from plany.models import LimitZapytan
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10.0
+DEFAULT_RETRY_TIMEOUT = 15
+DEFAULT_POOL_SIZE = 20
+DEFAULT_QPS = 50
+DEFAULT_MAX_WAIT = 10.0
+DEFAULT_BASE_URL = 'https://maps.googleapis.com'
+RATE_LIMIT_NAME = 'google_maps'
+# Query parameters that identify the caller, not the request - never recorded.
+SECRET_PARAMS = {'key', 'signature', 'client', 'channel'}
+
+
+class TokenBucket:
+    """
+    Token bucket kept in the LimitZapytan table, so every worker process draws from the
+    same budget. It runs on its own database alias (GOOGLE_MAPS_RATE_LIMIT_DB) so that
+    the row lock is never held by a caller's long transaction.
+    """
+
+    def __init__(self, nazwa, rate, burst=None, using=None, max_wait=DEFAULT_MAX_WAIT):
+        self.nazwa = nazwa
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.using = using or 'default'
+        self.max_wait = max_wait
+
+    def _try_take(self):
+        """Takes one token; returns 0 on success or the number of seconds to wait."""
+        with transaction.atomic(using=self.using):
+            teraz = time.time()
+            stan, _ = (
+                LimitZapytan.objects.using(self.using).select_for_update()
+                .get_or_create(nazwa=self.nazwa, defaults={'tokeny': self.burst, 'aktualizacja': teraz})
+            )
+            tokeny = min(self.burst, stan.tokeny + max(0.0, teraz - stan.aktualizacja) * self.rate)
+            czekaj = 0.0
+            if tokeny >= 1:
+                tokeny -= 1
+            else:
+                czekaj = (1 - tokeny) / self.rate
+            LimitZapytan.objects.using(self.using).filter(pk=self.nazwa).update(tokeny=tokeny, aktualizacja=teraz)
+        return czekaj
+
+    def acquire(self):
+        """
+        Blocks until a token is available (at most max_wait seconds).
+        Fails open: if the database is unavailable the request is let through.
+        """
+        koniec = time.monotonic() + self.max_wait
+        while True:
+            try:
+                czekaj = self._try_take()
+            except DatabaseError as e:
+                logger.warning(f"Limiter {self.nazwa} niedostępny: {e}")
+                return
+            if not czekaj:
+                return
+            if time.monotonic() + czekaj > koniec:
+                logger.warning(f"Limiter {self.nazwa}: przekroczono {self.max_wait} s oczekiwania, zapytanie wysłane")
+                return
+            time.sleep(czekaj)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+def recording_key(method, url):
+    """
+    Returns the file name stem of a recorded response: a hash of the method, path and
+    sorted query parameters without the API key, so recordings made with one key
+    replay with any other and against any base URL.
+    """
+    czesci = urlsplit(url)
+    params = sorted((k, v) for k, v in parse_qsl(czesci.query, keep_blank_values=True) if k not in SECRET_PARAMS)
+    payload = f"{method.upper()} {czesci.path}?{urlencode(params)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest(), payload
+
+
+class RecordingMissing(requests.ConnectionError):
+    """Raised in replay mode for a request that has no recording."""
+
+
+class RecordReplayAdapter(HTTPAdapter):
+    """
+    Transport that records Google Maps responses to files ('record') or serves them
+    back without touching the network ('replay'), for deterministic offline
+    benchmarks and regression runs (GOOGLE_MAPS_TRANSPORT, GOOGLE_MAPS_RECORDINGS_DIR).
+    """
+
+    def __init__(self, mode, katalog, **kwargs):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Nieznany tryb transportu: {mode!r}")
+        super().__init__(**kwargs)
+        self.mode = mode
+        self.katalog = Path(katalog)
+
+    def _path(self, request):
+        klucz, opis = recording_key(request.method, request.url)
+        return self.katalog / f"{klucz}.json", opis
+
+    def send(self, request, **kwargs):
+        path, opis = self._path(request)
+        if self.mode == 'replay':
+            return self._replay(request, path, opis)
+        response = super().send(request, **kwargs)
+        self._record(response, path, opis)
+        return response
+
+    def _replay(self, request, path, opis):
+        try:
+            with open(path, encoding='utf-8') as f:
+                zapis = json.load(f)
+        except FileNotFoundError:
+            raise RecordingMissing(f"Brak nagrania dla {opis}", request=request)
+        response = requests.Response()
+        response.status_code = zapis['status']
+        response.headers = CaseInsensitiveDict(zapis['headers'])
+        response._content = base64.b64decode(zapis['body'])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.reason = zapis.get('reason', '')
+        return response
+
+    def _record(self, response, path, opis):
+        zapis = {
+            'request': opis,
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() in ('content-type', 'cache-control')},
+            'body': base64.b64encode(response.content).decode('ascii'),
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(zapis, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+        logger.debug(f"Nagrano odpowiedź {opis[:80]} -> {path.name}")
+
+
+class PooledSession(requests.Session):
+    """
+    requests.Session shared by the Maps client and static map downloads:
+    keep-alive connection pool, connection retries, the cross-process rate limiter and
+    single-flight coalescing of identical concurrent GET requests.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, limiter=None, timeout=None, transport=None, recordings_dir=None):
+        super().__init__()
+        adapter_kwargs = dict(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2, allowed_methods=None),
+        )
+        if transport:
+            adapter = RecordReplayAdapter(transport, recordings_dir, **adapter_kwargs)
+            if transport == 'replay':
+                # Nothing leaves the machine, so there is no quota to protect.
+                limiter = None
+        else:
+            adapter = HTTPAdapter(**adapter_kwargs)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.limiter = limiter
+        self.default_timeout = timeout
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    def _send(self, method, url, **kwargs):
+        if self.limiter is not None:
+            self.limiter.acquire()
+        kwargs.setdefault('timeout', self.default_timeout)
+        return super().request(method, url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        if method.upper() != 'GET' or kwargs.get('stream'):
+            return self._send(method, url, **kwargs)
+
+        params = kwargs.get('params')
+        klucz = (url, repr(sorted(params.items())) if isinstance(params, dict) else repr(params))
+        with self._flights_lock:
+            flight = self._flights.get(klucz)
+            leader = flight is None
+            if leader:
+                flight = self._flights[klucz] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            logger.debug(f"Zapytanie połączone z trwającym identycznym: {url[:80]}")
+            return flight.response
+
+        try:
+            response = self._send(method, url, **kwargs)
+            response.content  # read the body once, before it is shared
+            flight.response = response
+            return response
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(klucz, None)
+            flight.done.set()
+
+
+_session = None
+_client = None
+_lock = threading.Lock()
+
+
+def _build_limiter():
+    qps = getattr(settings, 'GOOGLE_MAPS_QPS', DEFAULT_QPS)
+    if not qps:
+        return None
+    return TokenBucket(
+        RATE_LIMIT_NAME,
+        rate=qps,
+        burst=getattr(settings, 'GOOGLE_MAPS_RATE_LIMIT_BURST', qps),
+        using=getattr(settings, 'GOOGLE_MAPS_RATE_LIMIT_DB', 'default'),
+        max_wait=getattr(settings, 'GOOGLE_MAPS_RATE_LIMIT_MAX_WAIT', DEFAULT_MAX_WAIT),
+    )
+
+
+def reset_clients():
+    """Drops the shared session and client so the next call rebuilds them from settings."""
+    global _session, _client
+    with _lock:
+        _session = None
+        _client = None
+
+
+def get_http_session():
+    """
+    Returns the process-wide pooled HTTP session used for Google Maps traffic.
+
+    Returns:
+        PooledSession: Shared session.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = PooledSession(
+                pool_size=getattr(settings, 'GOOGLE_MAPS_POOL_SIZE', DEFAULT_POOL_SIZE),
+                limiter=_build_limiter(),
+                timeout=(
+                    getattr(settings, 'GOOGLE_MAPS_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+                    getattr(settings, 'GOOGLE_MAPS_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+                ),
+                transport=getattr(settings, 'GOOGLE_MAPS_TRANSPORT', None),
+                recordings_dir=getattr(settings, 'GOOGLE_MAPS_RECORDINGS_DIR', None),
+            )
+    return _session
+
+
+def get_base_url():
+    """Returns the Maps API base URL (GOOGLE_MAPS_BASE_URL, e.g. a local stand-in server)."""
+    return (getattr(settings, 'GOOGLE_MAPS_BASE_URL', None) or DEFAULT_BASE_URL).rstrip('/')
+
+
+def get_gmaps_client():
+    """
+    Returns the process-wide Google Maps client, built once per worker on top of the
+    shared pooled session, with timeouts and retries from settings.
+
+    Returns:
+        googlemaps.Client: Shared client.
+    """
+    global _client
+    session = get_http_session()
+    with _lock:
+        if _client is None:
+            _client = googlemaps.Client(
+                key=settings.GOOGLE_MAPS_API_KEY,
+                connect_timeout=getattr(settings, 'GOOGLE_MAPS_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+                read_timeout=getattr(settings, 'GOOGLE_MAPS_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+                retry_timeout=getattr(settings, 'GOOGLE_MAPS_RETRY_TIMEOUT', DEFAULT_RETRY_TIMEOUT),
+                # The shared TokenBucket enforces the quota across processes.
+                queries_per_second=10 ** 6,
+                queries_per_minute=10 ** 8,
+                requests_session=session,
+                base_url=get_base_url(),
+            )
+            logger.info("Utworzono współdzielonego klienta Google Maps")
+    return _client
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import random
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from .routing import LocalRoutingBackend, as_coords, haversine_km
+
+logger = logging.getLogger(__name__)
+
+# Deterministic "geocoding" scatters addresses around this point.
+CENTER = (50.0614, 19.9366)
+SPAN = 0.12
+
+
+def fake_geocode(address):
+    """
+    Deterministic stand-in geocoding: the same address always maps to the same point
+    near CENTER. Addresses containing 'brak' return no result.
+
+    Returns:
+        tuple | None: (lat, lng) or None.
+    """
+    if 'brak' in address.lower():
+        return None
+    digest = hashlib.sha256(address.strip().lower().encode('utf-8')).digest()
+    a, b = struct.unpack('>II', digest[:8])
+    return (
+        round(CENTER[0] + (a / 2 ** 32 - 0.5) * SPAN, 6),
+        round(CENTER[1] + (b / 2 ** 32 - 0.5) * SPAN * 1.5, 6),
+    )
+
+
+def _parse_location(text):
+    try:
+        lat, lng = (float(x) for x in text.split(','))
+        return lat, lng
+    except ValueError:
+        return fake_geocode(text)
+
+
+def _png(width, height, rgb=(229, 227, 223)):
+    """Minimal solid-colour PNG of the requested size."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    row = b'\x00' + bytes(rgb) * width
+    raw = zlib.compress(row * height, 6)
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', raw)
+        + chunk(b'IEND', b'')
+    )
+
+
+def _duration_text(seconds):
+    return f"{max(1, round(seconds / 60))} min"
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Implements the Google Maps endpoints used by the application."""
+    server_version = "GmapsStandin/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug("standin: " + format, *args)
+
+    def _send(self, status, body, content_type='application/json; charset=UTF-8'):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        srv = self.server
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        endpoint = url.path.rstrip('/').rsplit('/', 2)[-2] if url.path.endswith('/json') else url.path.rsplit('/', 1)[-1]
+        srv.count(endpoint)
+
+        if srv.latency or srv.jitter:
+            time.sleep(max(0.0, srv.latency + srv.rng_uniform(-srv.jitter, srv.jitter)))
+        if srv.error_rate and srv.rng_uniform(0, 1) < srv.error_rate:
+            srv.count('errors')
+            self._send(srv.error_status, {'status': 'UNKNOWN_ERROR', 'error_message': 'Wstrzyknięty błąd'})
+            return
+
+        handler = {
+            'geocode': self._geocode,
+            'directions': self._directions,
+            'distancematrix': self._distance_matrix,
+            'staticmap': self._static_map,
+        }.get(endpoint)
+        if handler is None:
+            self._send(404, {'status': 'NOT_FOUND'})
+            return
+        handler(params)
+
+    def _geocode(self, params):
+        coords = fake_geocode(params.get('address', ''))
+        if coords is None:
+            self._send(200, {'status': 'ZERO_RESULTS', 'results': []})
+            return
+        self._send(200, {'status': 'OK', 'results': [{
+            'formatted_address': params.get('address', ''),
+            'geometry': {'location': {'lat': coords[0], 'lng': coords[1]}, 'location_type': 'APPROXIMATE'},
+        }]})
+
+    def _directions(self, params):
+        backend = self.server.backend
+        mode = params.get('mode', 'driving')
+        waypoints = params.get('waypoints', '')
+        optimize = waypoints.startswith('optimize:true')
+        waypoints = [w for w in waypoints.split('|') if w and not w.startswith('optimize:')]
+        punkty = [_parse_location(params.get('origin', ''))]
+        punkty += [_parse_location(w) for w in waypoints]
+        punkty.append(_parse_location(params.get('destination', '')))
+        if any(p is None for p in punkty):
+            self._send(200, {'status': 'NOT_FOUND', 'routes': []})
+            return
+
+        trasa = backend.route(punkty, mode=mode, optimize=optimize)
+        kolejnosc = [0] + [i + 1 for i in trasa['waypoint_order']] + [len(punkty) - 1]
+        coords = [punkty[i] for i in kolejnosc]
+        legs = [{
+            'duration': {'value': odc['czas'], 'text': _duration_text(odc['czas'])},
+            'distance': {'value': odc['dystans'], 'text': f"{odc['dystans'] / 1000:.1f} km"},
+            'start_location': {'lat': a[0], 'lng': a[1]},
+            'end_location': {'lat': b[0], 'lng': b[1]},
+        } for odc, a, b in zip(trasa['legs'], coords, coords[1:])]
+        self._send(200, {'status': 'OK', 'routes': [{
+            'legs': legs,
+            'overview_polyline': {'points': trasa['overview_polyline']},
+            'waypoint_order': trasa['waypoint_order'],
+            'summary': 'standin',
+        }]})
+
+    def _distance_matrix(self, params):
+        backend = self.server.backend
+        mode = params.get('mode', 'driving')
+        origins = [_parse_location(o) for o in params.get('origins', '').split('|') if o]
+        destinations = [_parse_location(d) for d in params.get('destinations', '').split('|') if d]
+        rows = []
+        for o in origins:
+            elements = []
+            for d in destinations:
+                if o is None or d is None:
+                    elements.append({'status': 'NOT_FOUND'})
+                    continue
+                s = backend.travel_times([(o, d)], mode)[0]
+                elements.append({
+                    'status': 'OK',
+                    'duration': {'value': s, 'text': _duration_text(s)},
+                    'distance': {'value': int(round(haversine_km(as_coords([o]), as_coords([d]))[0] * backend.detour_factor * 1000)), 'text': ''},
+                })
+            rows.append({'elements': elements})
+        self._send(200, {'status': 'OK', 'origin_addresses': [], 'destination_addresses': [], 'rows': rows})
+
+    def _static_map(self, params):
+        try:
+            width, height = (int(x) for x in params.get('size', '640x480').split('x'))
+        except ValueError:
+            self._send(400, b'Bad size', 'text/plain')
+            return
+        self._send(200, self.server.png(min(width, 2048), min(height, 2048)), 'image/png')
+
+
+class GmapsStandinServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Google Maps geocode, directions, distancematrix and staticmap
+    endpoints, with configurable latency and error injection. Answers are deterministic
+    (see fake_geocode and LocalRoutingBackend), so benchmarks and regression runs are
+    repeatable without network access.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, jitter=0.0, error_rate=0.0, error_status=500, seed=0):
+        super().__init__(address, StandinHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.backend = LocalRoutingBackend()
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._png_cache = {}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def rng_uniform(self, a, b):
+        with self._lock:
+            return self._rng.uniform(a, b)
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def png(self, width, height):
+        key = (width, height)
+        if key not in self._png_cache:
+            self._png_cache[key] = _png(width, height)
+        return self._png_cache[key]
+
+    def start_in_thread(self):
+        """Serves in a daemon thread and returns the base URL (for benchmarks)."""
+        threading.Thread(target=self.serve_forever, daemon=True, name='gmaps-standin').start()
+        return self.base_url
@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+
+def claim_due_jobs(model, limit, lease):
+    """
+    Claims due jobs of a Zadanie queue for this worker: pending ones whose time has come
+    and in-progress ones whose lease expired (their worker died). Rows locked by other
+    workers are skipped, so several workers can run side by side.
+
+    Args:
+        model (type): Concrete Zadanie subclass.
+        limit (int): Maximum number of jobs to claim.
+        lease (int): Seconds a claimed job stays reserved for this worker.
+
+    Returns:
+        list: Claimed jobs (status W_TOKU, liczba_prob already incremented).
+    """
+    Status = model.Status
+    teraz = now()
+    gotowe = Q(status=Status.OCZEKUJACE, nastepna_proba__lte=teraz) | Q(status=Status.W_TOKU, zablokowane_do__lt=teraz)
+    # Oracle cannot combine FOR UPDATE with a row limit - pick candidates first, then lock them.
+    kandydaci = list(model.objects.filter(gotowe).order_by('nastepna_proba').values_list('id', flat=True)[:limit])
+    if not kandydaci:
+        return []
+    with transaction.atomic():
+        zadania = list(model.objects.select_for_update(skip_locked=True).filter(gotowe, id__in=kandydaci))
+        model.objects.filter(id__in=[z.id for z in zadania]).update(
+            status=Status.W_TOKU,
+            zablokowane_do=teraz + timedelta(seconds=lease),
+            liczba_prob=F('liczba_prob') + 1,
+        )
+    for zadanie in zadania:
+        zadanie.status = Status.W_TOKU
+        zadanie.liczba_prob += 1
+    return zadania
+
+
+def claimed_job(model, zadanie):
+    """
+    Returns a queryset matching a claimed job only while this worker still owns it:
+    not cancelled or finished, and not re-claimed by another worker after the lease
+    expired (every claim increments liczba_prob, which serves as the claim token).
+
+    Args:
+        model (type): Concrete Zadanie subclass.
+        zadanie (Zadanie): Job returned by claim_due_jobs.
+
+    Returns:
+        QuerySet: At most one row; update() on it returns 0 once the claim is lost.
+    """
+    return model.objects.filter(id=zadanie.id, status=model.Status.W_TOKU, liczba_prob=zadanie.liczba_prob)
@@ -1,8 +1,17 @@
 import logging
-import base64
-import requests
 from django.conf import settings
-import googlemaps
+from django.db import transaction
+from django.urls import reverse
+import numpy as np
+
+from plany.models import ElementEtapu
+from .geocoding import geocode
+from .gmaps_client import get_gmaps_client, get_base_url
+from .route_optimizer import DEFAULT_TIME_LIMIT, optimize_order
+from .routes import invalidate_etap_routes
+from .routing import get_routing_backend
+from .scheduling import schedule_visits
+from .static_maps import get_static_map
 
 logger = logging.getLogger(__name__)
 
@@ -10,7 +19,7 @@ logger = logging.getLogger(__name__)
 def geocode_address(address, gmaps):
     """
     Converts a textual address into geographical coordinates (latitude and longitude)
-    using the Google Maps Geocoding API.
+    using the shared geocoding cache, falling back to the Google Maps Geocoding API.
 
     Args:
         address (str): The address to geocode.
@@ -19,20 +28,10 @@ def geocode_address(address, gmaps):
     Returns:
         tuple: (latitude, longitude) if successful, otherwise (None, None).
     """
-    try:
-        result = gmaps.geocode(address)
-        if result:
-            loc = result[0]['geometry']['location']
-            logger.info(f"Zgeokodowano adres '{address}' → ({loc['lat']}, {loc['lng']})")
-            return loc['lat'], loc['lng']
-        else:
-            logger.warning(f"Brak wyników geokodowania dla adresu: {address}")
-    except Exception as e:
-        logger.warning(f"Geocoding error: {e}", exc_info=True)
-    return None, None
+    return geocode(address, gmaps)
 
 
-def build_etap_points(etap, gmaps):
+def build_etap_points(etap, gmaps, with_start=True):
     """
     Builds a list of geographical points for a given etap, including the starting address
     and all attractions.
@@ -40,13 +39,14 @@ def build_etap_points(etap, gmaps):
     Args:
         etap (Etap): The etap object containing the route and elements.
         gmaps (googlemaps.Client): Authenticated Google Maps client.
+        with_start (bool): Whether to geocode and include the start address.
 
     Returns:
         list: List of dictionaries with keys 'label', 'lat', and 'lng'.
     """
     punkty = []
 
-    if etap.adres_startowy:
+    if with_start and etap.adres_startowy:
         lat, lng = geocode_address(etap.adres_startowy, gmaps)
         if lat and lng:
             punkty.append({"label": "S", "lat": lat, "lng": lng})
@@ -63,81 +63,75 @@ def build_etap_points(etap, gmaps):
     return punkty
 
 
-def generate_static_map_url(punkty, gmaps, etap_kolejnosc=1, adres_startowy=None):
+def generate_static_map(punkty, gmaps, etap_kolejnosc=1, adres_startowy=None, etap=None, backend=None):
     """
-    Generates a static Google Maps image URL for a route with markers and a polyline.
+    Generates a static Google Maps image for a route with markers and a polyline and
+    stores it in the content-addressed static map store.
 
     Args:
         punkty (list): List of point dictionaries with 'label', 'lat', and 'lng'.
         gmaps (googlemaps.Client): Authenticated Google Maps client.
         etap_kolejnosc (int): Optional order/index of the etap.
         adres_startowy (str): Optional start address for context/logging.
+        etap (EtapPlanu): Optional etap, used to tag the cached route.
+        backend (RoutingBackend): Routing backend; defaults to the one from settings.
 
     Returns:
-        str or None: Base64-encoded image string (data:image/png;base64,...) or None if failed.
+        str or None: Key of the stored map image, or None if failed.
     """
     if len(punkty) < 2:
         logger.warning("Zbyt mało punktów do wygenerowania statycznej mapy")
         return None
 
+    backend = backend or get_routing_backend(gmaps)
     polyline = None
-    try:
-        latlngs = [f"{p['lat']},{p['lng']}" for p in punkty]
-        directions = gmaps.directions(
-            origin=latlngs[0],
-            destination=latlngs[-1],
-            waypoints=latlngs[1:-1] if len(latlngs) > 2 else None,
-            mode="driving"
-        )
-        polyline = directions[0]['overview_polyline']['points']
+    trasa = backend.route(punkty, mode="driving", etap=etap)
+    if trasa and trasa['overview_polyline']:
+        polyline = trasa['overview_polyline']
         logger.debug(f"Pobrano polyline dla etapu {etap_kolejnosc}")
-    except Exception as e:
-        logger.warning("Failed to get directions: %s", e, exc_info=True)
-
-    url = f"https://maps.googleapis.com/maps/api/staticmap?size=800x300&key={settings.GOOGLE_MAPS_API_KEY}"
-    for p in punkty:
-        url += f"&markers=color:blue%7Clabel:{p['label']}%7C{p['lat']},{p['lng']}"
-    if polyline:
-        url += f"&path=enc:{polyline}"
 
     logger.debug(f"Generowanie mapy statycznej z {len(punkty)} punktami (etap {etap_kolejnosc})")
+    return get_static_map(punkty, polyline)
 
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            encoded = base64.b64encode(response.content).decode('utf-8')
-            return f"data:image/png;base64,{encoded}"
-        else:
-            logger.warning(f"Błąd pobierania mapy statycznej: kod HTTP {response.status_code}")
-    except Exception as e:
-        logger.warning(f"Failed to download static map: {e}", exc_info=True)
-    return None
+
+def generate_static_map_url(punkty, gmaps, etap_kolejnosc=1, adres_startowy=None, etap=None, backend=None):
+    """
+    Same as generate_static_map, but returns the URL under which the stored image is served.
+
+    Returns:
+        str or None: URL of the map image, or None if failed.
+    """
+    klucz = generate_static_map(punkty, gmaps, etap_kolejnosc, adres_startowy, etap=etap, backend=backend)
+    return reverse('plany:mapa_statyczna', args=[klucz]) if klucz else None
 
 
-def build_etap_map(etap, gmaps, _):
+def build_etap_map(etap, gmaps, _, backend=None):
     """
-    Builds a static map image (base64) for a given etap using its start address and attractions.
+    Builds a static map image for a given etap using its start address and attractions.
 
     Args:
         etap (Etap): Etap object with address and attractions.
         gmaps (googlemaps.Client): Authenticated Google Maps client.
         _ (unused): Placeholder for compatibility.
+        backend (RoutingBackend): Routing backend; defaults to the one from settings.
 
     Returns:
-        str or None: Base64-encoded map image or None if not enough data.
+        str or None: Key of the stored map image (see static_maps) or None if not enough data.
     """
     punkty = build_etap_points(etap, gmaps)
-    return generate_static_map_url(punkty, gmaps, etap.kolejnosc, etap.adres_startowy)
+    return generate_static_map(punkty, gmaps, etap.kolejnosc, etap.adres_startowy, etap=etap, backend=backend)
 
 
-def build_etap_data(plan, etap, gmaps):
+def build_etap_data(plan, etap, gmaps, backend=None):
     """
-    Builds routing information and estimated total driving time for an etap.
+    Builds routing information and estimated total driving time for an etap,
+    following the order stored in the plan (see optimize_etap_order).
 
     Args:
         plan (Plan): The plan to which the etap belongs.
         etap (Etap): The etap to process.
         gmaps (googlemaps.Client): Authenticated Google Maps client.
+        backend (RoutingBackend): Routing backend; defaults to the one from settings.
 
     Returns:
         tuple: (list of points, descriptive summary string)
@@ -148,116 +142,279 @@ def build_etap_data(plan, etap, gmaps):
         logger.warning(f"Etap {etap.id} zawiera za mało punktów do wyznaczenia trasy")
         return punkty, "Brak wystarczającej liczby punktów."
 
-    try:
-        latlngs = [f"{p['lat']},{p['lng']}" for p in punkty]
-        directions = gmaps.directions(
-            origin=latlngs[0],
-            destination=latlngs[-1],
-            waypoints=latlngs[1:-1] if len(latlngs) > 2 else None,
-            optimize_waypoints=True,
-            mode="driving"
-        )
-        total_minutes = sum(leg['duration']['value'] for leg in directions[0]['legs']) // 60
-        logger.info(f"Zbudowano dane etapu {etap.id}: {len(punkty)} punktów, szacowany czas: {total_minutes} min")
-        return punkty, f"Szacowany łączny czas przejazdu: {total_minutes} minut"
-    except Exception as e:
-        logger.warning(f"Nie udało się pobrać trasy dla etapu {etap.id}: {e}", exc_info=True)
-        return punkty, "Brak danych o trasie."
+    backend = backend or get_routing_backend(gmaps)
+    znane = backend.known_travel_times(list(zip(punkty, punkty[1:])), mode="driving")
+    if all(czas is not None for czas in znane):
+        total_duration = sum(znane)
+    else:
+        trasa = backend.route(punkty, mode="driving", etap=etap)
+        if trasa is None:
+            logger.warning(f"Nie udało się pobrać trasy dla etapu {etap.id}")
+            return punkty, "Brak danych o trasie."
+        total_duration = trasa['total_duration']
+
+    total_minutes = total_duration // 60
+    logger.info(f"Zbudowano dane etapu {etap.id}: {len(punkty)} punktów, szacowany czas: {total_minutes} min")
+    return punkty, f"Szacowany łączny czas przejazdu: {total_minutes} minut"
+
 
+def build_etap_view(plan, etap, gmaps, backend=None):
+    """
+    Computes everything the plan detail page shows for one etap: points, route
+    summary and the stored static map.
 
-def calculate_route_order(gmaps, punkty):
+    Returns:
+        tuple: (list of points, descriptive summary string, static map key or None)
     """
-    Optimizes the order of visiting points and calculates total travel duration.
+    punkty, dojazd_info = build_etap_data(plan, etap, gmaps, backend=backend)
+    klucz_mapy = build_etap_map(etap, gmaps, plan.adres_startowy, backend=backend)
+    return punkty, dojazd_info, klucz_mapy
+
+
+def build_etap_view_fallback(etap):
+    """
+    Degraded build_etap_view result that needs no network: attraction points only,
+    no route summary and no map.
+    """
+    return build_etap_points(etap, None, with_start=False), "Brak danych o trasie.", None
+
+
+def calculate_route_order(gmaps, punkty, backend=None, time_limit=DEFAULT_TIME_LIMIT):
+    """
+    Optimizes the order of visiting points (first and last point stay in place)
+    with the in-process route optimizer and calculates total travel duration.
 
     Args:
         gmaps (googlemaps.Client): Authenticated Google Maps client.
         punkty (list): List of points with 'lat' and 'lng' values.
+        backend (RoutingBackend): Routing backend; defaults to the one from settings.
+        time_limit (float): Seconds allowed for the optimizer.
 
     Returns:
         tuple: (reordered list of points, total duration in seconds)
     """
-    latlngs = [f"{p['lat']},{p['lng']}" for p in punkty]
-    origin = latlngs[0]
-    destination = latlngs[-1] if len(latlngs) > 1 else latlngs[0]
-    waypoints = latlngs[1:-1] if len(latlngs) > 2 else None
+    if len(punkty) < 2:
+        return punkty, 0
 
+    backend = backend or get_routing_backend(gmaps)
     try:
-        if waypoints:
-            directions = gmaps.directions(
-                origin=origin,
-                destination=destination,
-                waypoints=waypoints,
-                optimize_waypoints=True,
-                mode="driving"
-            )
-            order = directions[0].get('waypoint_order', list(range(len(waypoints))))
-            uporzadkowane = [punkty[0]] + [punkty[i + 1] for i in order] + [punkty[-1]]
-        else:
-            directions = gmaps.directions(
-                origin=origin,
-                destination=destination,
-                mode="driving"
-            )
-            uporzadkowane = punkty
-
-        duration = sum(leg['duration']['value'] for leg in directions[0]['legs'])
-        logger.info(f"Obliczono zoptymalizowaną trasę: {len(uporzadkowane)} punktów, {duration // 60} minut")
-        return uporzadkowane, duration
+        macierz = backend.duration_matrix(punkty, mode="driving")
     except Exception as e:
         logger.error(f"Błąd optymalizacji trasy: {e}", exc_info=True)
         return punkty, 0
 
+    order = optimize_order(macierz, start=0, end=len(punkty) - 1, time_limit=time_limit)
+    uporzadkowane = [punkty[i] for i in order]
+    duration = int(sum(macierz[a][b] for a, b in zip(order, order[1:]) if np.isfinite(macierz[a][b])))
+    logger.info(f"Obliczono zoptymalizowaną trasę: {len(uporzadkowane)} punktów, {duration // 60} minut")
+    return uporzadkowane, duration
 
-def generate_map_and_update_travel_times(plan):
+
+def optimize_etap_order(etap, gmaps, backend=None, mode="driving", time_limit=DEFAULT_TIME_LIMIT):
     """
-    Generates a static route map for all attractions in a plan and updates travel times
-    between attractions.
+    Reorders the attractions of an etap with the in-process route optimizer and
+    writes the result back: kolejnosc, czas_dojazdu and planowana_data (placed within
+    opening hours, see scheduling.schedule_visits).
+
+    The etap's start address (if any) stays the fixed first point; attractions
+    without coordinates are moved to the end in their current order.
 
     Args:
-        plan (Plan): The sightseeing plan to update.
+        etap (EtapPlanu): The etap to reorder.
+        gmaps (googlemaps.Client): Authenticated Google Maps client (start address geocoding).
+        backend (RoutingBackend): Routing backend for the duration matrix.
+        mode (str): Travel mode.
+        time_limit (float): Seconds allowed for the optimizer.
 
     Returns:
-        tuple: (map_url: str, directions: list) or (None, []) on failure.
+        list: The etap's ElementEtapu objects in the new order.
     """
-    gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+    elementy = list(etap.elementy.select_related('atrakcja__lokalizacja').order_by('kolejnosc'))
     punkty = []
-    elementy = []
+    start = None
+    if etap.adres_startowy:
+        lat, lng = geocode_address(etap.adres_startowy, gmaps)
+        if lat is not None and lng is not None:
+            punkty.append((lat, lng))
+            start = 0
+
+    z_lokalizacja, bez_lokalizacji = [], []
+    indeks = {}
+    for el in elementy:
+        lok = getattr(el.atrakcja, 'lokalizacja', None)
+        if lok and lok.szerokosc_geo is not None and lok.dlugosc_geo is not None:
+            indeks[el.id] = len(punkty)
+            punkty.append((lok.szerokosc_geo, lok.dlugosc_geo))
+            z_lokalizacja.append(el)
+        else:
+            bez_lokalizacji.append(el)
+
+    if len(z_lokalizacja) < 2:
+        logger.info(f"Etap {etap.id}: za mało atrakcji z lokalizacją do optymalizacji")
+        return elementy
+
+    backend = backend or get_routing_backend(gmaps)
+    macierz = backend.duration_matrix(punkty, mode=mode)
+    order = optimize_order(macierz, start=start, time_limit=time_limit)
+    po_id = {indeks[el.id]: el for el in z_lokalizacja}
+    nowe = [po_id[i] for i in order if i in po_id] + bez_lokalizacji
+
+    poprzedni = start
+    for pozycja, el in enumerate(nowe, start=1):
+        el.kolejnosc = pozycja
+        biezacy = indeks.get(el.id)
+        if biezacy is None:
+            pass  # no coordinates - keep the stored travel time
+        elif poprzedni is None:
+            el.czas_dojazdu = 0
+        elif np.isfinite(macierz[poprzedni][biezacy]):
+            el.czas_dojazdu = int(round(macierz[poprzedni][biezacy] / 60))
+        poprzedni = biezacy
+
+    terminy = schedule_visits(
+        min(el.planowana_data for el in elementy),
+        [(el.atrakcja, el.czas_wizyty, el.czas_dojazdu) for el in nowe]
+    )
+    for el, (planowana_data, poza_godzinami) in zip(nowe, terminy):
+        el.planowana_data = planowana_data
+        el.poza_godzinami = poza_godzinami
+
+    przesuniecie = max(el.kolejnosc for el in elementy) + len(nowe)
+    with transaction.atomic():
+        # Two passes keep (etap, kolejnosc) unique after every statement.
+        for el in nowe:
+            el.kolejnosc += przesuniecie
+        ElementEtapu.objects.bulk_update(nowe, ['kolejnosc'])
+        for el in nowe:
+            el.kolejnosc -= przesuniecie
+        ElementEtapu.objects.bulk_update(nowe, ['kolejnosc', 'czas_dojazdu', 'planowana_data', 'poza_godzinami'])
+    invalidate_etap_routes(etap.id)
+
+    logger.info(f"Zoptymalizowano kolejność etapu {etap.id} ({len(nowe)} atrakcji)")
+    return nowe
+
+
+def recompute_plan_travel_times(plan, gmaps=None, backend=None, mode="driving"):
+    """
+    Recomputes czas_dojazdu of every attraction in a plan and writes the changes back.
 
-    for etap in plan.etapy.all().order_by('kolejnosc'):
-        for el in etap.elementy.all().order_by('kolejnosc'):
-            lok = el.atrakcja.lokalizacja
-            if lok and lok.szerokosc_geo and lok.dlugosc_geo:
-                punkty.append((lok.szerokosc_geo, lok.dlugosc_geo))
-                elementy.append(el)
+    Legs follow PlanBuilder: the first attraction of an etap is reached from the etap's
+    start address (0 without one), every other one from the previous attraction.
+    The plan is loaded with a single query, all legs are resolved by one
+    travel_times call and the changed rows are written with one bulk_update.
+    Attractions without coordinates (or legs without a known time) keep their
+    stored travel time.
 
-    logger.debug(f"Zebrano {len(punkty)} punktów z planu ID {plan.id}")
+    Args:
+        plan (PlanZwiedzania): The plan to update.
+        gmaps (googlemaps.Client): Client for start address geocoding; defaults to the shared one.
+        backend (RoutingBackend): Routing backend; defaults to the one from settings.
+        mode (str): Travel mode.
+
+    Returns:
+        tuple: (list of the plan's ElementEtapu objects in order, list of changed legs as
+        dicts with 'element', 'etap', 'kolejnosc', 'atrakcja', 'stary' and 'nowy' minutes)
+    """
+    gmaps = gmaps or get_gmaps_client()
+    backend = backend or get_routing_backend(gmaps)
+    elementy = list(
+        ElementEtapu.objects
+        .filter(etap__plan=plan)
+        .select_related('etap', 'atrakcja__lokalizacja')
+        .order_by('etap__kolejnosc', 'kolejnosc')
+    )
+
+    def wspolrzedne(el):
+        lok = getattr(el.atrakcja, 'lokalizacja', None)
+        if lok is None or lok.szerokosc_geo is None or lok.dlugosc_geo is None:
+            return None
+        return lok.szerokosc_geo, lok.dlugosc_geo
+
+    starty = {}
+    odcinki = []
+    # element id -> index of its leg, or None for the first stop of a day without a start address
+    indeksy = {}
+    etap_id = poprzedni = None
+    for el in elementy:
+        biezacy = wspolrzedne(el)
+        if el.etap_id != etap_id:
+            etap_id = el.etap_id
+            adres = el.etap.adres_startowy
+            if not adres:
+                indeksy[el.id] = None
+                poprzedni = biezacy
+                continue
+            if adres not in starty:
+                lat, lng = geocode_address(adres, gmaps)
+                starty[adres] = (lat, lng) if lat is not None and lng is not None else None
+            poprzedni = starty[adres]
+        if poprzedni is not None and biezacy is not None:
+            indeksy[el.id] = len(odcinki)
+            odcinki.append((poprzedni, biezacy))
+        poprzedni = biezacy
+
+    czasy = backend.travel_times(odcinki, mode=mode) if odcinki else []
+
+    zmiany = []
+    for el in elementy:
+        if el.id not in indeksy:
+            continue
+        indeks = indeksy[el.id]
+        if indeks is None:
+            nowy = 0
+        elif czasy[indeks] is None:
+            continue
+        else:
+            nowy = int(round(czasy[indeks] / 60))
+        if el.czas_dojazdu != nowy:
+            zmiany.append({
+                'element': el,
+                'etap': el.etap.kolejnosc,
+                'kolejnosc': el.kolejnosc,
+                'atrakcja': el.atrakcja.nazwa,
+                'stary': el.czas_dojazdu,
+                'nowy': nowy,
+            })
+            el.czas_dojazdu = nowy
+
+    if zmiany:
+        with transaction.atomic():
+            ElementEtapu.objects.bulk_update([z['element'] for z in zmiany], ['czas_dojazdu'])
+    logger.info(
+        f"Przeliczono czasy dojazdu planu {plan.id}: {len(odcinki)} odcinków, {len(zmiany)} zmienionych"
+    )
+    return elementy, zmiany
 
-    if len(punkty) < 2:
-        logger.warning(f"Za mało punktów do wygenerowania trasy dla planu ID {plan.id}")
-        return None, []
 
+def generate_map_and_update_travel_times(plan):
+    """
+    Updates travel times between the attractions of a plan (see recompute_plan_travel_times)
+    and builds a static map URL with all of its attractions.
+
+    Args:
+        plan (Plan): The sightseeing plan to update.
+
+    Returns:
+        tuple: (map_url: str, zmiany: list of changed legs) or (None, []) on failure.
+    """
     try:
-        directions = gmaps.directions(
-            origin=punkty[0],
-            destination=punkty[-1],
-            waypoints=punkty[1:-1] if len(punkty) > 2 else None,
-            mode="driving"
-        )
-
-        if directions and "legs" in directions[0]:
-            legs = directions[0]["legs"]
-            for i, leg in enumerate(legs):
-                if i + 1 < len(elementy):
-                    czas_sec = leg.get("duration", {}).get("value", 0)
-                    elementy[i + 1].czas_dojazdu = round(czas_sec / 60)
-                    elementy[i + 1].save(update_fields=["czas_dojazdu"])
-            logger.info(f"Aktualizacja czasu dojazdu: {len(elementy)} elementów przetworzonych w planie {plan.id}")
+        elementy, zmiany = recompute_plan_travel_times(plan)
     except Exception as e:
-        logger.error(f"Błąd przy pobieraniu trasy w planie {plan.id}: {e}", exc_info=True)
+        logger.error(f"Błąd przy przeliczaniu czasów dojazdu w planie {plan.id}: {e}", exc_info=True)
         return None, []
 
-    map_url = f"https://maps.googleapis.com/maps/api/staticmap?size=800x400&key={settings.GOOGLE_MAPS_API_KEY}"
+    punkty = [
+        (el.atrakcja.lokalizacja.szerokosc_geo, el.atrakcja.lokalizacja.dlugosc_geo)
+        for el in elementy
+        if getattr(el.atrakcja, 'lokalizacja', None)
+        and el.atrakcja.lokalizacja.szerokosc_geo and el.atrakcja.lokalizacja.dlugosc_geo
+    ]
+    if len(punkty) < 2:
+        logger.warning(f"Za mało punktów do wygenerowania trasy dla planu ID {plan.id}")
+        return None, zmiany
+
+    map_url = f"{get_base_url()}/maps/api/staticmap?size=800x400&key={settings.GOOGLE_MAPS_API_KEY}"
     for lat, lng in punkty:
         map_url += f"&markers={lat},{lng}"
 
-    return map_url, directions
+    return map_url, zmiany
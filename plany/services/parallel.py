@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_DEADLINE = 15.0
+DEFAULT_ETAP_TIMEOUT = 10.0
+# How often the waiting loop re-checks per-etap timeouts.
+POLL_INTERVAL = 0.05
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # One bounded pool per worker process; abandoned (timed-out) tasks finish here
+    # in the background and still warm the geocoding/route/static map caches.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PLAN_MAPS_MAX_WORKERS', DEFAULT_MAX_WORKERS),
+                thread_name_prefix='etapy'
+            )
+    return _executor
+
+
+def map_etapy(func, etapy, fallback, deadline=None, timeout=None):
+    """
+    Runs func(etap) for every etap concurrently on the shared thread pool.
+
+    Etapy that raise, exceed the per-etap timeout (counted from when the task started)
+    or are not finished by the overall deadline get fallback(etap) instead, so the
+    caller always receives a result for every etap.
+
+    Args:
+        func (callable): Work for a single etap.
+        etapy (iterable): EtapPlanu objects (related data should already be prefetched).
+        fallback (callable): Cheap degraded result for an etap.
+        deadline (float): Seconds for all etapy together (PLAN_MAPS_DEADLINE).
+        timeout (float): Seconds for a single etap (PLAN_MAPS_ETAP_TIMEOUT).
+
+    Returns:
+        dict: etap.id -> result.
+    """
+    if deadline is None:
+        deadline = getattr(settings, 'PLAN_MAPS_DEADLINE', DEFAULT_DEADLINE)
+    if timeout is None:
+        timeout = getattr(settings, 'PLAN_MAPS_ETAP_TIMEOUT', DEFAULT_ETAP_TIMEOUT)
+
+    etapy = list(etapy)
+    started = {}
+
+    def task(etap):
+        started[etap.id] = time.monotonic()
+        try:
+            return func(etap)
+        finally:
+            # Each pool thread has its own DB connections - don't leave them open.
+            connections.close_all()
+
+    koniec = time.monotonic() + deadline
+    executor = _get_executor()
+    futures = {executor.submit(task, etap): etap for etap in etapy}
+    wyniki = {}
+    pending = set(futures)
+
+    while pending:
+        now = time.monotonic()
+        if now >= koniec:
+            break
+        done, pending = wait(pending, timeout=min(POLL_INTERVAL, koniec - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            etap = futures[future]
+            try:
+                wyniki[etap.id] = future.result()
+            except Exception as e:
+                logger.warning(f"Błąd obliczeń dla etapu {etap.id}: {e}", exc_info=True)
+                wyniki[etap.id] = fallback(etap)
+        now = time.monotonic()
+        for future in list(pending):
+            etap = futures[future]
+            if etap.id in started and now - started[etap.id] > timeout:
+                logger.warning(f"Etap {etap.id} przekroczył limit {timeout} s - wynik zastępczy")
+                wyniki[etap.id] = fallback(etap)
+                pending.discard(future)
+
+    for future in pending:
+        etap = futures[future]
+        future.cancel()
+        logger.warning(f"Etap {etap.id} nie zdążył przed terminem {deadline} s - wynik zastępczy")
+        wyniki[etap.id] = fallback(etap)
+
+    return wyniki
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template
+
+from .pdf_generator import PDF_STYLESHEET, PDF_TEMPLATE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_evict_lock = threading.Lock()
+_template_digest = None
+
+
+def pdf_cache_dir():
+    """Returns the directory of the PDF store (PDF_CACHE_DIR or BASE_DIR/pdf_planow)."""
+    katalog = getattr(settings, 'PDF_CACHE_DIR', None) or Path(settings.BASE_DIR) / 'pdf_planow'
+    return Path(katalog)
+
+
+def _template_source_digest():
+    # A changed PDF template or stylesheet must not serve PDFs rendered from the old one.
+    global _template_digest
+    if _template_digest is None:
+        zrodlo = getattr(get_template(PDF_TEMPLATE).template, 'source', '')
+        _template_digest = hashlib.sha256(zrodlo.encode("utf-8") + PDF_STYLESHEET.read_bytes()).hexdigest()
+    return _template_digest
+
+
+def plan_pdf_key(plan, klucze_map):
+    """
+    Builds the content address of a plan PDF from everything the PDF template shows.
+
+    Args:
+        plan (PlanZwiedzania): Plan with prefetched etapy__elementy__atrakcja.
+        klucze_map (dict): etap_id -> static map key (or None) used for the etap.
+
+    Returns:
+        str: Hex SHA-256 digest of the plan content, map keys, PDF template and stylesheet.
+    """
+    etapy = [
+        [
+            etap.id, etap.kolejnosc, etap.nazwa, klucze_map.get(etap.id) or "",
+            [
+                [el.kolejnosc, el.atrakcja.nazwa, el.czas_wizyty, el.czas_dojazdu]
+                for el in etap.elementy.all()
+            ],
+        ]
+        for etap in plan.etapy.all()
+    ]
+    payload = json.dumps([_template_source_digest(), plan.id, plan.nazwa, plan.opis, etapy], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def pdf_cache_path(klucz):
+    """
+    Returns the file path of a stored PDF.
+
+    Raises:
+        ValueError: If the key is not a SHA-256 hex digest.
+    """
+    if not KEY_RE.match(klucz or ""):
+        raise ValueError(f"Nieprawidłowy klucz PDF: {klucz!r}")
+    return pdf_cache_dir() / f"{klucz}.pdf"
+
+
+def get_cached_pdf(klucz):
+    """
+    Returns the path of a stored PDF and marks it as recently used.
+
+    Returns:
+        Path or None: Path of the PDF, or None if it is not stored.
+    """
+    path = pdf_cache_path(klucz)
+    try:
+        st = path.stat()
+        # Recency is the access time, set explicitly; mtime stays the render time (Last-Modified).
+        os.utime(path, (time.time(), st.st_mtime))
+    except FileNotFoundError:
+        return None
+    except OSError:
+        pass
+    logger.debug(f"PDF z pamięci podręcznej: {klucz}")
+    return path
+
+
+def reserve_pdf_file():
+    """
+    Creates an empty temporary file in the PDF store for a render to write into
+    (the same filesystem, so store_pdf_file can move it into place atomically).
+
+    Returns:
+        Path: Path of the temporary file.
+    """
+    katalog = pdf_cache_dir()
+    katalog.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=katalog, suffix=".tmp")
+    os.close(fd)
+    return Path(tmp)
+
+
+def store_pdf_file(klucz, tmp):
+    """
+    Moves a PDF rendered into a file from reserve_pdf_file under its key.
+
+    Returns:
+        Path: Path of the stored PDF.
+    """
+    path = pdf_cache_path(klucz)
+    os.replace(tmp, path)
+    logger.debug(f"Zapisano PDF {klucz} ({path.stat().st_size} B)")
+    evict_pdfs()
+    return path
+
+
+def evict_pdfs(max_bytes=None):
+    """
+    Deletes least recently used PDFs until the store fits in PDF_CACHE_MAX_BYTES.
+
+    Returns:
+        int: Number of deleted files.
+    """
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'PDF_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+    katalog = pdf_cache_dir()
+    if not katalog.is_dir():
+        return 0
+
+    with _evict_lock:
+        pliki = []
+        total = 0
+        for entry in os.scandir(katalog):
+            if entry.is_file() and entry.name.endswith(".pdf"):
+                st = entry.stat()
+                pliki.append((st.st_atime, st.st_size, entry.path))
+                total += st.st_size
+        if total <= max_bytes:
+            return 0
+
+        usuniete = 0
+        for _, size, path in sorted(pliki):
+            if total <= max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                usuniete += 1
+            except FileNotFoundError:
+                pass
+    logger.info(f"Usunięto {usuniete} plików PDF (limit {max_bytes} B)")
+    return usuniete
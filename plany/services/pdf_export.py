@@ -0,0 +1,140 @@
+import io
+import logging
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.utils.text import slugify
+
+from plany.models import PlanZwiedzania
+from .pdf_generator import render_plan_html
+from .pdf_jobs import load_plan_for_pdf, prepare_plan_pdf, render_plan_pdf_file
+
+logger = logging.getLogger(__name__)
+
+ERRORS_ENTRY = "BLEDY.txt"
+
+
+class _ZipStream(io.RawIOBase):
+    """Write-only, non-seekable sink for zipfile; what was written is taken out chunk by chunk."""
+
+    def __init__(self):
+        self._dane = bytearray()
+        self._pozycja = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dane):
+        self._dane += dane
+        self._pozycja += len(dane)
+        return len(dane)
+
+    def tell(self):
+        return self._pozycja
+
+    def take(self):
+        dane = bytes(self._dane)
+        self._dane.clear()
+        return dane
+
+
+class PlanZipExporter:
+    """
+    Service class exporting many plans as one ZIP of PDFs, streamed as it is built.
+
+    Plans are prepared one after another in the calling thread (route snapshots, static
+    maps and geocoding go through the shared DB/disk caches, so stops repeated across
+    plans are computed once), while their PDFs render in parallel, each in its own
+    resource-limited process (render_plan_pdf_file). Every PDF is added to the ZIP as
+    soon as it is ready; PDFs already in the PDF cache are not rendered at all.
+
+    Attributes:
+        plan_ids (list): IDs of the plans to export.
+        gmaps (googlemaps.Client): Google Maps client for outdated routes.
+        base_url (str): Absolute base URL used to resolve static/media files in the HTML.
+        procesy (int): Number of concurrent renders (defaults to the number of CPUs).
+        gotowe (int): PDFs added to the ZIP so far.
+        z_pamieci (int): Of those, PDFs taken from the PDF cache.
+        bledy (dict): plan_id -> error message of plans left out.
+    """
+
+    def __init__(self, plan_ids, gmaps, base_url, procesy=None):
+        self.plan_ids = list(plan_ids)
+        self.gmaps = gmaps
+        self.base_url = base_url
+        self.procesy = procesy or os.cpu_count() or 1
+        self.gotowe = 0
+        self.z_pamieci = 0
+        self.bledy = {}
+
+    def __iter__(self):
+        """Yields the ZIP file in chunks; each chunk ends after a whole PDF entry."""
+        strumien = _ZipStream()
+        with zipfile.ZipFile(strumien, 'w', compression=zipfile.ZIP_STORED) as archiwum:
+            with ThreadPoolExecutor(max_workers=self.procesy, thread_name_prefix='pdf') as pula:
+                w_toku = {}
+                for plan_id in self.plan_ids:
+                    zadanie = self._prepare(plan_id)
+                    if zadanie is None:
+                        continue
+                    nazwa, klucz, html_string, sciezka = zadanie
+                    if sciezka is not None:
+                        self.z_pamieci += 1
+                        self._add(archiwum, plan_id, nazwa, sciezka)
+                        yield strumien.take()
+                    else:
+                        w_toku[pula.submit(render_plan_pdf_file, klucz, html_string, self.base_url)] = (plan_id, nazwa)
+                    # Pick up renders that finished meanwhile, without waiting for the rest.
+                    gotowe, _ = wait(w_toku, timeout=0)
+                    for przyszlosc in gotowe:
+                        self._finish(archiwum, przyszlosc, *w_toku.pop(przyszlosc))
+                        yield strumien.take()
+
+                while w_toku:
+                    gotowe, _ = wait(w_toku, return_when=FIRST_COMPLETED)
+                    for przyszlosc in gotowe:
+                        self._finish(archiwum, przyszlosc, *w_toku.pop(przyszlosc))
+                        yield strumien.take()
+
+            if self.bledy:
+                archiwum.writestr(
+                    ERRORS_ENTRY, "".join(f"Plan {plan_id}: {blad}\n" for plan_id, blad in self.bledy.items())
+                )
+        yield strumien.take()
+        logger.info(
+            f"Eksport ZIP: {self.gotowe} planów ({self.z_pamieci} z pamięci podręcznej), {len(self.bledy)} błędów"
+        )
+
+    def _prepare(self, plan_id):
+        try:
+            plan = load_plan_for_pdf(plan_id)
+            klucz, mapy_etapow, sciezka = prepare_plan_pdf(plan, self.gmaps)
+            html_string = render_plan_html(plan, mapy_etapow) if sciezka is None else None
+        except PlanZwiedzania.DoesNotExist:
+            self.bledy[plan_id] = "Nie znaleziono planu"
+            return None
+        except Exception as e:
+            logger.error(f"Błąd przygotowania PDF planu {plan_id} do eksportu ZIP: {e}", exc_info=True)
+            self.bledy[plan_id] = str(e)
+            return None
+        nazwa = f"plan_{plan.id}_{slugify(plan.nazwa) or 'plan'}.pdf"
+        return nazwa, klucz, html_string, sciezka
+
+    def _finish(self, archiwum, przyszlosc, plan_id, nazwa):
+        try:
+            sciezka = przyszlosc.result()
+        except Exception as e:
+            logger.warning(f"Nie udało się wygenerować PDF planu {plan_id} do eksportu ZIP: {e}")
+            self.bledy[plan_id] = str(e)
+            return
+        self._add(archiwum, plan_id, nazwa, sciezka)
+
+    def _add(self, archiwum, plan_id, nazwa, sciezka):
+        try:
+            archiwum.write(sciezka, nazwa)
+        except FileNotFoundError:
+            # Evicted between rendering and zipping - only under a very small PDF_CACHE_MAX_BYTES.
+            self.bledy[plan_id] = "Plik PDF usunięty z pamięci podręcznej"
+            return
+        self.gotowe += 1
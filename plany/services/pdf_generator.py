@@ -1,39 +1,159 @@
 import logging
+import multiprocessing
+import os
+import signal
+from pathlib import Path
 from django.template.loader import render_to_string
-from django.http import HttpResponse
-from weasyprint import HTML
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+try:
+    import resource
+except ImportError:  # Windows - the render still runs in its own process, only without rlimits
+    resource = None
 
 logger = logging.getLogger(__name__)
 
-def render_plan_to_pdf(plan, mapy_etapow, base_url):
+# Exit code of a render process that ran out of its memory limit.
+EXIT_OUT_OF_MEMORY = 3
+
+PDF_TEMPLATE = 'plany/plan_pdf.html'
+PDF_STYLESHEET = Path(__file__).resolve().parent.parent / 'static' / 'plany' / 'plan_pdf.css'
+# Small document with the elements and characters of a plan, laid out once to load the fonts.
+WARM_UP_HTML = "<h1>Plan zwiedzania</h1><h2>1. Etap</h2><p class='meta'>Zażółć gęślą jaźń</p><ul><li>1.</li></ul>"
+
+_context = None
+_renderer = None
+
+
+class PrzekroczonyLimitRenderowania(Exception):
+    """Raised when an isolated PDF render exceeds its memory or time limit."""
+
+class PdfRenderer:
     """
-    Renders a sightseeing plan into a downloadable PDF file using WeasyPrint.
+    Long-lived WeasyPrint renderer: fonts are discovered once (FontConfiguration) and the
+    plan stylesheet is parsed once, instead of on every render.
+
+    Attributes:
+        font_config (FontConfiguration): Fonts shared by all renders.
+        stylesheet (CSS): Parsed PDF_STYLESHEET.
+    """
+
+    def __init__(self, stylesheet=PDF_STYLESHEET):
+        self.font_config = FontConfiguration()
+        self.stylesheet = CSS(filename=str(stylesheet), font_config=self.font_config)
+
+    def warm_up(self):
+        """Lays out a small document so the fonts used by the stylesheet are loaded before the first real render."""
+        self.write_pdf(WARM_UP_HTML, None)
+
+    def write_pdf(self, html_string, base_url, target=None):
+        """
+        Renders HTML to PDF with the shared fonts and stylesheet.
+
+        Args:
+            html_string (str): HTML document (see render_plan_html).
+            base_url (str): Absolute base URL used to resolve static/media files in the HTML.
+            target (str): Path of the PDF file to write; None returns the PDF as bytes.
+
+        Returns:
+            bytes or None: The PDF if no target was given.
+        """
+        return HTML(string=html_string, base_url=base_url).write_pdf(
+            target, stylesheets=[self.stylesheet], font_config=self.font_config
+        )
+
+def get_renderer():
+    """Returns the renderer of this process, creating and warming it up on first use."""
+    global _renderer
+    if _renderer is None:
+        _renderer = PdfRenderer()
+        _renderer.warm_up()
+    return _renderer
+
+def render_plan_html(plan, mapy_etapow):
+    """
+    Renders the HTML of a plan PDF.
 
     Args:
         plan (PlanZwiedzania): The sightseeing plan instance to render.
-        mapy_etapow (dict): A dictionary of etap_id -> map image URLs (or paths).
-        base_url (str): Absolute base URL used to resolve static/media files in the HTML.
+        mapy_etapow (dict): A dictionary of etap_id -> map image URLs (file:// URIs of stored static maps).
 
     Returns:
-        HttpResponse: A response containing the generated PDF file.
+        str: HTML document for WeasyPrint.
     """
+    return render_to_string(PDF_TEMPLATE, {
+        'plan': plan,
+        'mapy_etapow': mapy_etapow,
+        'etap_info': {},  
+    })
+
+def _address_space():
+    # Bytes mapped by this process; a forked render inherits all of its parent's mappings
+    # (thread stacks, malloc arenas), which must not count against the render's own budget.
     try:
-        logger.debug(f"Rozpoczynam renderowanie PDF dla planu ID {plan.id}")
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except OSError:
+        return 0
 
-        html_string = render_to_string('plany/plan_pdf.html', {
-            'plan': plan,
-            'mapy_etapow': mapy_etapow,
-            'etap_info': {},  
-        })
+def _write_pdf_limited(html_string, base_url, sciezka, limit_pamieci, limit_czasu):
+    # Entry point of the render process: nothing here touches the database or Django settings.
+    if resource is not None:
+        if limit_pamieci:
+            limit = _address_space() + limit_pamieci
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if limit_czasu:
+            resource.setrlimit(resource.RLIMIT_CPU, (limit_czasu, limit_czasu + 1))
+    try:
+        get_renderer().write_pdf(html_string, base_url, target=sciezka)
+    except MemoryError:
+        os._exit(EXIT_OUT_OF_MEMORY)
 
-        pdf_file = HTML(string=html_string, base_url=base_url).write_pdf()
+def _render_context():
+    # Render processes come from a fork server that has a warmed-up renderer (pdf_preload):
+    # a cheap fork of a small single-threaded process, instead of a copy of the (possibly
+    # multi-threaded) caller, and no font discovery or stylesheet parsing per render.
+    global _context
+    if _context is None:
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            _context = multiprocessing.get_context('forkserver')
+            _context.set_forkserver_preload(['plany.services.pdf_preload'])
+        else:
+            _context = multiprocessing.get_context()
+    return _context
 
-        response = HttpResponse(pdf_file, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="plan_{plan.id}.pdf"'
+def render_pdf_isolated(html_string, base_url, sciezka, limit_pamieci=None, limit_czasu=None):
+    """
+    Renders a PDF with WeasyPrint in a separate process limited in memory (RLIMIT_AS)
+    and CPU time (RLIMIT_CPU, plus a wall-clock deadline), writing it to a file.
+    A pathological document kills only that process, never the calling worker.
 
-        logger.info(f"Wygenerowano PDF dla planu ID {plan.id}")
-        return response
+    Args:
+        html_string (str): HTML document (see render_plan_html).
+        base_url (str): Absolute base URL used to resolve static/media files in the HTML.
+        sciezka (str): Path of the PDF file to write.
+        limit_pamieci (int): Memory the render may map on top of what it inherits, in bytes.
+        limit_czasu (int): CPU and wall-clock time limit in seconds.
 
-    except Exception as e:
-        logger.error(f"Błąd podczas generowania PDF dla planu ID {plan.id}: {e}", exc_info=True)
-        return HttpResponse("Błąd podczas generowania PDF.", status=500)
+    Raises:
+        PrzekroczonyLimitRenderowania: If the render ran out of memory or time.
+        RuntimeError: If the render process failed otherwise.
+    """
+    proces = _render_context().Process(
+        target=_write_pdf_limited, args=(html_string, base_url, str(sciezka), limit_pamieci, limit_czasu), daemon=True
+    )
+    proces.start()
+    proces.join(limit_czasu * 2 if limit_czasu else None)
+    if proces.is_alive():
+        proces.kill()
+        proces.join()
+        raise PrzekroczonyLimitRenderowania(f"Renderowanie PDF przekroczyło limit czasu ({limit_czasu} s)")
+    if proces.exitcode == EXIT_OUT_OF_MEMORY:
+        raise PrzekroczonyLimitRenderowania(f"Renderowanie PDF przekroczyło limit pamięci ({limit_pamieci} B)")
+    if proces.exitcode == -getattr(signal, 'SIGXCPU', 0):
+        raise PrzekroczonyLimitRenderowania(f"Renderowanie PDF przekroczyło limit czasu procesora ({limit_czasu} s)")
+    if proces.exitcode and proces.exitcode < 0:
+        raise PrzekroczonyLimitRenderowania(f"Proces renderowania PDF zakończony sygnałem {-proces.exitcode}")
+    if proces.exitcode:
+        raise RuntimeError(f"Proces renderowania PDF zakończony kodem {proces.exitcode}")
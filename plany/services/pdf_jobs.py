@@ -0,0 +1,238 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils.timezone import now
+
+from plany.models import PlanZwiedzania, ZadanieEksportuPdf
+from .jobs import claim_due_jobs, claimed_job
+from .parallel import map_etapy
+from .pdf_cache import get_cached_pdf, plan_pdf_key, reserve_pdf_file, store_pdf_file
+from .pdf_generator import PrzekroczonyLimitRenderowania, render_pdf_isolated, render_plan_html
+from .routing import get_routing_backend
+from .snapshots import etap_view, valid_snapshot
+from .static_maps import static_map_file_uri
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 2
+DEFAULT_MAX_ATTEMPTS = 2
+DEFAULT_RETRY_DELAY = 10
+DEFAULT_LEASE = 300
+DEFAULT_MEMORY_LIMIT_MB = 1024
+DEFAULT_TIME_LIMIT = 60
+
+Status = ZadanieEksportuPdf.Status
+
+
+def load_plan_for_pdf(plan_id):
+    """Returns a plan with everything the PDF and its route snapshots need prefetched."""
+    return PlanZwiedzania.objects.prefetch_related(
+        'etapy__elementy__atrakcja__lokalizacja', 'etapy__trasa_etapu'
+    ).get(id=plan_id)
+
+
+def stored_pdf(plan):
+    """
+    Returns the stored PDF of a plan if every etap has an up-to-date route snapshot and
+    a PDF of exactly this content was rendered before - without any API call or render.
+
+    Args:
+        plan (PlanZwiedzania): Plan from load_plan_for_pdf.
+
+    Returns:
+        tuple or None: (klucz, path) of the stored PDF, or None.
+    """
+    klucze_map = {}
+    for etap in plan.etapy.all():
+        trasa = valid_snapshot(etap)
+        if trasa is None:
+            return None
+        klucze_map[etap.id] = trasa.klucz_mapy
+    klucz = plan_pdf_key(plan, klucze_map)
+    sciezka = get_cached_pdf(klucz)
+    return (klucz, sciezka) if sciezka is not None else None
+
+
+def prepare_plan_pdf(plan, gmaps):
+    """
+    Collects the static maps of a plan PDF, recomputing outdated route snapshots
+    concurrently, and looks the PDF up in the cache.
+
+    Args:
+        plan (PlanZwiedzania): Plan from load_plan_for_pdf.
+        gmaps (googlemaps.Client): Client used for start address geocoding.
+
+    Returns:
+        tuple: (klucz, mapy_etapow, path) - path of the stored PDF, or None if it has to be rendered.
+    """
+    klucze_map = {}
+    do_obliczenia = []
+    for etap in plan.etapy.all():
+        trasa = valid_snapshot(etap)
+        if trasa is not None:
+            klucze_map[etap.id] = trasa.klucz_mapy
+        else:
+            do_obliczenia.append(etap)
+    if do_obliczenia:
+        backend = get_routing_backend(gmaps)
+        klucze_map.update(map_etapy(
+            lambda etap: etap_view(etap, gmaps, backend=backend)[2],
+            do_obliczenia,
+            fallback=lambda etap: None
+        ))
+
+    klucz = plan_pdf_key(plan, klucze_map)
+    mapy_etapow = {
+        etap_id: static_map_file_uri(klucz_mapy)
+        for etap_id, klucz_mapy in klucze_map.items() if klucz_mapy
+    }
+    return klucz, mapy_etapow, get_cached_pdf(klucz)
+
+
+def render_plan_pdf_file(klucz, html_string, base_url):
+    """
+    Renders a PDF into the cache in a separate process limited by
+    PDF_RENDER_MEMORY_LIMIT_MB and PDF_RENDER_TIME_LIMIT. Uses no database, so
+    several renders can run from threads at once.
+
+    Args:
+        klucz (str): Key from prepare_plan_pdf.
+        html_string (str): HTML from render_plan_html.
+        base_url (str): Absolute base URL used to resolve static/media files in the HTML.
+
+    Returns:
+        Path: Path of the stored PDF.
+
+    Raises:
+        PrzekroczonyLimitRenderowania: If the render ran out of memory or time.
+    """
+    tmp = reserve_pdf_file()
+    try:
+        render_pdf_isolated(
+            html_string, base_url, tmp,
+            limit_pamieci=getattr(settings, 'PDF_RENDER_MEMORY_LIMIT_MB', DEFAULT_MEMORY_LIMIT_MB) * 1024 * 1024,
+            limit_czasu=getattr(settings, 'PDF_RENDER_TIME_LIMIT', DEFAULT_TIME_LIMIT),
+        )
+        return store_pdf_file(klucz, tmp)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def build_plan_pdf(plan, gmaps, base_url):
+    """
+    Returns the stored PDF of a plan, rendering it first if needed
+    (see prepare_plan_pdf and render_plan_pdf_file).
+
+    Args:
+        plan (PlanZwiedzania): Plan from load_plan_for_pdf.
+        gmaps (googlemaps.Client): Client used for start address geocoding.
+        base_url (str): Absolute base URL used to resolve static/media files in the HTML.
+
+    Returns:
+        tuple: (klucz, path) of the stored PDF.
+
+    Raises:
+        PrzekroczonyLimitRenderowania: If the render ran out of memory or time.
+    """
+    klucz, mapy_etapow, sciezka = prepare_plan_pdf(plan, gmaps)
+    if sciezka is None:
+        sciezka = render_plan_pdf_file(klucz, render_plan_html(plan, mapy_etapow), base_url)
+        logger.info(f"Wygenerowano PDF dla planu ID {plan.id} ({sciezka.stat().st_size} B)")
+    return klucz, sciezka
+
+
+def enqueue_pdf_export(plan, user, base_url):
+    """
+    Queues rendering of a plan PDF, reusing the user's export of the plan that is
+    still pending or running.
+
+    Returns:
+        ZadanieEksportuPdf: The queued job.
+    """
+    zadanie = ZadanieEksportuPdf.objects.filter(
+        plan=plan, uzytkownik=user, status__in=[Status.OCZEKUJACE, Status.W_TOKU]
+    ).first()
+    if zadanie is not None:
+        return zadanie
+    zadanie = ZadanieEksportuPdf.objects.create(
+        plan=plan, uzytkownik=user, base_url=base_url[:500], nastepna_proba=now()
+    )
+    logger.info(f"Dodano zadanie eksportu PDF {zadanie.id} planu {plan.id} dla użytkownika {user.username}")
+    return zadanie
+
+
+def claim_pdf_jobs(limit=DEFAULT_BATCH_SIZE, lease=None):
+    """
+    Claims due PDF export jobs for this worker (see jobs.claim_due_jobs).
+
+    Returns:
+        list: Claimed ZadanieEksportuPdf objects (status W_TOKU).
+    """
+    if lease is None:
+        lease = getattr(settings, 'PDF_RENDER_JOB_LEASE', DEFAULT_LEASE)
+    return claim_due_jobs(ZadanieEksportuPdf, limit, lease)
+
+
+def run_pdf_job(zadanie, gmaps):
+    """
+    Renders the PDF of a claimed job into the PDF cache.
+
+    A render over its memory or time limit ends the job with an error straight away
+    (it would fail again); other failures are retried with exponential backoff until
+    PDF_RENDER_JOB_MAX_ATTEMPTS is reached.
+
+    Returns:
+        str: 'zakonczone', 'ponowione', 'bledy' or 'przejete' (another worker took the job over).
+    """
+    try:
+        plan = load_plan_for_pdf(zadanie.plan_id)
+        klucz, mapy_etapow, sciezka = prepare_plan_pdf(plan, gmaps)
+        if sciezka is None:
+            # Renew the lease for the render, unless the job was taken over while routes were computed.
+            lease = getattr(settings, 'PDF_RENDER_JOB_LEASE', DEFAULT_LEASE)
+            if not claimed_job(ZadanieEksportuPdf, zadanie).update(zablokowane_do=now() + timedelta(seconds=lease)):
+                logger.info(f"Zadanie eksportu PDF {zadanie.id} przejęte przez innego pracownika")
+                return 'przejete'
+            sciezka = render_plan_pdf_file(klucz, render_plan_html(plan, mapy_etapow), zadanie.base_url)
+            logger.info(f"Wygenerowano PDF dla planu ID {plan.id} ({sciezka.stat().st_size} B)")
+    except PrzekroczonyLimitRenderowania as e:
+        claimed_job(ZadanieEksportuPdf, zadanie).update(
+            status=Status.BLAD, zablokowane_do=None, blad=str(e)[:2000]
+        )
+        logger.warning(f"Zadanie eksportu PDF {zadanie.id} (plan {zadanie.plan_id}) przerwane: {e}")
+        return 'bledy'
+    except Exception as e:
+        logger.error(f"Błąd eksportu PDF w zadaniu {zadanie.id}: {e}", exc_info=True)
+        if zadanie.liczba_prob >= getattr(settings, 'PDF_RENDER_JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS):
+            zmiany = {'status': Status.BLAD}
+            wynik = 'bledy'
+        else:
+            opoznienie = getattr(settings, 'PDF_RENDER_JOB_RETRY_DELAY', DEFAULT_RETRY_DELAY) * 2 ** (zadanie.liczba_prob - 1)
+            zmiany = {'status': Status.OCZEKUJACE, 'nastepna_proba': now() + timedelta(seconds=opoznienie)}
+            wynik = 'ponowione'
+        claimed_job(ZadanieEksportuPdf, zadanie).update(
+            zablokowane_do=None, blad=str(e)[:2000], **zmiany
+        )
+        return wynik
+
+    claimed_job(ZadanieEksportuPdf, zadanie).update(
+        status=Status.ZAKONCZONE, klucz=klucz, zablokowane_do=None, blad=''
+    )
+    logger.info(f"Zadanie eksportu PDF {zadanie.id} zakończone: plan {zadanie.plan_id}")
+    return 'zakonczone'
+
+
+def job_status(zadanie):
+    """
+    Returns the state of a PDF export job as shown to the polling export page.
+
+    Returns:
+        dict: 'status' (label), 'kod', 'blad' and 'gotowe' (the PDF can be downloaded).
+    """
+    return {
+        'status': zadanie.get_status_display(),
+        'kod': zadanie.status,
+        'blad': zadanie.blad if zadanie.status == Status.BLAD else '',
+        'gotowe': zadanie.status == Status.ZAKONCZONE,
+    }
@@ -0,0 +1,5 @@
+# Preloaded by the PDF render fork server (pdf_generator._render_context): every render process
+# forked from it starts with the fonts discovered and the plan stylesheet parsed.
+from .pdf_generator import get_renderer
+
+get_renderer()
@@ -1,8 +1,12 @@
-from datetime import timedelta
 from django.utils.timezone import now
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.http import Http404
 from atrakcje.models import Atrakcja
 from plany.models import PlanZwiedzania, PlanUzytkownika, EtapPlanu, ElementEtapu
+from plany.services.day_assignment import MAX_DAYS, assign_days
+from plany.services.geocoding import geocode
+from plany.services.routing import get_routing_backend
+from plany.services.scheduling import day_start, schedule_visits
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,12 +23,18 @@ class PlanBuilder:
         nazwa (str): Name of the plan.
         adres_startowy (str): Optional fallback starting address.
         przypisane_atrakcje (dict): Mapping of day -> list of attraction IDs.
-        gmaps (googlemaps.Client): Google Maps client for travel time calculation.
+        liczba_dni (int): If given, przypisane_atrakcje is ignored and the cart is split into
+            this many days automatically (see day_assignment.assign_days).
+        gmaps (googlemaps.Client): Google Maps client for geocoding.
         starty (dict): Mapping of day -> custom start address for that day.
+        backend (RoutingBackend): Routing backend for travel times (defaults to settings.ROUTING_BACKEND).
+        postep (callable): Optional callback(procent, opis) reporting build progress;
+            an exception raised from it aborts the build before anything is written.
         plan (PlanZwiedzania): The created sightseeing plan.
     """
 
-    def __init__(self, user, koszyk_ids, nazwa, adres_startowy, przypisane_atrakcje, gmaps, starty=None):
+    def __init__(self, user, koszyk_ids, nazwa, adres_startowy, przypisane_atrakcje, gmaps, starty=None, backend=None, postep=None,
+                 liczba_dni=None):
         self.user = user
         self.koszyk_ids = koszyk_ids
         self.nazwa = nazwa or f"Plan {user.username}"
@@ -32,13 +42,27 @@ class PlanBuilder:
         self.przypisane_atrakcje = przypisane_atrakcje
         self.gmaps = gmaps
         self.starty = starty or {}
+        self.backend = backend or get_routing_backend(gmaps)
+        self.postep = postep
+        self.liczba_dni = liczba_dni
         self.plan = None
 
     def build(self):
+        """
+        Builds and saves the plan. Attractions, start points and travel times are resolved
+        first; all rows are then written in one transaction with a constant number of
+        queries, so a failed build leaves nothing behind.
+
+        Raises:
+            Http404: If an assigned attraction does not exist.
+        """
         logger.info(f"Rozpoczynam budowę planu dla użytkownika {self.user.username}")
-        self._create_plan()
-        self._assign_user()
-        self._create_etapy_and_elements()
+        dni = self._prepare_days()
+        self._report(90, "Zapisywanie planu")
+        with transaction.atomic():
+            self._create_plan()
+            self._assign_user()
+            self._create_etapy_and_elements(dni)
         logger.info(f"Zakończono budowę planu (ID: {self.plan.id})")
         return self.plan
 
@@ -51,8 +75,12 @@ class PlanBuilder:
         )
         logger.debug(f"Utworzono plan: '{self.nazwa}' (ID: {self.plan.id})")
 
+    def _report(self, procent, opis):
+        if self.postep:
+            self.postep(procent, opis)
+
     def _assign_user(self):
-        # Link the user as the plan's owner
+        # Link the plan to the user
         PlanUzytkownika.objects.create(
             uzytkownik=self.user,
             plan=self.plan,
@@ -60,93 +88,165 @@ class PlanBuilder:
         )
         logger.debug(f"Przypisano użytkownika {self.user.username} jako właściciela planu ID {self.plan.id}")
 
-    def _create_etapy_and_elements(self):
-        # Start time for first day's schedule
-        czas_start = now()
+    def _prepare_days(self):
+        """
+        Resolves attractions (one query), start points and the travel times of every leg
+        (one travel_times batch) before anything is written.
 
-        # Process each day's attractions
-        for dzien, atrakcje_ids in sorted(self.przypisane_atrakcje.items()):
+        Returns:
+            list: (day, start address, [(atrakcja, czas_dojazdu in minutes)]) per day.
+        """
+        if self.liczba_dni:
+            wszystkie_ids = list(self.koszyk_ids)
+        else:
+            wszystkie_ids = [a for ids in self.przypisane_atrakcje.values() for a in ids]
+        atrakcje = Atrakcja.objects.select_related('lokalizacja').in_bulk(wszystkie_ids)
+        brakujace = set(wszystkie_ids) - set(atrakcje)
+        if brakujace:
+            raise Http404(f"Nie znaleziono atrakcji: {sorted(brakujace)}")
+        if self.liczba_dni:
+            self._report(5, "Przydzielanie atrakcji do dni")
+            self.przypisane_atrakcje = self._assign_days([atrakcje[a] for a in dict.fromkeys(wszystkie_ids)])
+
+        dni = []
+        odcinki = []
+        liczba_dni = len(self.przypisane_atrakcje)
+        for numer, (dzien, atrakcje_ids) in enumerate(sorted(self.przypisane_atrakcje.items())):
+            self._report(10 + 50 * numer // liczba_dni, f"Wyznaczanie punktów: dzień {dzien}")
             # Determine start address for this day
             adres_etapu = self.starty.get(dzien) or (self.adres_startowy if dzien == 1 else None)
 
-            # Create the EtapPlanu instance
-            etap = EtapPlanu.objects.create(
-                plan=self.plan,
-                nazwa=f"Dzień {dzien}",
-                kolejnosc=dzien,
-                adres_startowy=adres_etapu
-            )
-            logger.debug(f"Utworzono etap {etap.nazwa} (ID: {etap.id}) z {len(atrakcje_ids)} atrakcji")
-
             # Geocode start location
             poprzednia_lokalizacja = self._geocode_address(adres_etapu) if adres_etapu else None
 
-            for kolejnosc, atrakcja_id in enumerate(atrakcje_ids, start=1):
-                # Get attraction with location
-                atrakcja = get_object_or_404(Atrakcja.objects.select_related('lokalizacja'), id=atrakcja_id)
-
-                # Calculate travel time from previous location
-                czas_dojazdu = self._calculate_travel_time(poprzednia_lokalizacja, atrakcja)
+            pozycje = []
+            for atrakcja_id in atrakcje_ids:
+                atrakcja = atrakcje[atrakcja_id]
+                pozycje.append((atrakcja, self._register_leg(odcinki, poprzednia_lokalizacja, atrakcja)))
+                poprzednia_lokalizacja = getattr(atrakcja, 'lokalizacja', None)
+            dni.append((dzien, adres_etapu, pozycje))
+
+        # All legs of the plan in one batch (as few Distance Matrix requests as possible for Google)
+        self._report(60, "Obliczanie czasów dojazdu")
+        czasy = self.backend.travel_times(odcinki)
+        return [
+            (dzien, adres_etapu, [(atrakcja, self._travel_time_minutes(odcinek, czasy, atrakcja))
+                                  for atrakcja, odcinek in pozycje])
+            for dzien, adres_etapu, pozycje in dni
+        ]
+
+    def _assign_days(self, atrakcje):
+        """
+        Splits the cart into self.liczba_dni days by location, each day ordered
+        from its start point.
 
-                # Add attraction to etap
-                ElementEtapu.objects.create(
+        Returns:
+            dict: Mapping of day -> ordered list of attraction IDs.
+        """
+        # Never more days than attractions; the bound also covers jobs queued before validation.
+        liczba_dni = max(1, min(self.liczba_dni, MAX_DAYS, len(atrakcje)))
+        starty = {}
+        for dzien in range(1, liczba_dni + 1):
+            adres = self.starty.get(dzien) or (self.adres_startowy if dzien == 1 else None)
+            lokalizacja = self._geocode_address(adres) if adres else None
+            if lokalizacja:
+                starty[dzien] = (lokalizacja.szerokosc_geo, lokalizacja.dlugosc_geo)
+        return assign_days(atrakcje, liczba_dni, starty=starty)
+
+    def _create_etapy_and_elements(self, dni):
+        # The first day starts now, the following ones in the morning of the next dates
+        poczatek = now()
+
+        etapy = EtapPlanu.objects.bulk_create([
+            EtapPlanu(plan=self.plan, nazwa=f"Dzień {dzien}", kolejnosc=dzien, adres_startowy=adres_etapu)
+            for dzien, adres_etapu, _ in dni
+        ])
+        if any(etap.pk is None for etap in etapy):
+            # Backends that cannot return ids from a bulk insert (Oracle): read them back.
+            etapy = list(EtapPlanu.objects.filter(plan=self.plan).order_by('kolejnosc'))
+
+        elementy = []
+        for etap, (dzien, _, pozycje) in zip(etapy, dni):
+            # Visits placed within opening hours (see scheduling.schedule_visits)
+            terminy = schedule_visits(
+                day_start(dzien, poczatek),
+                [(atrakcja, atrakcja.czas_zwiedzania or 30, czas_dojazdu) for atrakcja, czas_dojazdu in pozycje]
+            )
+            for kolejnosc, ((atrakcja, czas_dojazdu), (planowana_data, poza_godzinami)) in enumerate(
+                zip(pozycje, terminy), start=1
+            ):
+                elementy.append(ElementEtapu(
                     etap=etap,
                     atrakcja=atrakcja,
                     kolejnosc=kolejnosc,
-                    planowana_data=czas_start,
+                    planowana_data=planowana_data,
                     czas_wizyty=atrakcja.czas_zwiedzania or 30,
-                    czas_dojazdu=czas_dojazdu
-                )
-
+                    czas_dojazdu=czas_dojazdu,
+                    poza_godzinami=poza_godzinami
+                ))
                 logger.debug(
                     f"Dodano atrakcję '{atrakcja.nazwa}' do etapu {etap.kolejnosc} (czas dojazdu: {czas_dojazdu} min)"
                 )
-
-                # Update time for next item
-                czas_start += timedelta(minutes=(atrakcja.czas_zwiedzania or 30) + czas_dojazdu)
-                poprzednia_lokalizacja = atrakcja.lokalizacja
+            if any(poza for _, poza in terminy):
+                logger.warning(
+                    f"Etap {etap.kolejnosc} planu ID {self.plan.id}: "
+                    f"{sum(poza for _, poza in terminy)} atrakcji poza godzinami otwarcia"
+                )
+        ElementEtapu.objects.bulk_create(elementy)
+        logger.debug(f"Utworzono {len(etapy)} etapów i {len(elementy)} elementów planu ID {self.plan.id}")
 
     def _geocode_address(self, address):
         """
-        Geocodes a given address and returns an object with lat/lng.
+        Geocodes a given address (through the shared geocoding cache) and returns
+        an object with lat/lng.
 
         Returns:
             object | None: Location object with szerokosc_geo and dlugosc_geo
         """
-        try:
-            geocode_result = self.gmaps.geocode(address)
-            if geocode_result:
-                location = geocode_result[0]['geometry']['location']
-                logger.debug(f"Zgeokodowano adres: {address}")
-                return type('Loc', (), {
-                    'szerokosc_geo': location['lat'],
-                    'dlugosc_geo': location['lng']
-                })()
-            else:
-                logger.warning(f"Brak wyników geokodowania dla adresu: {address}")
-        except Exception as e:
-            logger.warning("Nie udało się zgeokodować adresu: %s", e, exc_info=True)
-        return None
-
-    def _calculate_travel_time(self, previous, current):
+        lat, lng = geocode(address, self.gmaps)
+        if lat is None or lng is None:
+            return None
+        logger.debug(f"Zgeokodowano adres: {address}")
+        return type('Loc', (), {
+            'szerokosc_geo': lat,
+            'dlugosc_geo': lng
+        })()
+
+    def _register_leg(self, odcinki, previous, current):
         """
-        Calculates driving time between two locations using Google Maps Directions API.
+        Appends the leg previous -> current to the batch.
 
         Returns:
-            int: travel time in minutes, or 15 as fallback.
+            int | None: Index of the leg, or None if there is no previous location
+            (first attraction of a day without a start address).
         """
         if not previous:
+            return None
+        lokalizacja = getattr(current, 'lokalizacja', None)
+        if (
+            lokalizacja is None
+            or previous.szerokosc_geo is None or previous.dlugosc_geo is None
+            or lokalizacja.szerokosc_geo is None or lokalizacja.dlugosc_geo is None
+        ):
+            return -1
+        odcinki.append((
+            (previous.szerokosc_geo, previous.dlugosc_geo),
+            (lokalizacja.szerokosc_geo, lokalizacja.dlugosc_geo)
+        ))
+        return len(odcinki) - 1
+
+    def _travel_time_minutes(self, odcinek, czasy, current):
+        """
+        Resolves the travel time of a registered leg.
+
+        Returns:
+            int: travel time in minutes, 0 without a previous location, or 15 as fallback.
+        """
+        if odcinek is None:
             return 0
-        try:
-            directions = self.gmaps.directions(
-                origin=(previous.szerokosc_geo, previous.dlugosc_geo),
-                destination=(current.lokalizacja.szerokosc_geo, current.lokalizacja.dlugosc_geo),
-                mode="driving"
-            )
-            if directions and directions[0]['legs']:
-                time = directions[0]['legs'][0]['duration']['value'] // 60
-                logger.debug(f"Czas przejazdu: {time} min do '{current.nazwa}'")
-                return time
-        except Exception as e:
-            logger.warning("Błąd przy pobieraniu trasy: %s", e, exc_info=True)
+        if odcinek >= 0 and czasy[odcinek] is not None:
+            time = int(round(czasy[odcinek] / 60))
+            logger.debug(f"Czas przejazdu: {time} min do '{current.nazwa}'")
+            return time
+        logger.warning(f"Brak czasu przejazdu do '{current.nazwa}', przyjęto 15 min")
         return 15
@@ -0,0 +1,240 @@
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.http import Http404
+
+from atrakcje.models import Atrakcja
+from plany.models import ElementEtapu, TrasaEtapu
+from .geocoding import geocode
+from .routes import invalidate_etap_routes
+from .routing import get_routing_backend
+from .scheduling import day_start, schedule_visits
+
+logger = logging.getLogger(__name__)
+
+# Marker of the etap's start address as the predecessor of its first element.
+START = 'S'
+DEFAULT_TRAVEL_MINUTES = 15
+
+
+class PlanEditor:
+    """
+    Service class applying edits to an existing plan: inserting, removing and moving
+    attractions, reordering a day and changing a day's start address.
+
+    Only legs whose endpoints changed are sent to the routing backend (in one batch per
+    edit); kolejnosc, czas_dojazdu and planowana_data of the affected days are then
+    written with bulk updates in one transaction.
+
+    Attributes:
+        plan (PlanZwiedzania): The edited plan.
+        gmaps (googlemaps.Client): Google Maps client for start address geocoding.
+        backend (RoutingBackend): Routing backend for travel times (defaults to settings.ROUTING_BACKEND).
+        mode (str): Travel mode.
+    """
+
+    def __init__(self, plan, gmaps, backend=None, mode="driving"):
+        self.plan = plan
+        self.gmaps = gmaps
+        self.backend = backend or get_routing_backend(gmaps)
+        self.mode = mode
+
+    def insert(self, etap, atrakcja_id, pozycja=None):
+        """
+        Adds an attraction to an etap at a 1-based position (default: at the end).
+
+        Returns:
+            int: Number of recomputed legs.
+        """
+        atrakcja = Atrakcja.objects.select_related('lokalizacja').filter(id=atrakcja_id).first()
+        if atrakcja is None:
+            raise Http404(f"Nie znaleziono atrakcji: {atrakcja_id}")
+        elementy = self._load([etap])
+        nowy = ElementEtapu(
+            etap=etap, atrakcja=atrakcja, czas_wizyty=atrakcja.czas_zwiedzania or 30, czas_dojazdu=None
+        )
+        lista = list(elementy[etap.id])
+        lista.insert(self._index(pozycja, len(lista) + 1), nowy)
+        return self._apply(elementy, {etap.id: lista}, nowe=[nowy])
+
+    def remove(self, element):
+        """
+        Removes an element from its etap.
+
+        Returns:
+            int: Number of recomputed legs.
+        """
+        elementy = self._load([element.etap])
+        lista = [el for el in elementy[element.etap_id] if el.id != element.id]
+        return self._apply(elementy, {element.etap_id: lista}, usuniete=[element])
+
+    def move(self, element, etap, pozycja=None):
+        """
+        Moves an element to a 1-based position of an etap (the same or another day;
+        default: at the end).
+
+        Returns:
+            int: Number of recomputed legs.
+        """
+        elementy = self._load({element.etap_id: element.etap, etap.id: etap}.values())
+        zrodlo = [el for el in elementy[element.etap_id] if el.id != element.id]
+        przenoszony = next(el for el in elementy[element.etap_id] if el.id == element.id)
+        cel = zrodlo if etap.id == element.etap_id else list(elementy[etap.id])
+        cel.insert(self._index(pozycja, len(cel) + 1), przenoszony)
+        return self._apply(elementy, {element.etap_id: zrodlo, etap.id: cel})
+
+    def reorder(self, etap, element_ids):
+        """
+        Puts the elements of an etap into the given order.
+
+        Args:
+            etap (EtapPlanu): The etap.
+            element_ids (list): IDs of all of its elements in the new order.
+
+        Returns:
+            int: Number of recomputed legs.
+        """
+        elementy = self._load([etap])
+        po_id = {el.id: el for el in elementy[etap.id]}
+        if sorted(po_id) != sorted(int(e) for e in element_ids):
+            raise ValueError("Nowa kolejność musi zawierać wszystkie elementy etapu")
+        return self._apply(elementy, {etap.id: [po_id[int(e)] for e in element_ids]})
+
+    def change_start(self, etap, adres_startowy):
+        """
+        Changes the start address of an etap; only the leg to its first attraction is recomputed.
+
+        Returns:
+            int: Number of recomputed legs.
+        """
+        elementy = self._load([etap])
+        stary = etap.adres_startowy
+        # Saved by _apply, in the same transaction as the recomputed times.
+        etap.adres_startowy = adres_startowy or None
+        try:
+            return self._apply(elementy, {etap.id: list(elementy[etap.id])}, stare_starty={etap.id: stary})
+        except Exception:
+            etap.adres_startowy = stary
+            raise
+
+    def _index(self, pozycja, dlugosc):
+        if pozycja is None:
+            return dlugosc - 1
+        return min(max(int(pozycja), 1), dlugosc) - 1
+
+    def _load(self, etapy):
+        # One query for the elements of every affected etap, in their current order.
+        self._etapy = {etap.id: etap for etap in etapy}
+        elementy = {etap_id: [] for etap_id in self._etapy}
+        for el in (
+            ElementEtapu.objects.filter(etap_id__in=list(self._etapy))
+            .select_related('atrakcja__lokalizacja')
+            .order_by('etap_id', 'kolejnosc')
+        ):
+            el.etap = self._etapy[el.etap_id]
+            elementy[el.etap_id].append(el)
+        return elementy
+
+    def _start_point(self, etap):
+        if not etap.adres_startowy:
+            return None
+        lat, lng = geocode(etap.adres_startowy, self.gmaps)
+        return (lat, lng) if lat is not None and lng is not None else None
+
+    def _point(self, element):
+        lok = getattr(element.atrakcja, 'lokalizacja', None)
+        if lok is None or lok.szerokosc_geo is None or lok.dlugosc_geo is None:
+            return None
+        return lok.szerokosc_geo, lok.dlugosc_geo
+
+    def _day_start(self, etap, stare):
+        # The day keeps its start time: first visit minus the travel to it, or the default for an empty day.
+        if stare:
+            return stare[0].planowana_data - timedelta(minutes=stare[0].czas_dojazdu or 0)
+        return day_start(etap.kolejnosc, self.plan.data_utworzenia)
+
+    def _apply(self, stare, nowe_kolejnosci, nowe=(), usuniete=(), stare_starty=None):
+        """
+        Writes the new order of the affected etapy, recomputing only legs whose predecessor
+        changed (a different previous attraction, or a changed start address).
+
+        Args:
+            stare (dict): etap id -> elements in their stored order.
+            nowe_kolejnosci (dict): etap id -> elements in the new order.
+            nowe (list): Unsaved elements to create.
+            usuniete (list): Elements to delete.
+            stare_starty (dict): etap id -> previous start address, if it changed (the new
+                one is saved with the elements).
+
+        Returns:
+            int: Number of recomputed legs.
+        """
+        stare_starty = stare_starty or {}
+        poprzednicy = {}
+        for etap_id, lista in stare.items():
+            for i, el in enumerate(lista):
+                poprzednicy[el.id] = (etap_id, lista[i - 1].atrakcja_id if i else START)
+
+        odcinki, do_przeliczenia = [], []
+        for etap_id, lista in nowe_kolejnosci.items():
+            etap = self._etapy[etap_id]
+            for i, el in enumerate(lista):
+                klucz = (etap_id, lista[i - 1].atrakcja_id if i else START)
+                if el.id is not None and poprzednicy.get(el.id) == klucz and (i or etap_id not in stare_starty):
+                    continue  # same leg as before - keep the stored travel time
+                if i == 0 and not etap.adres_startowy:
+                    el.czas_dojazdu = 0
+                    continue
+                skad = self._point(lista[i - 1]) if i else self._start_point(etap)
+                dokad = self._point(el)
+                if skad is None or dokad is None:
+                    el.czas_dojazdu = DEFAULT_TRAVEL_MINUTES
+                else:
+                    odcinki.append((skad, dokad))
+                    do_przeliczenia.append(el)
+
+        czasy = self.backend.travel_times(odcinki, mode=self.mode) if odcinki else []
+        for el, czas in zip(do_przeliczenia, czasy):
+            el.czas_dojazdu = DEFAULT_TRAVEL_MINUTES if czas is None else int(round(czas / 60))
+
+        zmienione = []
+        for etap_id, lista in nowe_kolejnosci.items():
+            etap = self._etapy[etap_id]
+            terminy = schedule_visits(
+                self._day_start(etap, stare.get(etap_id, [])),
+                [(el.atrakcja, el.czas_wizyty, el.czas_dojazdu) for el in lista]
+            )
+            for pozycja, (el, (planowana_data, poza_godzinami)) in enumerate(zip(lista, terminy), start=1):
+                el.etap = etap
+                el.kolejnosc = pozycja
+                el.planowana_data = planowana_data
+                el.poza_godzinami = poza_godzinami
+                zmienione.append(el)
+        istniejace = [el for el in zmienione if el.pk is not None]
+
+        przesuniecie = max([el.kolejnosc for lista in stare.values() for el in lista] + [len(zmienione)]) + 1
+        with transaction.atomic():
+            for etap_id in stare_starty:
+                self._etapy[etap_id].save(update_fields=['adres_startowy'])
+            for el in usuniete:
+                el.delete()
+            # Two passes keep (etap, kolejnosc) unique after every statement; new rows go in between.
+            for el in istniejace:
+                el.kolejnosc += przesuniecie
+            ElementEtapu.objects.bulk_update(istniejace, ['etap', 'kolejnosc'])
+            for el in istniejace:
+                el.kolejnosc -= przesuniecie
+            ElementEtapu.objects.bulk_create(list(nowe))
+            ElementEtapu.objects.bulk_update(
+                istniejace, ['etap', 'kolejnosc', 'czas_dojazdu', 'planowana_data', 'poza_godzinami']
+            )
+            for etap_id in nowe_kolejnosci:
+                invalidate_etap_routes(etap_id)
+            TrasaEtapu.objects.filter(etap_id__in=list(nowe_kolejnosci)).update(nieaktualna=True)
+
+        logger.info(
+            f"Edycja planu {self.plan.id}: {len(zmienione)} elementów w {len(nowe_kolejnosci)} etapach, "
+            f"przeliczono {len(odcinki)} odcinków"
+        )
+        return len(odcinki)
@@ -0,0 +1,159 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.http import Http404
+from django.utils.timezone import now
+
+from plany.models import ZadanieBudowyPlanu
+from .jobs import claim_due_jobs, claimed_job
+from .plan_builder import PlanBuilder
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 10
+DEFAULT_LEASE = 300
+
+Status = ZadanieBudowyPlanu.Status
+
+
+class BudowaAnulowana(Exception):
+    """Raised inside a running build when its job was cancelled (or taken over by another worker)."""
+
+
+def enqueue_plan_build(user, koszyk_ids, nazwa, adres_startowy, przypisane_atrakcje, starty=None, liczba_dni=None):
+    """
+    Queues building of a plan with the same arguments PlanBuilder takes.
+
+    Returns:
+        ZadanieBudowyPlanu: The created job.
+    """
+    zadanie = ZadanieBudowyPlanu.objects.create(
+        uzytkownik=user,
+        nazwa=nazwa[:100],
+        adres_startowy=adres_startowy,
+        koszyk=list(koszyk_ids),
+        przypisane_atrakcje={str(dzien): ids for dzien, ids in przypisane_atrakcje.items()},
+        starty={str(dzien): adres for dzien, adres in (starty or {}).items()},
+        liczba_dni=liczba_dni,
+        nastepna_proba=now(),
+        opis_postepu="Oczekuje w kolejce",
+    )
+    logger.info(f"Dodano zadanie budowy planu {zadanie.id} dla użytkownika {user.username}")
+    return zadanie
+
+
+def cancel_plan_build(zadanie):
+    """
+    Cancels a job that has not finished yet. A running build notices it at its next
+    progress report and is rolled back.
+
+    Returns:
+        bool: True if the job was cancelled.
+    """
+    anulowano = ZadanieBudowyPlanu.objects.filter(
+        id=zadanie.id, status__in=[Status.OCZEKUJACE, Status.W_TOKU]
+    ).update(status=Status.ANULOWANE, zablokowane_do=None, opis_postepu="Anulowano")
+    if anulowano:
+        logger.info(f"Anulowano zadanie budowy planu {zadanie.id}")
+    return bool(anulowano)
+
+
+def claim_plan_jobs(limit=DEFAULT_BATCH_SIZE, lease=None):
+    """
+    Claims due plan build jobs for this worker (see jobs.claim_due_jobs).
+
+    Returns:
+        list: Claimed ZadanieBudowyPlanu objects (status W_TOKU).
+    """
+    if lease is None:
+        lease = getattr(settings, 'PLAN_BUILD_JOB_LEASE', DEFAULT_LEASE)
+    return claim_due_jobs(ZadanieBudowyPlanu, limit, lease)
+
+
+def _progress_reporter(zadanie, lease):
+    def postep(procent, opis):
+        # The row only matches while this worker still owns the job; every report renews the lease.
+        if not claimed_job(ZadanieBudowyPlanu, zadanie).update(
+            postep=procent, opis_postepu=opis[:100], zablokowane_do=now() + timedelta(seconds=lease)
+        ):
+            raise BudowaAnulowana()
+    return postep
+
+
+def run_plan_job(zadanie, gmaps, backend=None):
+    """
+    Builds the plan of a claimed job. Progress is written as the build goes, so the
+    polling page sees it; a plan finished after its job was cancelled is deleted.
+
+    Missing attractions end the job with an error; other failures are retried with
+    exponential backoff until PLAN_BUILD_JOB_MAX_ATTEMPTS is reached.
+
+    Returns:
+        str: 'zakonczone', 'anulowane', 'ponowione' or 'bledy'.
+    """
+    builder = PlanBuilder(
+        user=zadanie.uzytkownik,
+        koszyk_ids=zadanie.koszyk,
+        nazwa=zadanie.nazwa,
+        adres_startowy=zadanie.adres_startowy,
+        przypisane_atrakcje={int(dzien): ids for dzien, ids in zadanie.przypisane_atrakcje.items()},
+        gmaps=gmaps,
+        starty={int(dzien): adres for dzien, adres in zadanie.starty.items()},
+        backend=backend,
+        postep=_progress_reporter(zadanie, getattr(settings, 'PLAN_BUILD_JOB_LEASE', DEFAULT_LEASE)),
+        liczba_dni=zadanie.liczba_dni,
+    )
+    try:
+        plan = builder.build()
+        if not claimed_job(ZadanieBudowyPlanu, zadanie).update(
+            status=Status.ZAKONCZONE, plan=plan, postep=100, opis_postepu="Gotowe",
+            zablokowane_do=None, blad='',
+        ):
+            plan.delete()
+            raise BudowaAnulowana()
+    except BudowaAnulowana:
+        logger.info(f"Budowa planu {zadanie.id} przerwana - zadanie anulowane lub przejęte przez innego pracownika")
+        return 'anulowane'
+    except Http404 as e:
+        claimed_job(ZadanieBudowyPlanu, zadanie).update(
+            status=Status.BLAD, zablokowane_do=None, blad=str(e)[:2000], opis_postepu="Błąd"
+        )
+        logger.warning(f"Zadanie budowy planu {zadanie.id} zakończone błędem: {e}")
+        return 'bledy'
+    except Exception as e:
+        logger.error(f"Błąd budowy planu w zadaniu {zadanie.id}: {e}", exc_info=True)
+        if zadanie.liczba_prob >= getattr(settings, 'PLAN_BUILD_JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS):
+            zmiany = {'status': Status.BLAD, 'opis_postepu': "Błąd"}
+            wynik = 'bledy'
+        else:
+            opoznienie = getattr(settings, 'PLAN_BUILD_JOB_RETRY_DELAY', DEFAULT_RETRY_DELAY) * 2 ** (zadanie.liczba_prob - 1)
+            zmiany = {'status': Status.OCZEKUJACE, 'nastepna_proba': now() + timedelta(seconds=opoznienie),
+                      'opis_postepu': "Ponowna próba wkrótce"}
+            wynik = 'ponowione'
+        claimed_job(ZadanieBudowyPlanu, zadanie).update(
+            zablokowane_do=None, blad=str(e)[:2000], postep=0, **zmiany
+        )
+        return wynik
+
+    logger.info(f"Zadanie budowy planu {zadanie.id} zakończone: plan {plan.id}")
+    return 'zakonczone'
+
+
+def job_status(zadanie):
+    """
+    Returns the state of a job as shown to the polling cart page.
+
+    Returns:
+        dict: 'status' (label), 'kod', 'postep', 'opis', 'blad' and 'plan' (plan id once built).
+    """
+    return {
+        'status': zadanie.get_status_display(),
+        'kod': zadanie.status,
+        'postep': zadanie.postep,
+        'opis': zadanie.opis_postepu,
+        'blad': zadanie.blad if zadanie.status == Status.BLAD else '',
+        'plan': zadanie.plan_id,
+    }
@@ -0,0 +1,171 @@
+import logging
+import math
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIME_LIMIT = 0.2
+# Stand-in cost for legs without a known travel time.
+UNREACHABLE = 10 ** 9
+
+
+def _as_cost_lists(macierz):
+    m = np.asarray(macierz, dtype=np.float64)
+    m = np.where(np.isfinite(m), m, UNREACHABLE)
+    return m.tolist()
+
+
+def path_cost(c, order):
+    """
+    Returns the cost of an open path (no return to the first point).
+
+    Args:
+        c: (n, n) cost matrix (nested lists or array).
+        order (list): Visiting order of point indexes.
+    """
+    return sum(c[a][b] for a, b in zip(order, order[1:]))
+
+
+def _nearest_neighbour(c, start, wolne):
+    order = [start]
+    wolne = set(wolne)
+    biezacy = start
+    while wolne:
+        nastepny = min(wolne, key=lambda j: c[biezacy][j])
+        order.append(nastepny)
+        wolne.remove(nastepny)
+        biezacy = nastepny
+    return order
+
+
+def _prefix_costs(c, order):
+    # forward[k]: cost of order[0..k] as walked; backward[k]: the same edges walked in reverse.
+    forward = [0.0] * len(order)
+    backward = [0.0] * len(order)
+    for k in range(1, len(order)):
+        forward[k] = forward[k - 1] + c[order[k - 1]][order[k]]
+        backward[k] = backward[k - 1] + c[order[k]][order[k - 1]]
+    return forward, backward
+
+
+def _two_opt(c, order, lo, hi, deadline):
+    """
+    Segment reversal (2-opt) for an open, possibly asymmetric path.
+
+    Only positions lo..hi-1 may move. Reversal deltas are O(1) thanks to prefix sums
+    of forward and backward edge costs.
+    """
+    n = len(order)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        forward, backward = _prefix_costs(c, order)
+        for i in range(lo, hi - 1):
+            prev = order[i - 1] if i > 0 else None
+            for j in range(i + 1, hi):
+                nxt = order[j + 1] if j + 1 < n else None
+                old = forward[j] - forward[i]
+                new = backward[j] - backward[i]
+                if prev is not None:
+                    old += c[prev][order[i]]
+                    new += c[prev][order[j]]
+                if nxt is not None:
+                    old += c[order[j]][nxt]
+                    new += c[order[i]][nxt]
+                if new < old - 1e-9:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    improved = True
+                    break
+            if improved:
+                break
+    return order
+
+
+def _or_opt(c, order, lo, hi, deadline, max_segment=3):
+    """
+    Moves segments of 1..max_segment points to a better position (Or-opt).
+
+    Only positions lo..hi-1 may move or receive a segment.
+    """
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for length in range(1, max_segment + 1):
+            for i in range(lo, hi - length + 1):
+                seg = order[i:i + length]
+                prev = order[i - 1] if i > 0 else None
+                nxt = order[i + length] if i + length < len(order) else None
+                removed = (c[prev][seg[0]] if prev is not None else 0) + (c[seg[-1]][nxt] if nxt is not None else 0)
+                bridged = c[prev][nxt] if prev is not None and nxt is not None else 0
+                gain = removed - bridged
+
+                rest = order[:i] + order[i + length:]
+                best_delta, best_k = 0.0, None
+                # Insert before rest[k]; k ranges over positions that keep fixed points in place.
+                for k in range(lo, hi - length + 1):
+                    if k == i:
+                        continue
+                    u = rest[k - 1] if k > 0 else None
+                    v = rest[k] if k < len(rest) else None
+                    added = (c[u][seg[0]] if u is not None else 0) + (c[seg[-1]][v] if v is not None else 0)
+                    added -= c[u][v] if u is not None and v is not None else 0
+                    delta = added - gain
+                    if delta < best_delta - 1e-9:
+                        best_delta, best_k = delta, k
+                if best_k is not None:
+                    order[:] = rest[:best_k] + seg + rest[best_k:]
+                    improved = True
+                    break
+            if improved:
+                break
+    return order
+
+
+def optimize_order(macierz, start=None, end=None, time_limit=DEFAULT_TIME_LIMIT):
+    """
+    Finds a short open path through all points of a precomputed cost matrix:
+    nearest-neighbour construction followed by 2-opt and Or-opt improvement.
+
+    Args:
+        macierz: (n, n) travel-time (or distance) matrix; inf marks unknown legs.
+        start (int): Optional index fixed as the first point (e.g. the hotel).
+        end (int): Optional index fixed as the last point.
+        time_limit (float): Seconds allowed for the improvement phase.
+
+    Returns:
+        list: Point indexes in visiting order.
+    """
+    c = _as_cost_lists(macierz)
+    n = len(c)
+    if n <= 2:
+        order = list(range(n))
+        if start is not None and n == 2 and start == 1:
+            order.reverse()
+        return order
+
+    deadline = time.perf_counter() + (time_limit if time_limit is not None else math.inf)
+    srodek = [i for i in range(n) if i != start and i != end]
+
+    if start is not None:
+        order = _nearest_neighbour(c, start, srodek)
+    else:
+        # Without a fixed start every point is tried as the first one.
+        kandydaci = (_nearest_neighbour(c, s, [i for i in srodek if i != s]) for s in srodek)
+        order = min(kandydaci, key=lambda o: path_cost(c, o + ([end] if end is not None else [])))
+    if end is not None:
+        order.append(end)
+
+    lo = 1 if start is not None else 0
+    hi = n - 1 if end is not None else n
+    poczatkowy = path_cost(c, order)
+    while time.perf_counter() < deadline:
+        koszt = path_cost(c, order)
+        _two_opt(c, order, lo, hi, deadline)
+        _or_opt(c, order, lo, hi, deadline)
+        if path_cost(c, order) >= koszt - 1e-9:
+            break
+
+    logger.debug(f"Optymalizacja trasy {n} punktów: {poczatkowy:.0f} → {path_cost(c, order):.0f}")
+    return order
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils.timezone import now
+
+from plany.models import WynikTrasy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60 * 60 * 24 * 7
+DEFAULT_MAX_ENTRIES = 5000
+# Prune the table once every this many stored routes (per worker).
+PRUNE_EVERY = 100
+# Don't rewrite data_uzycia on every hit - once an hour is enough for LRU ordering.
+TOUCH_INTERVAL = timedelta(hours=1)
+
+_store_counter = 0
+_store_lock = threading.Lock()
+
+
+def _as_latlng(punkt):
+    if isinstance(punkt, dict):
+        return punkt['lat'], punkt['lng']
+    return punkt[0], punkt[1]
+
+
+def route_cache_key(punkty, mode="driving", optimize=False):
+    """
+    Builds the cache key of a route.
+
+    Args:
+        punkty (list): Ordered points, either (lat, lng) pairs or dicts with 'lat'/'lng'.
+        mode (str): Travel mode passed to the Directions API.
+        optimize (bool): Whether waypoint optimization was requested.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    coords = [[round(float(lat), 6), round(float(lng), 6)] for lat, lng in map(_as_latlng, punkty)]
+    payload = json.dumps([mode, bool(optimize), coords], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _as_dict(wynik):
+    return {
+        'legs': wynik.odcinki,
+        'durations': [odcinek['czas'] for odcinek in wynik.odcinki],
+        'waypoint_order': wynik.kolejnosc_punktow,
+        'overview_polyline': wynik.polyline,
+        'total_duration': wynik.czas_laczny,
+    }
+
+
+def _lookup(klucz):
+    wynik = WynikTrasy.objects.filter(klucz=klucz).first()
+    if wynik is None:
+        return None
+    teraz = now()
+    ttl = getattr(settings, 'ROUTE_CACHE_TTL', DEFAULT_TTL)
+    if (teraz - wynik.data_utworzenia).total_seconds() > ttl:
+        wynik.delete()
+        return None
+    if teraz - wynik.data_uzycia > TOUCH_INTERVAL:
+        WynikTrasy.objects.filter(pk=wynik.pk).update(data_uzycia=teraz)
+    return wynik
+
+
+def _fetch(gmaps, punkty, mode, optimize):
+    latlngs = [f"{lat},{lng}" for lat, lng in map(_as_latlng, punkty)]
+    directions = gmaps.directions(
+        origin=latlngs[0],
+        destination=latlngs[-1],
+        waypoints=latlngs[1:-1] if len(latlngs) > 2 else None,
+        optimize_waypoints=optimize,
+        mode=mode
+    )
+    if not directions:
+        return None
+    trasa = directions[0]
+    odcinki = [
+        {
+            'czas': leg.get('duration', {}).get('value', 0),
+            'dystans': leg.get('distance', {}).get('value', 0),
+        }
+        for leg in trasa.get('legs', [])
+    ]
+    return {
+        'odcinki': odcinki,
+        'kolejnosc_punktow': trasa.get('waypoint_order', []),
+        'polyline': trasa.get('overview_polyline', {}).get('points', ''),
+        'czas_laczny': sum(odcinek['czas'] for odcinek in odcinki),
+    }
+
+
+def prune_route_cache():
+    """
+    Evicts the least recently used routes above ROUTE_CACHE_MAX_ENTRIES and every
+    route older than ROUTE_CACHE_TTL.
+
+    Returns:
+        int: Number of deleted rows.
+    """
+    max_entries = getattr(settings, 'ROUTE_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+    ttl = getattr(settings, 'ROUTE_CACHE_TTL', DEFAULT_TTL)
+    deleted, _ = WynikTrasy.objects.filter(data_utworzenia__lt=now() - timedelta(seconds=ttl)).delete()
+    granica = (
+        WynikTrasy.objects.order_by('-data_uzycia')
+        .values_list('data_uzycia', flat=True)[max_entries:max_entries + 1]
+    )
+    granica = list(granica)
+    if granica:
+        extra, _ = WynikTrasy.objects.filter(data_uzycia__lte=granica[0]).delete()
+        deleted += extra
+    if deleted:
+        logger.info(f"Usunięto {deleted} tras z pamięci podręcznej")
+    return deleted
+
+
+def _maybe_prune():
+    global _store_counter
+    with _store_lock:
+        _store_counter += 1
+        due = _store_counter % PRUNE_EVERY == 0
+    if due:
+        prune_route_cache()
+
+
+def get_route(gmaps, punkty, mode="driving", optimize=False, etap=None):
+    """
+    Returns a route for the ordered points, served from the WynikTrasy cache when
+    possible and fetched from the Directions API otherwise.
+
+    Args:
+        gmaps (googlemaps.Client): Authenticated Google Maps client, used on a miss.
+        punkty (list): Ordered points, either (lat, lng) pairs or dicts with 'lat'/'lng'.
+        mode (str): Travel mode.
+        optimize (bool): Whether intermediate waypoints may be reordered.
+        etap (EtapPlanu): Optional etap the route belongs to, used for invalidation.
+
+    Returns:
+        dict | None: Keys 'legs', 'durations' (seconds per leg), 'waypoint_order',
+        'overview_polyline' and 'total_duration' (seconds); None if no route is available.
+    """
+    if len(punkty) < 2:
+        return None
+    klucz = route_cache_key(punkty, mode, optimize)
+
+    wynik = _lookup(klucz)
+    if wynik is not None:
+        logger.debug(f"Trasa z pamięci podręcznej ({len(punkty)} punktów, {mode})")
+        return _as_dict(wynik)
+
+    try:
+        dane = _fetch(gmaps, punkty, mode, optimize)
+    except Exception as e:
+        logger.warning(f"Nie udało się pobrać trasy: {e}", exc_info=True)
+        return None
+    if dane is None:
+        logger.warning(f"Brak trasy dla {len(punkty)} punktów ({mode})")
+        return None
+
+    try:
+        wynik, _ = WynikTrasy.objects.update_or_create(
+            klucz=klucz,
+            defaults=dict(dane, etap=etap, tryb=mode, optymalizacja=optimize, data_uzycia=now()),
+        )
+    except IntegrityError:
+        wynik = WynikTrasy(klucz=klucz, tryb=mode, optymalizacja=optimize, **dane)
+    _maybe_prune()
+    return _as_dict(wynik)
+
+
+def invalidate_etap_routes(etap_id):
+    """
+    Drops cached routes recorded for an etap, e.g. after its elements change.
+
+    Args:
+        etap_id (int): ID of the EtapPlanu.
+
+    Returns:
+        int: Number of deleted rows.
+    """
+    deleted, _ = WynikTrasy.objects.filter(etap_id=etap_id).delete()
+    if deleted:
+        logger.debug(f"Unieważniono {deleted} tras etapu {etap_id}")
+    return deleted
@@ -0,0 +1,348 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from googlemaps.convert import encode_polyline
+
+from .gmaps_client import get_gmaps_client
+from .route_optimizer import optimize_order
+from .routes import get_route
+from .travel_matrix import get_matrix_store
+from .travel_times import batch_travel_times
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_SPEED_PROFILES = {
+    'driving': 30.0,
+    'walking': 4.5,
+    'bicycling': 14.0,
+    'transit': 20.0,
+}
+DEFAULT_DETOUR_FACTOR = 1.3
+DEFAULT_PRIMARY_TIMEOUT = 5.0
+PRIMARY_MAX_WORKERS = 4
+
+
+def _as_latlng(punkt):
+    if isinstance(punkt, dict):
+        return punkt['lat'], punkt['lng']
+    return punkt[0], punkt[1]
+
+
+def as_coords(punkty):
+    """
+    Converts points to a float64 array of shape (n, 2) with (lat, lng) in degrees.
+
+    Args:
+        punkty (list): (lat, lng) pairs or dicts with 'lat'/'lng'.
+    """
+    if not len(punkty):
+        return np.empty((0, 2), dtype=np.float64)
+    return np.array([_as_latlng(p) for p in punkty], dtype=np.float64)
+
+
+def haversine_km(a, b):
+    """
+    Great-circle distance between corresponding rows of a and b.
+
+    Args:
+        a (np.ndarray): (n, 2) array of (lat, lng) in degrees.
+        b (np.ndarray): (n, 2) array of (lat, lng) in degrees.
+
+    Returns:
+        np.ndarray: (n,) distances in kilometres.
+    """
+    a = np.radians(a)
+    b = np.radians(b)
+    dlat = b[:, 0] - a[:, 0]
+    dlng = b[:, 1] - a[:, 1]
+    h = np.sin(dlat / 2) ** 2 + np.cos(a[:, 0]) * np.cos(b[:, 0]) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def haversine_matrix_km(a, b=None):
+    """
+    Great-circle distances between every row of a and every row of b.
+
+    Args:
+        a (np.ndarray): (n, 2) array of (lat, lng) in degrees.
+        b (np.ndarray): (m, 2) array, defaults to a.
+
+    Returns:
+        np.ndarray: (n, m) distances in kilometres.
+    """
+    if b is None:
+        b = a
+    a = np.radians(a)[:, None, :]
+    b = np.radians(b)[None, :, :]
+    dlat = b[..., 0] - a[..., 0]
+    dlng = b[..., 1] - a[..., 1]
+    h = np.sin(dlat / 2) ** 2 + np.cos(a[..., 0]) * np.cos(b[..., 0]) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+class RoutingBackend:
+    """
+    Interface of a routing backend used by plany.services.maps and PlanBuilder.
+
+    Points are (lat, lng) pairs or dicts with 'lat'/'lng'; durations are in seconds.
+    """
+    name = None
+
+    def travel_times(self, odcinki, mode="driving"):
+        """
+        Returns travel times for (origin, destination) legs.
+
+        Returns:
+            list: Seconds per leg, None where no time is known.
+        """
+        raise NotImplementedError
+
+    def known_travel_times(self, odcinki, mode="driving"):
+        """
+        Returns travel times that are available without any API call.
+
+        Returns:
+            list: Seconds per leg, None where a leg would have to be computed.
+        """
+        return [None] * len(odcinki)
+
+    def route(self, punkty, mode="driving", optimize=False, etap=None):
+        """
+        Returns a route through the ordered points.
+
+        Returns:
+            dict | None: Same shape as plany.services.routes.get_route, plus 'backend'
+            (name of the backend that computed it) and 'zastepcza' (True for a fallback
+            estimate given instead of the primary backend's route).
+        """
+        raise NotImplementedError
+
+    def duration_matrix(self, punkty, mode="driving"):
+        """
+        Returns an (n, n) matrix of travel times between all points.
+
+        The default implementation asks travel_times for every ordered pair.
+        """
+        n = len(punkty)
+        pary = [(i, j) for i in range(n) for j in range(n) if i != j]
+        czasy = self.travel_times([(punkty[i], punkty[j]) for i, j in pary], mode=mode)
+        macierz = np.zeros((n, n), dtype=np.float64)
+        for (i, j), czas in zip(pary, czasy):
+            macierz[i, j] = np.inf if czas is None else czas
+        return macierz
+
+
+class GoogleRoutingBackend(RoutingBackend):
+    """Routing through the Google Maps APIs (Distance Matrix and cached Directions)."""
+    name = 'google'
+
+    def __init__(self, gmaps):
+        self.gmaps = gmaps
+
+    def travel_times(self, odcinki, mode="driving"):
+        return batch_travel_times(self.gmaps, odcinki, mode=mode)
+
+    def route(self, punkty, mode="driving", optimize=False, etap=None):
+        trasa = get_route(self.gmaps, punkty, mode=mode, optimize=optimize, etap=etap)
+        return dict(trasa, backend=self.name, zastepcza=False) if trasa is not None else None
+
+
+class LocalRoutingBackend(RoutingBackend):
+    """
+    Offline estimate: haversine distance x detour factor / per-mode speed.
+
+    Fast and deterministic, so it is also the backend of choice for tests and benchmarks.
+    """
+    name = 'local'
+
+    def __init__(self, speed_profiles=None, detour_factor=None):
+        self.speed_profiles = speed_profiles or getattr(settings, 'ROUTING_SPEED_PROFILES', DEFAULT_SPEED_PROFILES)
+        if detour_factor is None:
+            detour_factor = getattr(settings, 'ROUTING_DETOUR_FACTOR', DEFAULT_DETOUR_FACTOR)
+        self.detour_factor = detour_factor
+
+    def _seconds_per_km(self, mode):
+        speed = self.speed_profiles.get(mode) or self.speed_profiles.get('driving') or DEFAULT_SPEED_PROFILES['driving']
+        return 3600.0 / speed * self.detour_factor
+
+    def travel_times(self, odcinki, mode="driving"):
+        if not odcinki:
+            return []
+        origins = as_coords([o for o, _ in odcinki])
+        destinations = as_coords([d for _, d in odcinki])
+        seconds = haversine_km(origins, destinations) * self._seconds_per_km(mode)
+        return [int(round(s)) for s in seconds]
+
+    def duration_matrix(self, punkty, mode="driving"):
+        coords = as_coords(punkty)
+        return haversine_matrix_km(coords) * self._seconds_per_km(mode)
+
+    def route(self, punkty, mode="driving", optimize=False, etap=None):
+        if len(punkty) < 2:
+            return None
+        coords = as_coords(punkty)
+        waypoint_order = list(range(len(punkty) - 2))
+        if optimize and len(punkty) > 3:
+            # Same contract as Google's optimize_waypoints: origin and destination stay fixed.
+            order = optimize_order(self.duration_matrix(punkty, mode), start=0, end=len(punkty) - 1)
+            waypoint_order = [i - 1 for i in order[1:-1]]
+            coords = coords[order]
+        km = haversine_km(coords[:-1], coords[1:])
+        seconds = np.rint(km * self._seconds_per_km(mode)).astype(int).tolist()
+        metres = np.rint(km * self.detour_factor * 1000).astype(int).tolist()
+        return {
+            'legs': [{'czas': s, 'dystans': m} for s, m in zip(seconds, metres)],
+            'durations': seconds,
+            'waypoint_order': waypoint_order,
+            'overview_polyline': encode_polyline([tuple(c) for c in coords.tolist()]),
+            'total_duration': sum(seconds),
+            'backend': self.name,
+            'zastepcza': False,
+        }
+
+
+class FallbackRoutingBackend(RoutingBackend):
+    """
+    Uses the primary backend and falls back to the secondary one when the primary
+    raises, returns nothing for some legs, or does not answer within `timeout` seconds.
+    """
+    name = 'fallback'
+
+    def __init__(self, primary, fallback, timeout=None):
+        self.primary = primary
+        self.fallback = fallback
+        if timeout is None:
+            timeout = getattr(settings, 'ROUTING_PRIMARY_TIMEOUT', DEFAULT_PRIMARY_TIMEOUT)
+        self.timeout = timeout
+
+    def _call_primary(self, method, *args, **kwargs):
+        executor, wolne = _get_executor()
+        if not wolne.acquire(blocking=False):
+            # Every worker is still busy (e.g. with calls that already timed out) - do not queue
+            # behind them and wait the full timeout, use the fallback right away.
+            logger.warning(f"Brak wolnych wątków dla backendu {self.primary.name} ({method}), używam {self.fallback.name}")
+            return None
+
+        def job():
+            try:
+                return getattr(self.primary, method)(*args, **kwargs)
+            finally:
+                # The worker thread got its own DB connections (route cache) - release them.
+                connections.close_all()
+                wolne.release()
+
+        future = executor.submit(job)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            logger.warning(f"Backend {self.primary.name} nie odpowiedział w {self.timeout} s ({method}), używam {self.fallback.name}")
+        except Exception as e:
+            logger.warning(f"Błąd backendu {self.primary.name} ({method}): {e}, używam {self.fallback.name}", exc_info=True)
+        return None
+
+    def travel_times(self, odcinki, mode="driving"):
+        wyniki = self._call_primary('travel_times', odcinki, mode=mode) or [None] * len(odcinki)
+        brakujace = [i for i, czas in enumerate(wyniki) if czas is None]
+        if brakujace:
+            zastepcze = self.fallback.travel_times([odcinki[i] for i in brakujace], mode=mode)
+            for i, czas in zip(brakujace, zastepcze):
+                wyniki[i] = czas
+        return wyniki
+
+    def route(self, punkty, mode="driving", optimize=False, etap=None):
+        trasa = self._call_primary('route', punkty, mode=mode, optimize=optimize, etap=etap)
+        if trasa is None:
+            trasa = self.fallback.route(punkty, mode=mode, optimize=optimize, etap=etap)
+            if trasa is not None:
+                trasa = dict(trasa, zastepcza=True)
+        return trasa
+
+
+class MatrixRoutingBackend(RoutingBackend):
+    """
+    Answers legs between attractions from the precomputed travel-time matrices
+    (plany.services.travel_matrix) and passes only the remaining legs to the inner backend.
+    Routes (polylines) always come from the inner backend.
+    """
+    name = 'matrix'
+
+    def __init__(self, inner, store=None):
+        self.inner = inner
+        self.store = store or get_matrix_store()
+
+    def known_travel_times(self, odcinki, mode="driving"):
+        return self.store.lookup(odcinki, mode=mode)
+
+    def travel_times(self, odcinki, mode="driving"):
+        wyniki = self.store.lookup(odcinki, mode=mode)
+        brakujace = [k for k, czas in enumerate(wyniki) if czas is None]
+        if brakujace:
+            czasy = self.inner.travel_times([odcinki[k] for k in brakujace], mode=mode)
+            for k, czas in zip(brakujace, czasy):
+                wyniki[k] = czas
+        logger.debug(f"Macierz dojazdu: {len(odcinki) - len(brakujace)}/{len(odcinki)} odcinków bez zapytań")
+        return wyniki
+
+    def route(self, punkty, mode="driving", optimize=False, etap=None):
+        return self.inner.route(punkty, mode=mode, optimize=optimize, etap=etap)
+
+
+_local_backend = None
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # Shared by all fallback wrappers of this worker; a timed-out primary call keeps
+    # running here (and still fills the route cache) while the request moves on.
+    # The semaphore counts free threads, so nothing ever waits in the executor's queue.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = (
+                ThreadPoolExecutor(max_workers=PRIMARY_MAX_WORKERS, thread_name_prefix='routing'),
+                threading.BoundedSemaphore(PRIMARY_MAX_WORKERS),
+            )
+    return _executor
+
+
+def get_routing_backend(gmaps=None, use_matrix=None, wybor=None):
+    """
+    Returns the routing backend selected by settings.ROUTING_BACKEND:
+
+    - 'google': Google Maps only,
+    - 'local': offline haversine estimate only,
+    - 'auto' (default): Google Maps with the local estimate as fallback.
+
+    With TRAVEL_MATRIX_ENABLED the backend is wrapped in MatrixRoutingBackend, so legs
+    between attractions come from the precomputed matrices first.
+
+    Args:
+        gmaps (googlemaps.Client): Client to use for Google; created if not given.
+        use_matrix (bool): Overrides TRAVEL_MATRIX_ENABLED (False when building the matrices).
+        wybor (str): Overrides ROUTING_BACKEND.
+
+    Returns:
+        RoutingBackend: The configured backend.
+    """
+    global _local_backend
+    wybor = wybor or getattr(settings, 'ROUTING_BACKEND', 'auto')
+    if use_matrix is None:
+        use_matrix = getattr(settings, 'TRAVEL_MATRIX_ENABLED', True)
+    if _local_backend is None:
+        _local_backend = LocalRoutingBackend()
+
+    if wybor == 'local':
+        backend = _local_backend
+    else:
+        if gmaps is None:
+            gmaps = get_gmaps_client()
+        backend = GoogleRoutingBackend(gmaps)
+        if wybor != 'google':
+            backend = FallbackRoutingBackend(backend, _local_backend)
+    return MatrixRoutingBackend(backend) if use_matrix else backend
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils.timezone import localtime, now
+
+from atrakcje.services.availability import earliest_visit
+
+DEFAULT_DAY_START_HOUR = 9
+DEFAULT_VISIT_MINUTES = 30
+
+
+def day_start(dzien, poczatek=None):
+    """
+    Returns when day `dzien` of a plan starts: the first day right away, every following
+    one at PLAN_DAY_START_HOUR on the next dates.
+
+    Args:
+        dzien (int): Day number (1-based).
+        poczatek (datetime): When the plan starts; defaults to now.
+    """
+    poczatek = localtime(poczatek or now())
+    if dzien <= 1:
+        return poczatek
+    godzina = getattr(settings, 'PLAN_DAY_START_HOUR', DEFAULT_DAY_START_HOUR)
+    return (poczatek + timedelta(days=dzien - 1)).replace(hour=godzina, minute=0, second=0, microsecond=0)
+
+
+def schedule_visits(start, wizyty):
+    """
+    Places the visits of one day one after another within opening hours: a visit starts
+    on arrival, or waits until the attraction is open long enough for the whole visit.
+
+    Args:
+        start (datetime): Start of the day (at the start point).
+        wizyty (list): (atrakcja, czas_wizyty, czas_dojazdu) in visiting order, times in minutes.
+
+    Returns:
+        list: (planowana_data, poza_godzinami) per visit; poza_godzinami is True when the
+        visit cannot fit into that day's opening hours (it is then kept at arrival time).
+    """
+    wynik = []
+    czas = start
+    for atrakcja, minuty, czas_dojazdu in wizyty:
+        minuty = minuty or DEFAULT_VISIT_MINUTES
+        przyjazd = czas + timedelta(minutes=czas_dojazdu or 0)
+        wizyta = earliest_visit(atrakcja.dostepnosc, przyjazd, minuty)
+        poza_godzinami = wizyta is None
+        if poza_godzinami:
+            wizyta = przyjazd
+        wynik.append((wizyta, poza_godzinami))
+        czas = wizyta + timedelta(minutes=minuty)
+    return wynik
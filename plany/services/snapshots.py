@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+
+from django.db import IntegrityError
+
+from plany.models import TrasaEtapu
+from .geocoding import normalize_address
+from .maps import build_etap_points
+from .routing import get_routing_backend
+from .static_maps import get_static_map, static_map_path
+
+logger = logging.getLogger(__name__)
+
+MODE = "driving"
+
+
+def etap_route_hash(etap):
+    """
+    Returns the hash of everything the route of an etap depends on: the start address
+    and the ordered attractions with their coordinates. Uses prefetched elementy.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    elementy = []
+    for el in etap.elementy.all():
+        lok = getattr(el.atrakcja, 'lokalizacja', None)
+        elementy.append([
+            el.kolejnosc,
+            el.atrakcja_id,
+            lok.szerokosc_geo if lok else None,
+            lok.dlugosc_geo if lok else None,
+        ])
+    payload = json.dumps([normalize_address(etap.adres_startowy), elementy, MODE], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _stored_snapshot(etap):
+    try:
+        return etap.trasa_etapu
+    except TrasaEtapu.DoesNotExist:
+        return None
+
+
+def valid_snapshot(etap):
+    """
+    Returns the stored route of an etap if it is still up to date, without any API call.
+
+    Returns:
+        TrasaEtapu | None: Up-to-date snapshot or None.
+    """
+    trasa = _stored_snapshot(etap)
+    if trasa is None or trasa.nieaktualna or trasa.skrot != etap_route_hash(etap):
+        return None
+    if trasa.klucz_mapy and not static_map_path(trasa.klucz_mapy).exists():
+        # The image was evicted from the static map store.
+        return None
+    return trasa
+
+
+def refresh_etap_snapshot(etap, gmaps, backend=None):
+    """
+    Computes the route of an etap (points, leg times, polyline, static map) and stores it.
+
+    Args:
+        etap (EtapPlanu): Etap with prefetched elementy__atrakcja__lokalizacja.
+        gmaps (googlemaps.Client): Client used for start address geocoding.
+        backend (RoutingBackend): Routing backend; defaults to the one from settings.
+
+    Returns:
+        TrasaEtapu | None: The new snapshot, or None if the route could not be computed.
+    """
+    skrot = etap_route_hash(etap)
+    punkty = build_etap_points(etap, gmaps)
+    dane = {'skrot': skrot, 'punkty': punkty, 'czasy_odcinkow': [], 'czas_laczny': 0,
+            'polyline': '', 'klucz_mapy': '', 'nieaktualna': False, 'zrodlo': ''}
+
+    if len(punkty) >= 2:
+        backend = backend or get_routing_backend(gmaps)
+        trasa = backend.route(punkty, mode=MODE, etap=etap)
+        if trasa is None:
+            logger.warning(f"Nie udało się pobrać trasy dla etapu {etap.id}")
+            return None
+        dane['zrodlo'] = trasa.get('backend') or ''
+        # A fallback estimate (primary backend down or too slow) is shown now, but stored
+        # as outdated, so the next view asks the primary backend again.
+        dane['nieaktualna'] = bool(trasa.get('zastepcza'))
+        dane['czasy_odcinkow'] = trasa['durations']
+        dane['czas_laczny'] = trasa['total_duration']
+        dane['polyline'] = trasa['overview_polyline'] or ''
+        dane['klucz_mapy'] = get_static_map(punkty, dane['polyline'] or None) or ''
+
+    try:
+        snapshot, _ = TrasaEtapu.objects.update_or_create(etap=etap, defaults=dane)
+    except IntegrityError:
+        # Another request stored the same etap concurrently.
+        snapshot = TrasaEtapu.objects.get(etap=etap)
+    etap.trasa_etapu = snapshot
+    logger.info(
+        f"Zapisano trasę etapu {etap.id}: {len(punkty)} punktów, {dane['czas_laczny'] // 60} min"
+        f"{' (szacunek zastępczy)' if dane['nieaktualna'] else ''}"
+    )
+    return snapshot
+
+
+def etap_snapshot(etap, gmaps, backend=None):
+    """Returns the up-to-date route snapshot of an etap, recomputing it only when needed."""
+    return valid_snapshot(etap) or refresh_etap_snapshot(etap, gmaps, backend=backend)
+
+
+def snapshot_view(trasa):
+    """
+    Converts a snapshot into what the plan detail page shows for an etap.
+
+    Returns:
+        tuple: (list of points, descriptive summary string, static map key or None)
+    """
+    if len(trasa.punkty) < 2:
+        dojazd_info = "Brak wystarczającej liczby punktów."
+    else:
+        dojazd_info = f"Szacowany łączny czas przejazdu: {trasa.czas_laczny // 60} minut"
+    return trasa.punkty, dojazd_info, trasa.klucz_mapy or None
+
+
+def etap_view(etap, gmaps, backend=None):
+    """
+    Same result as maps.build_etap_view, served from the stored snapshot.
+
+    Returns:
+        tuple: (list of points, descriptive summary string, static map key or None)
+    """
+    trasa = etap_snapshot(etap, gmaps, backend=backend)
+    if trasa is None:
+        return build_etap_points(etap, gmaps), "Brak danych o trasie.", None
+    return snapshot_view(trasa)
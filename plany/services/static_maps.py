@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+from .gmaps_client import get_http_session, get_base_url
+
+logger = logging.getLogger(__name__)
+
+STATIC_MAP_API_PATH = "/maps/api/staticmap"
+DEFAULT_SIZE = "800x300"
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_evict_lock = threading.Lock()
+
+
+def static_map_dir():
+    """Returns the directory of the static map store (STATIC_MAP_CACHE_DIR or MEDIA_ROOT/mapy_statyczne)."""
+    katalog = getattr(settings, 'STATIC_MAP_CACHE_DIR', None) or Path(settings.MEDIA_ROOT) / 'mapy_statyczne'
+    return Path(katalog)
+
+
+def static_map_key(punkty, polyline=None, size=DEFAULT_SIZE):
+    """
+    Builds the content address of a static map image.
+
+    Args:
+        punkty (list): Markers - dicts with 'label', 'lat' and 'lng'.
+        polyline (str): Optional encoded route polyline.
+        size (str): Image size, e.g. "800x300".
+
+    Returns:
+        str: Hex SHA-256 digest of the markers, polyline and size.
+    """
+    markers = [[str(p['label']), round(float(p['lat']), 6), round(float(p['lng']), 6)] for p in punkty]
+    payload = json.dumps([size, markers, polyline or ""], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def static_map_path(klucz):
+    """
+    Returns the file path of a stored map.
+
+    Raises:
+        ValueError: If the key is not a SHA-256 hex digest.
+    """
+    if not KEY_RE.match(klucz or ""):
+        raise ValueError(f"Nieprawidłowy klucz mapy: {klucz!r}")
+    return static_map_dir() / f"{klucz}.png"
+
+
+def static_map_file_uri(klucz):
+    """Returns a file:// URI of a stored map, suitable for WeasyPrint."""
+    return static_map_path(klucz).resolve().as_uri()
+
+
+def _build_url(punkty, polyline, size):
+    url = f"{get_base_url()}{STATIC_MAP_API_PATH}?size={size}&key={settings.GOOGLE_MAPS_API_KEY}"
+    for p in punkty:
+        url += f"&markers=color:blue%7Clabel:{p['label']}%7C{p['lat']},{p['lng']}"
+    if polyline:
+        url += f"&path=enc:{polyline}"
+    return url
+
+
+def _write_atomic(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def evict_static_maps(max_bytes=None):
+    """
+    Deletes least recently used maps until the store fits in STATIC_MAP_CACHE_MAX_BYTES.
+    Recency is the file mtime, refreshed on every hit.
+
+    Returns:
+        int: Number of deleted files.
+    """
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'STATIC_MAP_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+    katalog = static_map_dir()
+    if not katalog.is_dir():
+        return 0
+
+    with _evict_lock:
+        pliki = []
+        total = 0
+        for entry in os.scandir(katalog):
+            if entry.is_file() and entry.name.endswith(".png"):
+                st = entry.stat()
+                pliki.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        if total <= max_bytes:
+            return 0
+
+        usuniete = 0
+        for _, size, path in sorted(pliki):
+            if total <= max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                usuniete += 1
+            except FileNotFoundError:
+                pass
+    logger.info(f"Usunięto {usuniete} map statycznych (limit {max_bytes} B)")
+    return usuniete
+
+
+def get_static_map(punkty, polyline=None, size=DEFAULT_SIZE):
+    """
+    Returns the key of a stored static map, downloading it from the Static Maps API
+    only if the same markers and polyline have not been stored before.
+
+    Args:
+        punkty (list): Markers - dicts with 'label', 'lat' and 'lng'.
+        polyline (str): Optional encoded route polyline.
+        size (str): Image size.
+
+    Returns:
+        str or None: Key of the stored PNG, or None if the download failed.
+    """
+    klucz = static_map_key(punkty, polyline, size)
+    path = static_map_path(klucz)
+    if path.exists():
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        logger.debug(f"Mapa statyczna z pamięci podręcznej: {klucz}")
+        return klucz
+
+    try:
+        response = get_http_session().get(_build_url(punkty, polyline, size))
+        if response.status_code != 200:
+            logger.warning(f"Błąd pobierania mapy statycznej: kod HTTP {response.status_code}")
+            return None
+        _write_atomic(path, response.content)
+    except Exception as e:
+        logger.warning(f"Failed to download static map: {e}", exc_info=True)
+        return None
+
+    logger.debug(f"Zapisano mapę statyczną {klucz} ({len(response.content)} B)")
+    evict_static_maps()
+    return klucz
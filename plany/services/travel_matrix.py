@@ -0,0 +1,280 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.utils.text import slugify
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODES = ('driving', 'walking')
+DEFAULT_REFRESH_INTERVAL = 60.0
+# Legs per backend call while precomputing, bounds memory and API request size.
+BUILD_BATCH_SIZE = 2000
+# Coordinates are matched after rounding to ~1 m.
+COORD_PRECISION = 5
+
+
+def matrix_dir():
+    """Returns the directory of the travel-time matrix store (TRAVEL_MATRIX_DIR)."""
+    return Path(getattr(settings, 'TRAVEL_MATRIX_DIR', None) or Path(settings.BASE_DIR) / 'macierze_dojazdu')
+
+
+def city_slug(miasto):
+    return slugify(miasto or '') or 'bez-miasta'
+
+
+def coord_key(lat, lng):
+    return round(float(lat), COORD_PRECISION), round(float(lng), COORD_PRECISION)
+
+
+def _point_key(punkt):
+    if isinstance(punkt, dict):
+        return coord_key(punkt['lat'], punkt['lng'])
+    return coord_key(punkt[0], punkt[1])
+
+
+def _index_path(katalog, slug):
+    return katalog / f"{slug}.json"
+
+
+def _matrix_path(katalog, slug, mode, wersja):
+    return katalog / f"{slug}.{mode}.{wersja}.npy"
+
+
+class TravelMatrixStore:
+    """
+    Read side of the precomputed travel-time matrices (see update_city_matrix).
+
+    For every city there is a JSON index (lokalizacja ids and coordinates) and one
+    float32 .npy matrix per travel mode, opened with mmap_mode='r' so all worker
+    processes share the same page cache instead of holding copies. Legs are matched by
+    rounded coordinates, so a moved Lokalizacja simply stops matching until the matrix
+    is updated.
+    """
+
+    def __init__(self, katalog=None, refresh_interval=None):
+        self.katalog = Path(katalog) if katalog else matrix_dir()
+        if refresh_interval is None:
+            refresh_interval = getattr(settings, 'TRAVEL_MATRIX_REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL)
+        self.refresh_interval = refresh_interval
+        self._miasta = {}  # slug -> (mtime, index, {mode: memmap})
+        self._punkty = {}  # coord key -> (slug, row)
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        teraz = time.monotonic()
+        if teraz - self._checked < self.refresh_interval:
+            return
+        with self._lock:
+            if teraz - self._checked < self.refresh_interval:
+                return
+            self._checked = teraz
+            if not self.katalog.is_dir():
+                self._miasta, self._punkty = {}, {}
+                return
+
+            miasta = {}
+            zmiana = False
+            for entry in os.scandir(self.katalog):
+                if not entry.name.endswith('.json'):
+                    continue
+                slug = entry.name[:-5]
+                mtime = entry.stat().st_mtime
+                poprzednie = self._miasta.get(slug)
+                if poprzednie and poprzednie[0] == mtime:
+                    miasta[slug] = poprzednie
+                    continue
+                try:
+                    with open(entry.path, encoding='utf-8') as f:
+                        index = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Nie można wczytać indeksu macierzy {entry.name}: {e}")
+                    continue
+                miasta[slug] = (mtime, index, {})
+                zmiana = True
+
+            if zmiana or miasta.keys() != self._miasta.keys():
+                punkty = {}
+                for slug, (_, index, _) in miasta.items():
+                    for row, (_, lat, lng) in enumerate(index['lokalizacje']):
+                        punkty[coord_key(lat, lng)] = (slug, row)
+                self._miasta, self._punkty = miasta, punkty
+                logger.info(f"Wczytano macierze dojazdu: {len(miasta)} miast, {len(punkty)} lokalizacji")
+
+    def _matrix(self, slug, mode):
+        _, index, macierze = self._miasta[slug]
+        if mode not in macierze:
+            if mode not in index.get('tryby', []):
+                macierze[mode] = None
+            else:
+                path = _matrix_path(self.katalog, slug, mode, index['wersja'])
+                try:
+                    macierze[mode] = np.load(path, mmap_mode='r')
+                except OSError as e:
+                    logger.warning(f"Brak pliku macierzy {path.name}: {e}")
+                    macierze[mode] = None
+        return macierze[mode]
+
+    def lookup(self, odcinki, mode="driving"):
+        """
+        Looks up precomputed travel times.
+
+        Args:
+            odcinki (list): (origin, destination) pairs of (lat, lng) tuples or dicts.
+            mode (str): Travel mode.
+
+        Returns:
+            list: Seconds per leg, None where the leg is not in the store.
+        """
+        self._refresh()
+        punkty = self._punkty
+        wyniki = [None] * len(odcinki)
+        if not punkty:
+            return wyniki
+        for k, (o, d) in enumerate(odcinki):
+            a = punkty.get(_point_key(o))
+            b = punkty.get(_point_key(d))
+            if a is None or b is None or a[0] != b[0]:
+                continue
+            if a[1] == b[1]:
+                wyniki[k] = 0
+                continue
+            macierz = self._matrix(a[0], mode)
+            if macierz is None:
+                continue
+            czas = macierz[a[1], b[1]]
+            if np.isfinite(czas):
+                wyniki[k] = int(round(float(czas)))
+        return wyniki
+
+    def stats(self):
+        self._refresh()
+        return {slug: len(index['lokalizacje']) for slug, (_, index, _) in self._miasta.items()}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_matrix_store():
+    """Returns the process-wide TravelMatrixStore."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TravelMatrixStore()
+    return _store
+
+
+def _write_json_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def update_city_matrix(miasto, lokalizacje, backend, modes=DEFAULT_MODES, full=False, katalog=None):
+    """
+    Creates or incrementally updates the travel-time matrices of one city.
+
+    Rows of lokalizacje whose coordinates did not change since the previous version are
+    copied; only legs touching new or moved lokalizacje are computed with the backend.
+    The new version is written next to the old one and published by replacing the
+    index, so readers never see a half-written matrix.
+
+    Args:
+        miasto (str): City name.
+        lokalizacje (list): (lokalizacja id, lat, lng) of every lokalizacja in the city.
+        backend (RoutingBackend): Backend used to compute missing legs; not a fallback
+            wrapper, as its estimates would be stored as real times. Legs it returns
+            no time for are stored as NaN (unknown).
+        modes (tuple): Travel modes to store.
+        full (bool): Recompute everything instead of reusing the previous version.
+        katalog (Path): Store directory (defaults to matrix_dir()).
+
+    Returns:
+        dict: Number of lokalizacje, reused rows and computed legs.
+    """
+    katalog = Path(katalog) if katalog else matrix_dir()
+    katalog.mkdir(parents=True, exist_ok=True)
+    slug = city_slug(miasto)
+    lokalizacje = sorted((int(i), float(lat), float(lng)) for i, lat, lng in lokalizacje)
+    n = len(lokalizacje)
+
+    stary = None
+    if not full:
+        try:
+            with open(_index_path(katalog, slug), encoding='utf-8') as f:
+                stary = json.load(f)
+        except (OSError, ValueError):
+            stary = None
+
+    stare_wiersze = {}
+    if stary:
+        for row, (i, lat, lng) in enumerate(stary['lokalizacje']):
+            stare_wiersze[i] = (row, coord_key(lat, lng))
+    zachowane_nowe, zachowane_stare = [], []
+    for row, (i, lat, lng) in enumerate(lokalizacje):
+        poprzedni = stare_wiersze.get(i)
+        if poprzedni and poprzedni[1] == coord_key(lat, lng):
+            zachowane_nowe.append(row)
+            zachowane_stare.append(poprzedni[0])
+    brudne = np.ones(n, dtype=bool)
+    brudne[zachowane_nowe] = False
+
+    wersja = (stary['wersja'] + 1) if stary else 1
+    punkty = [(lat, lng) for _, lat, lng in lokalizacje]
+    pary = [(i, j) for i in range(n) for j in range(n) if i != j and (brudne[i] or brudne[j])]
+    policzone = 0
+
+    for mode in modes:
+        macierz = np.lib.format.open_memmap(
+            _matrix_path(katalog, slug, mode, wersja), mode='w+', dtype=np.float32, shape=(n, n)
+        )
+        macierz[:] = np.nan
+        np.fill_diagonal(macierz, 0)
+
+        stara = None
+        if stary and mode in stary.get('tryby', []) and zachowane_nowe:
+            try:
+                stara = np.load(_matrix_path(katalog, slug, mode, stary['wersja']), mmap_mode='r')
+            except OSError:
+                stara = None
+        if stara is not None:
+            macierz[np.ix_(zachowane_nowe, zachowane_nowe)] = stara[np.ix_(zachowane_stare, zachowane_stare)]
+            do_policzenia = pary
+        else:
+            do_policzenia = [(i, j) for i in range(n) for j in range(n) if i != j]
+
+        for start in range(0, len(do_policzenia), BUILD_BATCH_SIZE):
+            partia = do_policzenia[start:start + BUILD_BATCH_SIZE]
+            czasy = backend.travel_times([(punkty[i], punkty[j]) for i, j in partia], mode=mode)
+            for (i, j), czas in zip(partia, czasy):
+                if czas is not None:
+                    macierz[i, j] = czas
+        policzone += len(do_policzenia)
+        macierz.flush()
+        del macierz
+
+    _write_json_atomic(_index_path(katalog, slug), {
+        'miasto': miasto,
+        'wersja': wersja,
+        'tryby': list(modes),
+        'lokalizacje': [list(l) for l in lokalizacje],
+    })
+    # Old versions can go: open memmaps of running readers keep their inode alive.
+    for path in katalog.glob(f"{slug}.*.npy"):
+        if not path.name.endswith(f".{wersja}.npy"):
+            path.unlink(missing_ok=True)
+
+    logger.info(
+        f"Macierz dojazdu {miasto} v{wersja}: {n} lokalizacji, "
+        f"{len(zachowane_nowe)} bez zmian, policzono {policzone} odcinków"
+    )
+    return {'lokalizacje': n, 'bez_zmian': len(zachowane_nowe), 'policzone': policzone}
@@ -0,0 +1,94 @@
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Distance Matrix API limits (standard plan): elements per request and
+# origins/destinations per request.
+DEFAULT_MAX_ELEMENTS = 100
+MAX_DIMENSION = 25
+
+
+def _latlng(punkt):
+    return round(float(punkt[0]), 6), round(float(punkt[1]), 6)
+
+
+def chunk_legs(odcinki, max_elements=None):
+    """
+    Splits legs into groups that fit into single Distance Matrix requests.
+
+    A group is grown greedily while (unique origins) x (unique destinations) stays within
+    the element limit, so consecutive legs of a route (which share points) and fan-out
+    legs from a single origin pack densely.
+
+    Args:
+        odcinki (list): (origin, destination) pairs of (lat, lng) tuples.
+        max_elements (int): Element limit per request (DISTANCE_MATRIX_MAX_ELEMENTS).
+
+    Returns:
+        list: Lists of leg indexes, one list per request.
+    """
+    if max_elements is None:
+        max_elements = getattr(settings, 'DISTANCE_MATRIX_MAX_ELEMENTS', DEFAULT_MAX_ELEMENTS)
+
+    grupy = []
+    biezaca, origins, destinations = [], set(), set()
+    for i, (origin, destination) in enumerate(odcinki):
+        o, d = _latlng(origin), _latlng(destination)
+        nowe_o = origins | {o}
+        nowe_d = destinations | {d}
+        if biezaca and (
+            len(nowe_o) * len(nowe_d) > max_elements
+            or len(nowe_o) > MAX_DIMENSION
+            or len(nowe_d) > MAX_DIMENSION
+        ):
+            grupy.append(biezaca)
+            biezaca, nowe_o, nowe_d = [], {o}, {d}
+        biezaca.append(i)
+        origins, destinations = nowe_o, nowe_d
+    if biezaca:
+        grupy.append(biezaca)
+    return grupy
+
+
+def batch_travel_times(gmaps, odcinki, mode="driving"):
+    """
+    Fetches travel times for many legs with as few Distance Matrix requests as possible.
+
+    Args:
+        gmaps (googlemaps.Client): Authenticated Google Maps client.
+        odcinki (list): (origin, destination) pairs of (lat, lng) tuples.
+        mode (str): Travel mode.
+
+    Returns:
+        list: Travel time in seconds for each leg, or None where no route was found
+        or the request failed.
+    """
+    wyniki = [None] * len(odcinki)
+    if not odcinki:
+        return wyniki
+
+    grupy = chunk_legs(odcinki)
+    for grupa in grupy:
+        origins = list(dict.fromkeys(_latlng(odcinki[i][0]) for i in grupa))
+        destinations = list(dict.fromkeys(_latlng(odcinki[i][1]) for i in grupa))
+        try:
+            macierz = gmaps.distance_matrix(origins, destinations, mode=mode)
+        except Exception as e:
+            logger.warning(f"Błąd zapytania Distance Matrix ({len(grupa)} odcinków): {e}", exc_info=True)
+            continue
+
+        o_index = {o: k for k, o in enumerate(origins)}
+        d_index = {d: k for k, d in enumerate(destinations)}
+        rows = macierz.get('rows', [])
+        for i in grupa:
+            try:
+                element = rows[o_index[_latlng(odcinki[i][0])]]['elements'][d_index[_latlng(odcinki[i][1])]]
+            except (IndexError, KeyError):
+                continue
+            if element.get('status') == 'OK':
+                wyniki[i] = element['duration']['value']
+
+    logger.debug(f"Pobrano czasy przejazdu dla {len(odcinki)} odcinków w {len(grupy)} zapytaniach")
+    return wyniki
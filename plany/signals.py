@@ -0,0 +1,31 @@
+import logging
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from atrakcje.models import Lokalizacja
+from .models import EtapPlanu, ElementEtapu, TrasaEtapu
+from .services.routes import invalidate_etap_routes
+
+logger = logging.getLogger(__name__)
+
+
+@receiver([post_save, post_delete], sender=ElementEtapu)
+def element_etapu_changed(sender, instance, **kwargs):
+    """Drops cached routes of the etap whose elements were added, changed or removed."""
+    invalidate_etap_routes(instance.etap_id)
+    TrasaEtapu.objects.filter(etap_id=instance.etap_id).update(nieaktualna=True)
+
+
+@receiver(post_save, sender=EtapPlanu)
+def etap_planu_changed(sender, instance, created, **kwargs):
+    """Drops cached routes of an edited etap (e.g. a new start address)."""
+    if not created:
+        invalidate_etap_routes(instance.id)
+        TrasaEtapu.objects.filter(etap_id=instance.id).update(nieaktualna=True)
+
+
+@receiver(post_save, sender=Lokalizacja)
+def lokalizacja_changed(sender, instance, created, **kwargs):
+    """Marks route snapshots of etapy visiting a moved attraction as outdated."""
+    if not created and instance.atrakcja_id:
+        TrasaEtapu.objects.filter(etap__elementy__atrakcja_id=instance.atrakcja_id).update(nieaktualna=True)
@@ -1,3 +1,774 @@
-from django.test import TestCase
+import os
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import googlemaps
+import numpy as np
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import make_aware, now
+
+from atrakcje.models import Atrakcja, Kategoria, Lokalizacja
+from konta.models import User
+from plany.models import (
+    ElementEtapu, EtapPlanu, PlanUzytkownika, PlanZwiedzania, TrasaEtapu, WynikGeokodowania, WynikTrasy,
+    ZadanieBudowyPlanu, ZadanieEksportuPdf, ZadanieGeokodowania,
+)
+from plany.services.day_assignment import MAX_DAYS, assign_days, balanced_k_medoids
+from plany.services.geocoding import clear_local_cache, geocode
+from plany.services.geocoding_queue import claim_jobs, process_jobs
+from plany.services.gmaps_client import reset_clients
+from plany.services.gmaps_standin import GmapsStandinServer, fake_geocode
+from plany.services.jobs import claimed_job
+from plany.services.maps import optimize_etap_order
+from plany.services.pdf_cache import (
+    evict_pdfs, get_cached_pdf, pdf_cache_dir, pdf_cache_path, plan_pdf_key, reserve_pdf_file, store_pdf_file,
+)
+from plany.services.pdf_export import ERRORS_ENTRY, PlanZipExporter
+from plany.services.pdf_generator import PrzekroczonyLimitRenderowania
+from plany.services.pdf_jobs import claim_pdf_jobs, enqueue_pdf_export, load_plan_for_pdf, run_pdf_job
+from plany.services.plan_editor import PlanEditor
+from plany.services.plan_jobs import cancel_plan_build, claim_plan_jobs, enqueue_plan_build, run_plan_job
+from plany.services.route_optimizer import optimize_order, path_cost
+from plany.services.routes import get_route
+from plany.services.routing import LocalRoutingBackend
+from plany.services.travel_matrix import TravelMatrixStore, update_city_matrix
+from plany.services.travel_times import MAX_DIMENSION, chunk_legs
+
+
+def _atrakcja(id, lat, lng, czas=60):
+    return SimpleNamespace(
+        id=id, czas_zwiedzania=czas, lokalizacja=SimpleNamespace(szerokosc_geo=lat, dlugosc_geo=lng)
+    )
+
+
+class AssignDaysTests(SimpleTestCase):
+    def test_splits_distant_groups_into_separate_days(self):
+        atrakcje = [_atrakcja(i, 50.06 + i * 0.001, 19.94) for i in range(3)]
+        atrakcje += [_atrakcja(10 + i, 52.23 + i * 0.001, 21.01) for i in range(3)]
+
+        dni = assign_days(atrakcje, 2)
+
+        self.assertEqual(sorted(sorted(ids) for ids in dni.values()), [[0, 1, 2], [10, 11, 12]])
+
+    def test_colocated_attractions_do_not_leave_empty_clusters(self):
+        atrakcje = [_atrakcja(i, 50.06, 19.94) for i in range(4)]
+
+        dni = assign_days(atrakcje, 2)
+
+        self.assertEqual(list(dni), [1])
+        self.assertEqual(sorted(dni[1]), [0, 1, 2, 3])
+
+    def test_fewer_distinct_points_than_days(self):
+        atrakcje = [_atrakcja(i, 50.06, 19.94) for i in range(3)] + [_atrakcja(3, 52.23, 21.01)]
+
+        dni = assign_days(atrakcje, 3)
+
+        self.assertEqual(sorted(sorted(ids) for ids in dni.values()), [[0, 1, 2], [3]])
+
+    def test_number_of_days_is_bounded(self):
+        atrakcje = [_atrakcja(i, 50.0 + i, 19.0) for i in range(MAX_DAYS + 5)]
+
+        dni = assign_days(atrakcje, 10 ** 9)
+
+        self.assertLessEqual(len(dni), MAX_DAYS)
+        self.assertEqual(sorted(a for ids in dni.values() for a in ids), list(range(MAX_DAYS + 5)))
+
+    def test_attractions_without_coordinates_are_kept(self):
+        atrakcje = [_atrakcja(1, 50.06, 19.94), _atrakcja(2, None, None)]
+
+        dni = assign_days(atrakcje, 2)
+
+        self.assertEqual(sorted(a for ids in dni.values() for a in ids), [1, 2])
+
+
+class BalancedKMedoidsTests(SimpleTestCase):
+    def test_identical_points_use_a_single_medoid(self):
+        etykiety, obciazenie = balanced_k_medoids(np.zeros((4, 4)), np.full(4, 30.0), 2, 480)
+
+        self.assertEqual(len(obciazenie), 1)
+        self.assertTrue((etykiety == 0).all())
+
+
+class StandinTestMixin:
+    """Serves the Google Maps stand-in for the test class and builds a client pointed at it."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.standin = GmapsStandinServer()
+        cls.gmaps = googlemaps.Client(key='AIzaStandin', base_url=cls.standin.start_in_thread())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.standin.shutdown()
+        cls.standin.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.standin.stats.clear()
+        clear_local_cache()
+
+
+class StandinServerTests(StandinTestMixin, SimpleTestCase):
+    def test_geocoding_is_deterministic(self):
+        wynik = self.gmaps.geocode('Wawel 5, Kraków')
+
+        self.assertEqual(
+            (wynik[0]['geometry']['location']['lat'], wynik[0]['geometry']['location']['lng']),
+            fake_geocode('Wawel 5, Kraków'),
+        )
+        self.assertEqual(self.gmaps.geocode('brak adresu'), [])
+
+    def test_distance_matrix_matches_the_local_backend(self):
+        a, b = (50.0614, 19.9366), (50.0540, 19.9354)
+
+        wynik = self.gmaps.distance_matrix([a], [b])
+
+        self.assertEqual(
+            wynik['rows'][0]['elements'][0]['duration']['value'], LocalRoutingBackend().travel_times([(a, b)])[0]
+        )
+
+    def test_injected_errors(self):
+        serwer = GmapsStandinServer(error_rate=1.0, error_status=400)
+        klient = googlemaps.Client(key='AIzaStandin', base_url=serwer.start_in_thread())
+        try:
+            with self.assertRaises(googlemaps.exceptions.HTTPError):
+                klient.geocode('Wawel 5, Kraków')
+        finally:
+            serwer.shutdown()
+            serwer.server_close()
+        self.assertEqual(serwer.stats['errors'], 1)
+
+
+class GeocodingCacheTests(StandinTestMixin, TestCase):
+    def test_repeated_lookups_hit_the_cache(self):
+        adres = 'Rynek Główny 1, Kraków'
+
+        pierwszy = geocode(adres, self.gmaps)
+        drugi = geocode('  rynek główny 1 ,kraków ', self.gmaps)
+        clear_local_cache()
+        trzeci = geocode(adres, self.gmaps)
+
+        self.assertEqual(pierwszy, fake_geocode(adres))
+        self.assertEqual(drugi, pierwszy)
+        self.assertEqual(trzeci, pierwszy)
+        self.assertEqual(self.standin.stats['geocode'], 1)
+        self.assertEqual(WynikGeokodowania.objects.get().liczba_trafien, 1)
+
+    def test_empty_results_are_cached(self):
+        with self.assertLogs('plany.services.geocoding', 'WARNING'):
+            self.assertEqual(geocode('brak takiego adresu', self.gmaps), (None, None))
+        self.assertEqual(geocode('brak takiego adresu', self.gmaps), (None, None))
+
+        self.assertEqual(self.standin.stats['geocode'], 1)
+
+    def test_api_errors_are_not_cached(self):
+        self.standin.error_rate, self.standin.error_status = 1.0, 400
+        try:
+            with self.assertLogs('plany.services.geocoding', 'WARNING'):
+                self.assertEqual(geocode('ul. Floriańska 3, Kraków', self.gmaps), (None, None))
+        finally:
+            self.standin.error_rate, self.standin.error_status = 0.0, 500
+
+        self.assertEqual(self.standin.stats['errors'], 1)
+        self.assertFalse(WynikGeokodowania.objects.exists())
+        self.assertEqual(geocode('ul. Floriańska 3, Kraków', self.gmaps), fake_geocode('ul. Floriańska 3, Kraków'))
+
+
+class RouteCacheTests(StandinTestMixin, TestCase):
+    punkty = [(50.0614, 19.9366), (50.0540, 19.9354), (50.0647, 19.9450)]
+
+    def test_repeated_routes_hit_the_cache(self):
+        pierwsza = get_route(self.gmaps, self.punkty)
+        druga = get_route(self.gmaps, [{'lat': lat, 'lng': lng} for lat, lng in self.punkty])
+
+        self.assertEqual(druga, pierwsza)
+        self.assertEqual(len(pierwsza['durations']), 2)
+        self.assertEqual(pierwsza['total_duration'], sum(pierwsza['durations']))
+        self.assertEqual(self.standin.stats['directions'], 1)
+        self.assertEqual(WynikTrasy.objects.count(), 1)
+
+    def test_mode_and_optimization_are_part_of_the_key(self):
+        get_route(self.gmaps, self.punkty)
+        get_route(self.gmaps, self.punkty, mode='walking')
+        get_route(self.gmaps, self.punkty, optimize=True)
+
+        self.assertEqual(self.standin.stats['directions'], 3)
+
+    def test_single_point_has_no_route(self):
+        self.assertIsNone(get_route(self.gmaps, self.punkty[:1]))
+        self.assertEqual(self.standin.stats['directions'], 0)
+
+
+class ChunkLegsTests(SimpleTestCase):
+    def test_groups_cover_all_legs_within_the_limits(self):
+        punkty = [(50.0 + i * 0.01, 19.9) for i in range(60)]
+        odcinki = [(punkty[i], punkty[j]) for i in range(60) for j in range(60) if (i * 7 + j) % 5 == 0]
+
+        grupy = chunk_legs(odcinki, max_elements=100)
+
+        self.assertEqual(sorted(i for grupa in grupy for i in grupa), list(range(len(odcinki))))
+        for grupa in grupy:
+            origins = {odcinki[i][0] for i in grupa}
+            destinations = {odcinki[i][1] for i in grupa}
+            self.assertLessEqual(len(origins) * len(destinations), 100)
+            self.assertLessEqual(max(len(origins), len(destinations)), MAX_DIMENSION)
+
+    def test_fan_out_from_one_origin_packs_into_one_request(self):
+        odcinki = [((50.0, 19.9), (50.0 + i * 0.01, 20.0)) for i in range(MAX_DIMENSION)]
+
+        self.assertEqual(chunk_legs(odcinki, max_elements=100), [list(range(MAX_DIMENSION))])
+
+    def test_no_legs(self):
+        self.assertEqual(chunk_legs([]), [])
+
+
+class OptimizeOrderTests(SimpleTestCase):
+    @staticmethod
+    def _macierz(pozycje):
+        pozycje = np.asarray(pozycje, dtype=float)
+        return np.abs(pozycje[:, None] - pozycje[None, :])
+
+    def test_points_on_a_line_are_visited_in_order(self):
+        pozycje = [0, 7, 3, 9, 1, 5, 2, 8, 4, 6]
+
+        order = optimize_order(self._macierz(pozycje), start=0)
+
+        self.assertEqual([pozycje[i] for i in order], list(range(10)))
+
+    def test_fixed_start_and_end(self):
+        pozycje = [5, 0, 9, 3, 7, 1]
+
+        order = optimize_order(self._macierz(pozycje), start=0, end=2)
+
+        self.assertEqual((order[0], order[-1]), (0, 2))
+        self.assertEqual(sorted(order), list(range(len(pozycje))))
+        self.assertEqual(path_cost(self._macierz(pozycje).tolist(), order), 5 + 9)
+
+    def test_unknown_legs_are_avoided(self):
+        macierz = self._macierz([0, 1, 2, 3])
+        macierz[0][1] = macierz[1][0] = np.inf
+
+        order = optimize_order(macierz, start=0)
+
+        self.assertNotEqual(order[1], 1)
+
+    def test_trivial_sizes(self):
+        self.assertEqual(optimize_order(np.zeros((0, 0))), [])
+        self.assertEqual(optimize_order(np.zeros((2, 2)), start=1), [1, 0])
+
+
+class PlanTestMixin:
+    """Creates a plan with one etap of attractions spread along a meridian through Kraków."""
+
+    def _atrakcja(self, i):
+        atrakcja = Atrakcja.objects.create(nazwa=f'Atrakcja {i}', kategoria=self.kategoria, opis='', czas_zwiedzania=60)
+        Lokalizacja.objects.create(
+            atrakcja=atrakcja, miasto='Kraków', ulica='Grodzka', numer_budynku=str(i), kod_pocztowy='31-001',
+            szerokosc_geo=50.0 + i * 0.01, dlugosc_geo=19.94,
+        )
+        return atrakcja
+
+    def _etap(self, kolejnosc, atrakcje):
+        etap = EtapPlanu.objects.create(plan=self.plan, nazwa=f'Dzień {kolejnosc}', kolejnosc=kolejnosc)
+        poczatek = make_aware(datetime(2026, 10, 19, 9, 0))
+        for pozycja, atrakcja in enumerate(atrakcje, start=1):
+            ElementEtapu.objects.create(
+                etap=etap, atrakcja=atrakcja, kolejnosc=pozycja, planowana_data=poczatek,
+                czas_wizyty=60, czas_dojazdu=10,
+            )
+        return etap
+
+    def _kolejnosc(self, etap):
+        return list(etap.elementy.order_by('kolejnosc').values_list('atrakcja_id', flat=True))
+
+    def setUp(self):
+        super().setUp()
+        self.kategoria = Kategoria.objects.create(nazwa='Muzea')
+        self.atrakcje = [self._atrakcja(i) for i in range(5)]
+        self.plan = PlanZwiedzania.objects.create(nazwa='Kraków')
+        self.backend = LocalRoutingBackend()
+
+
+class OptimizeEtapOrderTests(PlanTestMixin, StandinTestMixin, TestCase):
+    def test_reorders_and_stores_travel_times(self):
+        a = self.atrakcje
+        etap = self._etap(1, [a[2], a[0], a[4], a[1], a[3]])
+
+        optimize_etap_order(etap, self.gmaps, backend=self.backend)
+
+        self.assertIn(self._kolejnosc(etap), [[x.id for x in a], [x.id for x in reversed(a)]])
+        elementy = list(etap.elementy.order_by('kolejnosc'))
+        self.assertEqual(elementy[0].czas_dojazdu, 0)
+        self.assertTrue(all(el.czas_dojazdu > 0 for el in elementy[1:]))
+
+    def test_start_address_stays_first(self):
+        a = self.atrakcje
+        etap = self._etap(1, [a[2], a[0], a[4], a[1], a[3]])
+        etap.adres_startowy = 'Hotel, Kraków'
+        etap.save()
+        start = fake_geocode('Hotel, Kraków')
+
+        optimize_etap_order(etap, self.gmaps, backend=self.backend)
+
+        elementy = list(etap.elementy.order_by('kolejnosc'))
+        self.assertEqual(sorted(el.atrakcja_id for el in elementy), [x.id for x in a])
+        self.assertEqual(
+            elementy[0].czas_dojazdu,
+            int(round(self.backend.travel_times([(start, (elementy[0].atrakcja.lokalizacja.szerokosc_geo, 19.94))])[0] / 60)),
+        )
+        self.assertEqual(self.standin.stats['geocode'], 1)
+
+
+class PlanEditorTests(PlanTestMixin, StandinTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        a = self.atrakcje
+        self.dzien1 = self._etap(1, a[:3])
+        self.dzien2 = self._etap(2, a[3:4])
+        self.editor = PlanEditor(self.plan, self.gmaps, backend=self.backend)
+
+    def _element(self, atrakcja):
+        return ElementEtapu.objects.select_related('etap').get(atrakcja=atrakcja)
+
+    def test_insert_recomputes_only_the_changed_legs(self):
+        a = self.atrakcje
+
+        przeliczone = self.editor.insert(self.dzien1, a[4].id, pozycja=2)
+
+        self.assertEqual(przeliczone, 2)
+        self.assertEqual(self._kolejnosc(self.dzien1), [a[0].id, a[4].id, a[1].id, a[2].id])
+        self.assertEqual(self._element(a[2]).czas_dojazdu, 10)
+
+    def test_remove(self):
+        a = self.atrakcje
+
+        przeliczone = self.editor.remove(self._element(a[1]))
+
+        self.assertEqual(przeliczone, 1)
+        self.assertEqual(self._kolejnosc(self.dzien1), [a[0].id, a[2].id])
+
+    def test_move_between_days(self):
+        a = self.atrakcje
+
+        self.editor.move(self._element(a[0]), self.dzien2, pozycja=1)
+
+        self.assertEqual(self._kolejnosc(self.dzien1), [a[1].id, a[2].id])
+        self.assertEqual(self._kolejnosc(self.dzien2), [a[0].id, a[3].id])
+        self.assertEqual(self._element(a[1]).czas_dojazdu, 0)
+        self.assertGreater(self._element(a[3]).czas_dojazdu, 0)
+
+    def test_reorder_keeps_unchanged_legs(self):
+        a = self.atrakcje
+        elementy = {el.atrakcja_id: el.id for el in self.dzien1.elementy.all()}
+
+        przeliczone = self.editor.reorder(self.dzien1, [elementy[a[1].id], elementy[a[0].id], elementy[a[2].id]])
+
+        self.assertEqual(przeliczone, 2)
+        self.assertEqual(self._kolejnosc(self.dzien1), [a[1].id, a[0].id, a[2].id])
+        with self.assertRaises(ValueError):
+            self.editor.reorder(self.dzien1, [elementy[a[0].id]])
+
+    def test_change_start_recomputes_the_first_leg(self):
+        a = self.atrakcje
+
+        przeliczone = self.editor.change_start(self.dzien1, 'Hotel, Kraków')
+
+        self.dzien1.refresh_from_db()
+        self.assertEqual(przeliczone, 1)
+        self.assertEqual(self.dzien1.adres_startowy, 'Hotel, Kraków')
+        self.assertEqual(self._element(a[1]).czas_dojazdu, 10)
+        start = self.backend.travel_times([(fake_geocode('Hotel, Kraków'), (50.0, 19.94))])[0]
+        self.assertEqual(self._element(a[0]).czas_dojazdu, int(round(start / 60)))
+
+
+@override_settings(GOOGLE_MAPS_API_KEY='AIzaStandin')
+class PrzeniesElementViewTests(PlanTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        reset_clients()
+        self.addCleanup(reset_clients)
+
+    def test_non_numeric_target_etap_is_rejected(self):
+        a = self.atrakcje
+        etap = self._etap(1, a[:2])
+        uzytkownik = User.objects.create_user(username='przewodnik', password='haslo')
+        PlanUzytkownika.objects.create(uzytkownik=uzytkownik, plan=self.plan, jest_wlascicielem=True)
+        self.client.force_login(uzytkownik)
+        element = etap.elementy.get(atrakcja=a[0])
+
+        odpowiedz = self.client.post(reverse('plany:przenies_element', args=[element.id]), {'etap': 'abc'})
+
+        self.assertRedirects(odpowiedz, reverse('plany:szczegoly_planu', args=[self.plan.id]), fetch_redirect_response=False)
+        self.assertEqual(self._kolejnosc(etap), [a[0].id, a[1].id])
+
+
+class GeocodingQueueTests(PlanTestMixin, StandinTestMixin, TransactionTestCase):
+    # Lookups run in pool threads with their own connections, so the data must be committed.
+
+    def _bez_wspolrzednych(self, atrakcja, ulica):
+        return Lokalizacja.objects.create(
+            atrakcja=atrakcja, miasto='Kraków', ulica=ulica, numer_budynku='1', kod_pocztowy='31-001'
+        )
+
+    def test_saving_without_coordinates_queues_a_job_filled_by_the_worker(self):
+        atrakcja = Atrakcja.objects.create(nazwa='Nowa', kategoria=self.kategoria, opis='', czas_zwiedzania=60)
+        lokalizacja = self._bez_wspolrzednych(atrakcja, 'Kanonicza')
+        etap = self._etap(1, [atrakcja])
+        TrasaEtapu.objects.create(etap=etap, skrot='x')
+
+        stats = process_jobs(claim_jobs(), self.gmaps)
+
+        lokalizacja.refresh_from_db()
+        self.assertEqual(stats['zakonczone'], 1)
+        self.assertEqual((lokalizacja.szerokosc_geo, lokalizacja.dlugosc_geo), fake_geocode(lokalizacja.pelny_adres()))
+        self.assertTrue(TrasaEtapu.objects.get(etap=etap).nieaktualna)
+        self.assertEqual(ZadanieGeokodowania.objects.get().status, ZadanieGeokodowania.Status.ZAKONCZONE)
+
+    def test_jobs_reclaimed_by_another_worker_are_left_alone(self):
+        atrakcja = Atrakcja.objects.create(nazwa='Nowa', kategoria=self.kategoria, opis='', czas_zwiedzania=60)
+        lokalizacja = self._bez_wspolrzednych(atrakcja, 'Kanonicza')
+        zadania = claim_jobs()
+        # The lease expired and another worker claimed the job again.
+        ZadanieGeokodowania.objects.update(liczba_prob=zadania[0].liczba_prob + 1)
+
+        stats = process_jobs(zadania, self.gmaps)
+
+        lokalizacja.refresh_from_db()
+        self.assertEqual(stats['przejete'], 1)
+        self.assertIsNone(lokalizacja.szerokosc_geo)
+        self.assertEqual(ZadanieGeokodowania.objects.get().status, ZadanieGeokodowania.Status.W_TOKU)
+
+
+class _NiedostepnyBackend(LocalRoutingBackend):
+    def travel_times(self, odcinki, mode="driving"):
+        raise RuntimeError("Backend niedostępny")
+
+
+class PlanJobTests(PlanTestMixin, StandinTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.uzytkownik = User.objects.create_user(username='turysta', password='haslo')
+
+    def _zadanie(self, **zmiany):
+        ids = [a.id for a in self.atrakcje[:3]]
+        zadanie = enqueue_plan_build(self.uzytkownik, ids, 'Wycieczka', None, {1: ids})
+        if zmiany:
+            ZadanieBudowyPlanu.objects.filter(id=zadanie.id).update(**zmiany)
+        return zadanie
+
+    def test_claims_only_due_jobs(self):
+        gotowe = self._zadanie()
+        self._zadanie(nastepna_proba=now() + timedelta(hours=1))
+        self._zadanie(status=ZadanieBudowyPlanu.Status.W_TOKU, zablokowane_do=now() + timedelta(minutes=5))
+
+        zadania = claim_plan_jobs()
+
+        self.assertEqual([z.id for z in zadania], [gotowe.id])
+        self.assertEqual(zadania[0].liczba_prob, 1)
+        self.assertEqual(claim_plan_jobs(), [])
+
+    def test_expired_lease_is_claimed_again_and_the_old_claim_is_lost(self):
+        self._zadanie()
+        [pierwsze] = claim_plan_jobs()
+        ZadanieBudowyPlanu.objects.update(zablokowane_do=now() - timedelta(seconds=1))
+
+        [drugie] = claim_plan_jobs()
+
+        self.assertEqual(drugie.liczba_prob, 2)
+        self.assertEqual(claimed_job(ZadanieBudowyPlanu, pierwsze).update(postep=50), 0)
+        self.assertEqual(claimed_job(ZadanieBudowyPlanu, drugie).update(postep=50), 1)
+
+    def test_run_builds_the_plan(self):
+        self._zadanie()
+        [zadanie] = claim_plan_jobs()
+
+        self.assertEqual(run_plan_job(zadanie, self.gmaps, backend=self.backend), 'zakonczone')
+
+        zadanie.refresh_from_db()
+        self.assertEqual(zadanie.status, ZadanieBudowyPlanu.Status.ZAKONCZONE)
+        self.assertEqual(zadanie.postep, 100)
+        self.assertEqual(ElementEtapu.objects.filter(etap__plan=zadanie.plan).count(), 3)
+
+    def test_cancelled_or_taken_over_job_leaves_no_plan(self):
+        plany = PlanZwiedzania.objects.count()
+        self._zadanie()
+        [anulowane] = claim_plan_jobs()
+        cancel_plan_build(anulowane)
+        self._zadanie()
+        [przejete] = claim_plan_jobs()
+        ZadanieBudowyPlanu.objects.filter(id=przejete.id).update(liczba_prob=przejete.liczba_prob + 1)
+
+        self.assertEqual(run_plan_job(anulowane, self.gmaps, backend=self.backend), 'anulowane')
+        self.assertEqual(run_plan_job(przejete, self.gmaps, backend=self.backend), 'anulowane')
+        self.assertEqual(PlanZwiedzania.objects.count(), plany)
+        self.assertEqual(ZadanieBudowyPlanu.objects.get(id=przejete.id).status, ZadanieBudowyPlanu.Status.W_TOKU)
+
+    def test_failures_are_retried_with_backoff_until_the_attempt_limit(self):
+        self._zadanie()
+        [zadanie] = claim_plan_jobs()
+
+        with self.assertLogs('plany.services.plan_jobs', 'ERROR'):
+            self.assertEqual(run_plan_job(zadanie, self.gmaps, backend=_NiedostepnyBackend()), 'ponowione')
+
+        zadanie.refresh_from_db()
+        self.assertEqual(zadanie.status, ZadanieBudowyPlanu.Status.OCZEKUJACE)
+        self.assertGreater(zadanie.nastepna_proba, now())
+        ZadanieBudowyPlanu.objects.update(nastepna_proba=now(), liczba_prob=2)
+        [zadanie] = claim_plan_jobs()
+
+        with self.assertLogs('plany.services.plan_jobs', 'ERROR'):
+            self.assertEqual(run_plan_job(zadanie, self.gmaps, backend=_NiedostepnyBackend()), 'bledy')
+        self.assertEqual(ZadanieBudowyPlanu.objects.get().status, ZadanieBudowyPlanu.Status.BLAD)
+
+    def test_missing_attractions_end_the_job(self):
+        enqueue_plan_build(self.uzytkownik, [10 ** 6], 'Wycieczka', None, {1: [10 ** 6]})
+        [zadanie] = claim_plan_jobs()
+
+        with self.assertLogs('plany.services.plan_jobs', 'WARNING'):
+            self.assertEqual(run_plan_job(zadanie, self.gmaps, backend=self.backend), 'bledy')
+        self.assertEqual(ZadanieBudowyPlanu.objects.get().status, ZadanieBudowyPlanu.Status.BLAD)
+
+
+class PdfStoreMixin:
+    """Points the PDF store at a temporary directory for the duration of each test."""
+
+    def setUp(self):
+        super().setUp()
+        katalog = tempfile.TemporaryDirectory()
+        self.addCleanup(katalog.cleanup)
+        ustawienia = self.settings(PDF_CACHE_DIR=katalog.name)
+        ustawienia.enable()
+        self.addCleanup(ustawienia.disable)
+
+
+class PdfCacheTests(PdfStoreMixin, PlanTestMixin, TestCase):
+    def _zapisz(self, znak, rozmiar=100, dostep=None):
+        tmp = reserve_pdf_file()
+        tmp.write_bytes(b'%' * rozmiar)
+        sciezka = store_pdf_file(znak * 64, tmp)
+        if dostep is not None:
+            os.utime(sciezka, (dostep, sciezka.stat().st_mtime))
+        return sciezka
+
+    def test_key_follows_the_shown_content(self):
+        etap = self._etap(1, self.atrakcje[:2])
+        mapy = {etap.id: 'a' * 64}
+        klucz = plan_pdf_key(load_plan_for_pdf(self.plan.id), mapy)
+
+        self.assertEqual(plan_pdf_key(load_plan_for_pdf(self.plan.id), dict(mapy)), klucz)
+        self.assertNotEqual(plan_pdf_key(load_plan_for_pdf(self.plan.id), {etap.id: 'b' * 64}), klucz)
+        etap.elementy.filter(kolejnosc=2).update(czas_dojazdu=25)
+        zmieniony = plan_pdf_key(load_plan_for_pdf(self.plan.id), mapy)
+        self.assertNotEqual(zmieniony, klucz)
+        PlanZwiedzania.objects.filter(id=self.plan.id).update(nazwa='Kraków i okolice')
+        self.assertNotEqual(plan_pdf_key(load_plan_for_pdf(self.plan.id), mapy), zmieniony)
+
+    def test_only_hex_digests_are_valid_keys(self):
+        for klucz in ('../../etc/passwd', 'A' * 64, '', None):
+            with self.assertRaises(ValueError):
+                pdf_cache_path(klucz)
+
+    def test_store_and_lookup(self):
+        sciezka = self._zapisz('a')
+
+        self.assertEqual(get_cached_pdf('a' * 64), sciezka)
+        self.assertIsNone(get_cached_pdf('b' * 64))
+        self.assertEqual([p.name for p in pdf_cache_dir().iterdir()], [sciezka.name])
+
+    def test_least_recently_used_pdfs_are_evicted(self):
+        teraz = time.time()
+        self._zapisz('a', dostep=teraz - 300)
+        self._zapisz('b', dostep=teraz - 200)
+        self._zapisz('c', dostep=teraz - 100)
+        get_cached_pdf('a' * 64)
+
+        self.assertEqual(evict_pdfs(max_bytes=250), 1)
+
+        self.assertIsNotNone(get_cached_pdf('a' * 64))
+        self.assertIsNone(get_cached_pdf('b' * 64))
+        self.assertIsNotNone(get_cached_pdf('c' * 64))
+        self.assertEqual(evict_pdfs(max_bytes=250), 0)
+
+    def test_storing_evicts_above_the_limit(self):
+        with self.settings(PDF_CACHE_MAX_BYTES=250):
+            self._zapisz('a', dostep=time.time() - 100)
+            self._zapisz('b')
+            self._zapisz('c')
+
+        self.assertIsNone(get_cached_pdf('a' * 64))
+        self.assertEqual(len(list(pdf_cache_dir().glob('*.pdf'))), 2)
+
+
+class PdfJobTests(PdfStoreMixin, PlanTestMixin, StandinTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.uzytkownik = User.objects.create_user(username='przewodnik', password='haslo')
+
+    def _zadanie(self):
+        enqueue_pdf_export(self.plan, self.uzytkownik, 'http://testserver/')
+        [zadanie] = claim_pdf_jobs()
+        return zadanie
+
+    def test_renders_into_the_cache_and_reuses_it(self):
+        zadanie = self._zadanie()
+
+        self.assertEqual(run_pdf_job(zadanie, self.gmaps), 'zakonczone')
+
+        zadanie.refresh_from_db()
+        self.assertEqual(zadanie.status, ZadanieEksportuPdf.Status.ZAKONCZONE)
+        self.assertTrue(get_cached_pdf(zadanie.klucz).read_bytes().startswith(b'%PDF'))
+        with mock.patch('plany.services.pdf_jobs.render_plan_pdf_file') as render:
+            self.assertEqual(run_pdf_job(self._zadanie(), self.gmaps), 'zakonczone')
+        render.assert_not_called()
+
+    def test_taken_over_job_is_not_rendered(self):
+        zadanie = self._zadanie()
+        ZadanieEksportuPdf.objects.update(liczba_prob=zadanie.liczba_prob + 1)
+
+        with mock.patch('plany.services.pdf_jobs.render_plan_pdf_file') as render:
+            self.assertEqual(run_pdf_job(zadanie, self.gmaps), 'przejete')
+
+        render.assert_not_called()
+        self.assertEqual(ZadanieEksportuPdf.objects.get().status, ZadanieEksportuPdf.Status.W_TOKU)
+
+    def test_render_over_its_limits_is_not_retried(self):
+        zadanie = self._zadanie()
+
+        with mock.patch('plany.services.pdf_jobs.render_plan_pdf_file', side_effect=PrzekroczonyLimitRenderowania('limit')), \
+                self.assertLogs('plany.services.pdf_jobs', 'WARNING'):
+            self.assertEqual(run_pdf_job(zadanie, self.gmaps), 'bledy')
+
+        self.assertEqual(ZadanieEksportuPdf.objects.get().status, ZadanieEksportuPdf.Status.BLAD)
+
+    def test_other_failures_are_retried_until_the_attempt_limit(self):
+        zadanie = self._zadanie()
+
+        with mock.patch('plany.services.pdf_jobs.render_plan_pdf_file', side_effect=OSError('dysk')), \
+                self.assertLogs('plany.services.pdf_jobs', 'ERROR'):
+            self.assertEqual(run_pdf_job(zadanie, self.gmaps), 'ponowione')
+            ZadanieEksportuPdf.objects.update(nastepna_proba=now())
+            self.assertEqual(run_pdf_job(claim_pdf_jobs()[0], self.gmaps), 'bledy')
+
+        zadanie.refresh_from_db()
+        self.assertEqual((zadanie.status, zadanie.liczba_prob), (ZadanieEksportuPdf.Status.BLAD, 2))
+        self.assertEqual(zadanie.blad, 'dysk')
+
+
+class _LiczacyBackend(LocalRoutingBackend):
+    """Local estimates that remember which legs were asked for."""
+
+    def __init__(self, bez_czasu=()):
+        super().__init__()
+        self.odcinki = []
+        self.bez_czasu = set(bez_czasu)
+
+    def travel_times(self, odcinki, mode="driving"):
+        self.odcinki += odcinki
+        czasy = super().travel_times(odcinki, mode)
+        return [None if odcinek in self.bez_czasu else czas for odcinek, czas in zip(odcinki, czasy)]
+
+
+class TravelMatrixTests(SimpleTestCase):
+    def setUp(self):
+        katalog = tempfile.TemporaryDirectory()
+        self.addCleanup(katalog.cleanup)
+        self.katalog = katalog.name
+        self.lokalizacje = [(i, 50.05 + i * 0.01, 19.93 + i * 0.005) for i in range(1, 5)]
+
+    def _aktualizuj(self, backend, lokalizacje=None):
+        return update_city_matrix('Kraków', lokalizacje or self.lokalizacje, backend, modes=('driving',), katalog=self.katalog)
+
+    def _czasy(self, odcinki):
+        return TravelMatrixStore(self.katalog, refresh_interval=0).lookup(odcinki)
+
+    def test_full_build(self):
+        backend = _LiczacyBackend()
+
+        wynik = self._aktualizuj(backend)
+
+        self.assertEqual(wynik, {'lokalizacje': 4, 'bez_zmian': 0, 'policzone': 12})
+        odcinki = [((a[1], a[2]), (b[1], b[2])) for a in self.lokalizacje for b in self.lokalizacje]
+        self.assertEqual(self._czasy(odcinki), LocalRoutingBackend().travel_times(odcinki))
+
+    def test_unchanged_locations_are_reused(self):
+        self._aktualizuj(_LiczacyBackend())
+        backend = _LiczacyBackend()
+
+        wynik = self._aktualizuj(backend)
+
+        self.assertEqual(wynik, {'lokalizacje': 4, 'bez_zmian': 4, 'policzone': 0})
+        self.assertEqual(backend.odcinki, [])
+
+    def test_only_legs_of_a_moved_location_are_recomputed(self):
+        self._aktualizuj(_LiczacyBackend())
+        stary = (self.lokalizacje[1][1], self.lokalizacje[1][2])
+        przesuniete = list(self.lokalizacje)
+        przesuniete[1] = (2, 50.2, 19.8)
+        backend = _LiczacyBackend()
+
+        wynik = self._aktualizuj(backend, przesuniete)
+
+        self.assertEqual(wynik, {'lokalizacje': 4, 'bez_zmian': 3, 'policzone': 6})
+        self.assertTrue(all((50.2, 19.8) in odcinek for odcinek in backend.odcinki))
+        a, c = (przesuniete[0][1], przesuniete[0][2]), (przesuniete[2][1], przesuniete[2][2])
+        odcinki = [(a, (50.2, 19.8)), ((50.2, 19.8), c), (a, c), (a, stary)]
+        oczekiwane = LocalRoutingBackend().travel_times(odcinki[:3]) + [None]
+        self.assertEqual(self._czasy(odcinki), oczekiwane)
+
+    def test_legs_without_a_time_stay_unknown(self):
+        a, b = [(lat, lng) for _, lat, lng in self.lokalizacje[:2]]
+
+        self._aktualizuj(_LiczacyBackend(bez_czasu=[(a, b)]))
+
+        czas_ba = LocalRoutingBackend().travel_times([(b, a)])[0]
+        self.assertEqual(self._czasy([(a, b), (b, a)]), [None, czas_ba])
+
+
+class PlanZipExporterTests(PdfStoreMixin, StandinTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.plany = [PlanZwiedzania.objects.create(nazwa=nazwa) for nazwa in ('Kraków', 'Zakopane', 'Wieliczka')]
+
+    def _eksport(self, plan_ids):
+        eksporter = PlanZipExporter(plan_ids, self.gmaps, 'http://testserver/', procesy=2)
+        return eksporter, zipfile.ZipFile(BytesIO(b''.join(eksporter)))
+
+    def test_one_pdf_per_plan_and_errors_listed(self):
+        ids = [p.id for p in self.plany]
+
+        eksporter, archiwum = self._eksport(ids + [10 ** 6])
+
+        oczekiwane = {f"plan_{p.id}_{slug}.pdf" for p, slug in zip(self.plany, ('krakow', 'zakopane', 'wieliczka'))}
+        self.assertEqual(set(archiwum.namelist()), oczekiwane | {ERRORS_ENTRY})
+        for nazwa in oczekiwane:
+            self.assertTrue(archiwum.read(nazwa).startswith(b'%PDF'))
+        self.assertEqual(archiwum.read(ERRORS_ENTRY).decode(), f"Plan {10 ** 6}: Nie znaleziono planu\n")
+        self.assertEqual((eksporter.gotowe, eksporter.z_pamieci), (3, 0))
+
+    def test_cached_pdfs_are_not_rendered_again(self):
+        ids = [p.id for p in self.plany]
+        self._eksport(ids)
+
+        with mock.patch('plany.services.pdf_export.render_plan_pdf_file') as render:
+            eksporter, archiwum = self._eksport(ids)
+
+        render.assert_not_called()
+        self.assertEqual((eksporter.gotowe, eksporter.z_pamieci), (3, 3))
+        self.assertNotIn(ERRORS_ENTRY, archiwum.namelist())
+
+    def test_failed_render_is_left_out(self):
+        with mock.patch('plany.services.pdf_export.render_plan_pdf_file', side_effect=PrzekroczonyLimitRenderowania('limit')), \
+                self.assertLogs('plany.services.pdf_export', 'WARNING'):
+            eksporter, archiwum = self._eksport([self.plany[0].id])
+
+        self.assertEqual(archiwum.namelist(), [ERRORS_ENTRY])
+        self.assertEqual(archiwum.read(ERRORS_ENTRY).decode(), f"Plan {self.plany[0].id}: limit\n")
+        self.assertEqual(eksporter.gotowe, 0)
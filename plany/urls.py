@@ -17,12 +17,35 @@ urlpatterns = [
     # Saves the sightseeing plan based on the cart contents
     path('zapisz/', views.zapisz_plan, name='zapisz_plan'),
 
+    # Progress page of a plan built in the background, its JSON status and cancellation
+    path('budowa/<int:id>/', views.budowa_planu, name='budowa_planu'),
+    path('budowa/<int:id>/status/', views.status_budowy, name='status_budowy'),
+    path('budowa/<int:id>/anuluj/', views.anuluj_budowe, name='anuluj_budowe'),
+
     # Shows the detailed view of a sightseeing plan (with stage maps)
     path('plan/<int:id>/', views.szczegoly_planu, name='szczegoly_planu'),
 
+    # Reorders a stage's attractions with the local route optimizer
+    path('etap/<int:id>/optymalizuj/', views.optymalizuj_etap, name='optymalizuj_etap'),
+
+    # Edits an existing plan: add, remove, move and reorder attractions, change a stage's start address
+    path('etap/<int:id>/dodaj/', views.dodaj_do_etapu, name='dodaj_do_etapu'),
+    path('element/<int:id>/usun/', views.usun_element, name='usun_element'),
+    path('element/<int:id>/przenies/', views.przenies_element, name='przenies_element'),
+    path('etap/<int:id>/kolejnosc/', views.zmien_kolejnosc, name='zmien_kolejnosc'),
+    path('etap/<int:id>/start/', views.zmien_start, name='zmien_start'),
+
+    # Serves a cached static map image (content-addressed, immutable)
+    path('mapa/<str:klucz>.png', views.mapa_statyczna, name='mapa_statyczna'),
+
     # Exports the sightseeing plan to a downloadable PDF
     path('export/pdf/<int:id>/', views.export_plan_pdf, name='export_plan_pdf'),
 
+    # PDF export rendered in the background: progress page, polled status, download of the finished file
+    path('eksport/<int:id>/', views.eksport_pdf, name='eksport_pdf'),
+    path('eksport/<int:id>/status/', views.status_eksportu_pdf, name='status_eksportu_pdf'),
+    path('eksport/<int:id>/pobierz/', views.pobierz_pdf, name='pobierz_pdf'),
+
     # Deletes a plan if the current user is the owner
     path('usun/<int:id>/', views.usun_plan, name='usun_plan'),
 
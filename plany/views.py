@@ -1,25 +1,40 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponseRedirect, HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseForbidden, Http404, JsonResponse
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
 from django.contrib import messages
 from django.conf import settings
 import logging
-import googlemaps
 
-from .models import PlanZwiedzania, PlanUzytkownika
+from .models import PlanZwiedzania, PlanUzytkownika, EtapPlanu, ElementEtapu, ZadanieBudowyPlanu, ZadanieEksportuPdf
 from atrakcje.models import Atrakcja
+from atrakcje.services.spatial import DEFAULT_RADIUS_KM, nearby_attractions
+from .services.day_assignment import MAX_DAYS
 from .services.maps import (
-    build_etap_data, build_etap_map,
-    generate_map_and_update_travel_times
+    build_etap_view_fallback, generate_map_and_update_travel_times, optimize_etap_order
 )
-from .services.pdf_generator import render_plan_to_pdf
+from .services.file_serving import file_response
+from .services.gmaps_client import get_gmaps_client
+from .services.parallel import map_etapy
+from .services.routing import get_routing_backend
+from .services.snapshots import etap_view, snapshot_view, valid_snapshot
+from .services.static_maps import static_map_path
+from .services.pdf_cache import get_cached_pdf
+from .services.pdf_jobs import build_plan_pdf, enqueue_pdf_export, load_plan_for_pdf, stored_pdf
+from .services.pdf_jobs import job_status as pdf_job_status
 from .services.plan_builder import PlanBuilder
+from .services.plan_editor import PlanEditor
+from .services.plan_jobs import cancel_plan_build, enqueue_plan_build, job_status
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+# Number of nearby attractions suggested on the cart page
+KOSZYK_PROPOZYCJE_LIMIT = 5
+
 
 @login_required
 def dodaj_do_koszyka(request, atrakcja_id):
@@ -43,7 +58,8 @@ def dodaj_do_koszyka(request, atrakcja_id):
 @login_required
 def koszyk(request):
     """
-    Displays the contents of the user's cart and a form for day assignment.
+    Displays the contents of the user's cart, a form for day assignment and
+    suggestions of attractions close to the ones already chosen.
 
     Args:
         request (HttpRequest): The HTTP request.
@@ -55,13 +71,24 @@ def koszyk(request):
     atrakcje = Atrakcja.objects.filter(id__in=koszyk_ids)
     liczba_dni = request.GET.get('dni', 3)
     try:
-        liczba_dni = int(liczba_dni)
+        liczba_dni = max(1, min(int(liczba_dni), MAX_DAYS))
     except ValueError:
         liczba_dni = 3
+
+    propozycje = []
+    if koszyk_ids:
+        wyniki = nearby_attractions(
+            koszyk_ids, getattr(settings, 'NEARBY_RADIUS_KM', DEFAULT_RADIUS_KM), limit=KOSZYK_PROPOZYCJE_LIMIT
+        )
+        po_id = Atrakcja.objects.select_related('kategoria').in_bulk([a for a, _ in wyniki])
+        propozycje = [(po_id[a], round(d * 1000)) for a, d in wyniki if a in po_id]
+
     return render(request, 'plany/koszyk.html', {
         'atrakcje': atrakcje,
         'liczba_dni': liczba_dni,
-        'dni_range': range(1, liczba_dni + 1)
+        'dni_range': range(1, liczba_dni + 1),
+        'max_dni': MAX_DAYS,
+        'propozycje': propozycje,
     })
 
 @login_required
@@ -87,6 +114,8 @@ def usun_z_koszyka(request, atrakcja_id):
 def szczegoly_planu(request, id):
     """
     Displays the details of the sightseeing plan with stage maps.
+    Stages are read from their stored route snapshots; outdated ones are recomputed
+    concurrently, and a stage that misses the deadline is shown without route data.
 
     Args:
         request (HttpRequest): The HTTP request.
@@ -96,14 +125,34 @@ def szczegoly_planu(request, id):
         HttpResponse: Page with plan details.
     """
     plan = get_object_or_404(
-        PlanZwiedzania.objects.prefetch_related('etapy__elementy__atrakcja__lokalizacja'),
+        PlanZwiedzania.objects.prefetch_related('etapy__elementy__atrakcja__lokalizacja', 'etapy__trasa_etapu'),
         id=id
     )
-    gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+    etapy = list(plan.etapy.all())
+    dane_etapow = {}
+    do_obliczenia = []
+    for etap in etapy:
+        trasa = valid_snapshot(etap)
+        if trasa is not None:
+            dane_etapow[etap.id] = snapshot_view(trasa)
+        else:
+            do_obliczenia.append(etap)
+    if do_obliczenia:
+        gmaps = get_gmaps_client()
+        backend = get_routing_backend(gmaps)
+        dane_etapow.update(map_etapy(
+            lambda etap: etap_view(etap, gmaps, backend=backend),
+            do_obliczenia,
+            fallback=build_etap_view_fallback
+        ))
+
     etap_info = {}
     mapy_etapow = {}
-    for etap in plan.etapy.all():
-        punkty, dojazd_info = build_etap_data(plan, etap, gmaps)
+    mapy_statyczne = {}
+    for etap in etapy:
+        punkty, dojazd_info, klucz_mapy = dane_etapow[etap.id]
+        if klucz_mapy:
+            mapy_statyczne[etap.id] = reverse('plany:mapa_statyczna', args=[klucz_mapy])
         czas_zwiedzania = sum(el.czas_wizyty for el in etap.elementy.all())
         czas_dojazdu = sum(el.czas_dojazdu or 0 for el in etap.elementy.all())
 
@@ -114,14 +163,40 @@ def szczegoly_planu(request, id):
             "czas_laczny": czas_zwiedzania + czas_dojazdu
         }
         mapy_etapow[etap.id] = punkty
+
+    moze_edytowac = PlanUzytkownika.objects.filter(plan=plan, uzytkownik=request.user, jest_wlascicielem=True).exists()
     return render(request, 'plany/szczegoly_planu.html', {
         'plan': plan,
         'mapy_etapow': mapy_etapow,
+        'mapy_statyczne': mapy_statyczne,
         'etap_info': etap_info,
+        'moze_edytowac': moze_edytowac,
+        'koszyk_atrakcje': Atrakcja.objects.filter(id__in=request.session.get('koszyk', [])) if moze_edytowac else [],
         'google_maps_key': settings.GOOGLE_MAPS_API_KEY
     })
 
 
+@login_required
+def mapa_statyczna(request, klucz):
+    """
+    Serves a stored static map image. Images are content-addressed, so they never
+    change under a given key and can be cached by the browser indefinitely.
+
+    Args:
+        request (HttpRequest): The HTTP request.
+        klucz (str): Key of the stored map (SHA-256 hex digest).
+
+    Returns:
+        HttpResponse: The PNG image (streamed, or sent by the web server) with immutable cache headers.
+    """
+    try:
+        response = file_response(static_map_path(klucz), 'image/png')
+    except (ValueError, FileNotFoundError):
+        raise Http404("Mapa nie istnieje.")
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
 @login_required
 def generuj_mape_i_trase(request, id):
     """
@@ -135,13 +210,14 @@ def generuj_mape_i_trase(request, id):
         HttpResponse: Page with map and generated route.
     """
     plan = get_object_or_404(PlanZwiedzania, id=id)
-    map_url, directions = generate_map_and_update_travel_times(plan)
-    return render(request, 'plany/mapa_i_trasa.html', {'plan': plan, 'map_url': map_url, 'directions': directions})
+    map_url, zmiany = generate_map_and_update_travel_times(plan)
+    return render(request, 'plany/mapa_i_trasa.html', {'plan': plan, 'map_url': map_url, 'zmiany': zmiany})
 
 @login_required
 def zapisz_plan(request):
     """
-    Saves a new sightseeing plan based on the contents of the cart.
+    Saves a new sightseeing plan based on the contents of the cart, with attractions
+    assigned to days by hand or, with 'auto_dni', split into days automatically.
 
     Args:
         request (HttpRequest): HTTP request with form data.
@@ -156,9 +232,20 @@ def zapisz_plan(request):
             logger.warning("Użytkownik %s próbował zapisać plan bez atrakcji w koszyku", request.user.username)
             return redirect('plany:koszyk')
 
+        liczba_dni = None
+        if request.POST.get('auto_dni'):
+            try:
+                liczba_dni = int(request.POST.get('liczba_dni', 1))
+            except ValueError:
+                liczba_dni = 0
+            if not 1 <= liczba_dni <= MAX_DAYS:
+                messages.error(request, f"Liczba dni musi być między 1 a {MAX_DAYS}.")
+                return redirect('plany:koszyk')
+            liczba_dni = min(liczba_dni, len(koszyk_ids))
+
         przypisane_atrakcje = {}
         for key, value in request.POST.items():
-            if key.startswith("dzien_"):
+            if liczba_dni is None and key.startswith("dzien_"):
                 try:
                     atrakcja_id = int(key.split("_")[1])
                     dzien = int(value)
@@ -183,8 +270,16 @@ def zapisz_plan(request):
         nazwa = request.POST.get('nazwa') or f"Plan {request.user.username}"
         adres_startowy = starty.get(1, request.POST.get('adres_startowy'))  # fallback
 
+        if getattr(settings, 'PLAN_BUILD_ASYNC', False):
+            zadanie = enqueue_plan_build(
+                request.user, koszyk_ids, nazwa, adres_startowy, przypisane_atrakcje, starty=starty,
+                liczba_dni=liczba_dni
+            )
+            request.session['koszyk'] = []
+            return redirect('plany:budowa_planu', id=zadanie.id)
+
         try:
-            gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+            gmaps = get_gmaps_client()
             builder = PlanBuilder(
                 user=request.user,
                 koszyk_ids=koszyk_ids,
@@ -192,7 +287,8 @@ def zapisz_plan(request):
                 adres_startowy=adres_startowy,
                 przypisane_atrakcje=przypisane_atrakcje,
                 gmaps=gmaps,
-                starty=starty 
+                starty=starty,
+                liczba_dni=liczba_dni
             )
             plan = builder.build()
             request.session['koszyk'] = []  
@@ -207,29 +303,342 @@ def zapisz_plan(request):
     else:
         return redirect('plany:koszyk')
 
+@login_required
+def budowa_planu(request, id):
+    """
+    Shows the progress of a plan being built in the background; the page polls
+    status_budowy and moves on to the plan once it is ready.
+
+    Args:
+        request (HttpRequest): The HTTP request.
+        id (int): ID of the build job (ZadanieBudowyPlanu).
+
+    Returns:
+        HttpResponse: Progress page, or a redirect to the finished plan.
+    """
+    zadanie = get_object_or_404(ZadanieBudowyPlanu, id=id, uzytkownik=request.user)
+    if zadanie.plan_id:
+        return redirect('plany:szczegoly_planu', id=zadanie.plan_id)
+    return render(request, 'plany/budowa_planu.html', {'zadanie': zadanie, 'stan': job_status(zadanie)})
+
+@login_required
+def status_budowy(request, id):
+    """
+    Returns the state of a plan build job for the polling progress page.
+
+    Args:
+        request (HttpRequest): The HTTP request.
+        id (int): ID of the build job (ZadanieBudowyPlanu).
+
+    Returns:
+        JsonResponse: job_status() plus 'url' of the plan once it is built.
+    """
+    zadanie = get_object_or_404(ZadanieBudowyPlanu, id=id, uzytkownik=request.user)
+    stan = job_status(zadanie)
+    stan['url'] = reverse('plany:szczegoly_planu', args=[zadanie.plan_id]) if zadanie.plan_id else None
+    return JsonResponse(stan)
+
+@login_required
+def anuluj_budowe(request, id):
+    """
+    Cancels a plan build job (or dismisses a failed one) and puts its attractions
+    back into the cart.
+
+    Args:
+        request (HttpRequest): The HTTP request (POST).
+        id (int): ID of the build job (ZadanieBudowyPlanu).
+
+    Returns:
+        HttpResponseRedirect: Redirects to the cart.
+    """
+    zadanie = get_object_or_404(ZadanieBudowyPlanu, id=id, uzytkownik=request.user)
+    if request.method != "POST":
+        return redirect('plany:budowa_planu', id=zadanie.id)
+    if cancel_plan_build(zadanie):
+        logger.info("Użytkownik %s anulował budowę planu (zadanie ID: %s)", request.user.username, zadanie.id)
+        messages.info(request, "Anulowano tworzenie planu.")
+    elif zadanie.status != ZadanieBudowyPlanu.Status.BLAD:
+        messages.warning(request, "Tego planu nie można już anulować.")
+        return redirect('plany:budowa_planu', id=zadanie.id)
+    koszyk = request.session.get('koszyk', [])
+    request.session['koszyk'] = koszyk + [a for a in zadanie.koszyk if a not in koszyk]
+    return redirect('plany:koszyk')
+
+def _pdf_response(request, plan_id, klucz, sciezka):
+    """
+    Sends a stored plan PDF (see file_response) with its content hash as the ETag, or
+    answers 304 when the client already has it.
+    """
+    etag = quote_etag(klucz)
+    zmodyfikowano = int(sciezka.stat().st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=zmodyfikowano)
+    if response is None:
+        response = file_response(sciezka, 'application/pdf', filename=f"plan_{plan_id}.pdf", as_attachment=True)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(zmodyfikowano)
+    # Per-user content: browsers may keep it, shared caches may not.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
 @login_required
 def export_plan_pdf(request, id):
     """
     Exports the plan to a PDF file along with stage maps.
 
+    Rendered PDFs are stored under a hash of the plan content, so an unchanged plan is
+    streamed from disk without rendering; the hash is also the ETag, and a repeated
+    download with a matching If-None-Match / If-Modified-Since gets 304. Otherwise the
+    render is queued for manage.py pdf_worker (PDF_RENDER_ASYNC) and the user is sent to
+    a page that polls it, or it is rendered within the request in an isolated process.
+
     Args:
         request (HttpRequest): The HTTP request.
         id (int): ID of the plan.
 
     Returns:
-        HttpResponse: PDF as a downloadable response.
+        HttpResponse: PDF as a downloadable response, 304 Not Modified, or a redirect to the export page.
     """
-    plan = get_object_or_404(
-        PlanZwiedzania.objects.prefetch_related('etapy__elementy__atrakcja__lokalizacja'),
-        id=id
+    try:
+        plan = load_plan_for_pdf(id)
+    except PlanZwiedzania.DoesNotExist:
+        raise Http404("Nie znaleziono planu.")
+    gotowy = stored_pdf(plan)
+    if gotowy is not None:
+        return _pdf_response(request, plan.id, *gotowy)
+
+    if getattr(settings, 'PDF_RENDER_ASYNC', False):
+        zadanie = enqueue_pdf_export(plan, request.user, request.build_absolute_uri())
+        return redirect('plany:eksport_pdf', id=zadanie.id)
+    try:
+        klucz, sciezka = build_plan_pdf(plan, get_gmaps_client(), request.build_absolute_uri())
+    except Exception as e:
+        logger.error(f"Błąd podczas generowania PDF dla planu ID {plan.id}: {e}", exc_info=True)
+        return HttpResponse("Błąd podczas generowania PDF.", status=500)
+    return _pdf_response(request, plan.id, klucz, sciezka)
+
+@login_required
+def eksport_pdf(request, id):
+    """
+    Shows the state of a PDF export rendered in the background; the page polls
+    status_eksportu_pdf and starts the download once the file is ready.
+
+    Args:
+        request (HttpRequest): The HTTP request.
+        id (int): ID of the export job (ZadanieEksportuPdf).
+
+    Returns:
+        HttpResponse: Export progress page.
+    """
+    zadanie = get_object_or_404(ZadanieEksportuPdf.objects.select_related('plan'), id=id, uzytkownik=request.user)
+    return render(request, 'plany/eksport_pdf.html', {'zadanie': zadanie, 'stan': pdf_job_status(zadanie)})
+
+@login_required
+def status_eksportu_pdf(request, id):
+    """
+    Returns the state of a PDF export job for the polling export page.
+
+    Args:
+        request (HttpRequest): The HTTP request.
+        id (int): ID of the export job (ZadanieEksportuPdf).
+
+    Returns:
+        JsonResponse: pdf_jobs.job_status() plus 'url' of the download once it is ready.
+    """
+    zadanie = get_object_or_404(ZadanieEksportuPdf, id=id, uzytkownik=request.user)
+    stan = pdf_job_status(zadanie)
+    stan['url'] = reverse('plany:pobierz_pdf', args=[zadanie.id]) if stan['gotowe'] else None
+    return JsonResponse(stan)
+
+@login_required
+def pobierz_pdf(request, id):
+    """
+    Downloads the PDF of a finished export job. A PDF evicted from the cache in the
+    meantime is exported again.
+
+    Args:
+        request (HttpRequest): The HTTP request.
+        id (int): ID of the export job (ZadanieEksportuPdf).
+
+    Returns:
+        HttpResponse: PDF as a downloadable response, 304 Not Modified, or a redirect.
+    """
+    zadanie = get_object_or_404(
+        ZadanieEksportuPdf, id=id, uzytkownik=request.user, status=ZadanieEksportuPdf.Status.ZAKONCZONE
     )
-    gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
-    mapy_etapow = {}
-    for etap in plan.etapy.all():
-        map_data = build_etap_map(etap, gmaps, plan.adres_startowy)
-        if map_data:
-            mapy_etapow[etap.id] = map_data
-    return render_plan_to_pdf(plan, mapy_etapow, request.build_absolute_uri())
+    sciezka = get_cached_pdf(zadanie.klucz)
+    if sciezka is None:
+        return redirect('plany:export_plan_pdf', id=zadanie.plan_id)
+    return _pdf_response(request, zadanie.plan_id, zadanie.klucz, sciezka)
+
+@login_required
+def optymalizuj_etap(request, id):
+    """
+    Reorders the attractions of a stage with the local route optimizer and saves the new order.
+
+    Args:
+        request (HttpRequest): The HTTP request (POST).
+        id (int): ID of the stage (EtapPlanu).
+
+    Returns:
+        HttpResponseRedirect: Redirects to the plan details.
+    """
+    etap = get_object_or_404(EtapPlanu.objects.select_related('plan'), id=id)
+    relacja = get_object_or_404(PlanUzytkownika, plan=etap.plan, uzytkownik=request.user)
+    if not relacja.jest_wlascicielem:
+        logger.warning("Nieautoryzowana próba zmiany kolejności etapu ID: %s przez %s", etap.id, request.user.username)
+        return HttpResponseForbidden("Nie masz uprawnień do edycji tego planu.")
+    if request.method == "POST":
+        gmaps = get_gmaps_client()
+        optimize_etap_order(etap, gmaps)
+        logger.info("Użytkownik %s zoptymalizował kolejność etapu ID: %s", request.user.username, etap.id)
+        messages.success(request, f"Zoptymalizowano kolejność atrakcji: {etap.nazwa}.")
+    return redirect('plany:szczegoly_planu', id=etap.plan_id)
+
+def _edytor_planu(request, plan, akcja):
+    """
+    Returns a PlanEditor for the plan, or HttpResponseForbidden if the user does not own it.
+    """
+    relacja = get_object_or_404(PlanUzytkownika, plan=plan, uzytkownik=request.user)
+    if not relacja.jest_wlascicielem:
+        logger.warning("Nieautoryzowana próba edycji planu ID: %s (%s) przez %s", plan.id, akcja, request.user.username)
+        return HttpResponseForbidden("Nie masz uprawnień do edycji tego planu.")
+    return PlanEditor(plan, get_gmaps_client())
+
+def _pozycja(request):
+    try:
+        return int(request.POST['pozycja'])
+    except (KeyError, ValueError):
+        return None
+
+@login_required
+def dodaj_do_etapu(request, id):
+    """
+    Adds an attraction (POST 'atrakcja', optional 'pozycja') to a stage of an existing plan;
+    only the travel times next to it are recomputed.
+
+    Args:
+        request (HttpRequest): The HTTP request (POST).
+        id (int): ID of the stage (EtapPlanu).
+
+    Returns:
+        HttpResponseRedirect: Redirects to the plan details.
+    """
+    etap = get_object_or_404(EtapPlanu.objects.select_related('plan'), id=id)
+    edytor = _edytor_planu(request, etap.plan, "dodanie atrakcji")
+    if isinstance(edytor, HttpResponseForbidden):
+        return edytor
+    if request.method == "POST":
+        try:
+            atrakcja_id = int(request.POST.get('atrakcja', ''))
+        except ValueError:
+            messages.error(request, "Nie wybrano atrakcji.")
+            return redirect('plany:szczegoly_planu', id=etap.plan_id)
+        edytor.insert(etap, atrakcja_id, _pozycja(request))
+        koszyk = request.session.get('koszyk', [])
+        if atrakcja_id in koszyk:
+            koszyk.remove(atrakcja_id)
+            request.session['koszyk'] = koszyk
+        logger.info("Użytkownik %s dodał atrakcję ID %s do etapu ID: %s", request.user.username, atrakcja_id, etap.id)
+        messages.success(request, f"Dodano atrakcję do etapu: {etap.nazwa}.")
+    return redirect('plany:szczegoly_planu', id=etap.plan_id)
+
+@login_required
+def usun_element(request, id):
+    """
+    Removes an attraction from a stage; only the leg that closes the gap is recomputed.
+
+    Args:
+        request (HttpRequest): The HTTP request (POST).
+        id (int): ID of the stage element (ElementEtapu).
+
+    Returns:
+        HttpResponseRedirect: Redirects to the plan details.
+    """
+    element = get_object_or_404(ElementEtapu.objects.select_related('etap__plan'), id=id)
+    edytor = _edytor_planu(request, element.etap.plan, "usunięcie atrakcji")
+    if isinstance(edytor, HttpResponseForbidden):
+        return edytor
+    if request.method == "POST":
+        edytor.remove(element)
+        logger.info("Użytkownik %s usunął element ID %s z etapu ID: %s", request.user.username, id, element.etap_id)
+        messages.success(request, "Usunięto atrakcję z planu.")
+    return redirect('plany:szczegoly_planu', id=element.etap.plan_id)
+
+@login_required
+def przenies_element(request, id):
+    """
+    Moves an attraction to a position (POST 'pozycja') of the same or another stage
+    (POST 'etap') of the plan.
+
+    Args:
+        request (HttpRequest): The HTTP request (POST).
+        id (int): ID of the stage element (ElementEtapu).
+
+    Returns:
+        HttpResponseRedirect: Redirects to the plan details.
+    """
+    element = get_object_or_404(ElementEtapu.objects.select_related('etap__plan'), id=id)
+    plan = element.etap.plan
+    edytor = _edytor_planu(request, plan, "przeniesienie atrakcji")
+    if isinstance(edytor, HttpResponseForbidden):
+        return edytor
+    if request.method == "POST":
+        try:
+            etap_id = int(request.POST.get('etap') or element.etap_id)
+        except ValueError:
+            messages.error(request, "Nieprawidłowy etap docelowy.")
+            return redirect('plany:szczegoly_planu', id=plan.id)
+        etap = element.etap if etap_id == element.etap_id else get_object_or_404(EtapPlanu, id=etap_id, plan=plan)
+        edytor.move(element, etap, _pozycja(request))
+        logger.info("Użytkownik %s przeniósł element ID %s do etapu ID: %s", request.user.username, id, etap.id)
+    return redirect('plany:szczegoly_planu', id=plan.id)
+
+@login_required
+def zmien_kolejnosc(request, id):
+    """
+    Puts the attractions of a stage into a new order (POST 'elementy': comma-separated
+    element IDs); only legs between newly adjacent attractions are recomputed.
+
+    Args:
+        request (HttpRequest): The HTTP request (POST).
+        id (int): ID of the stage (EtapPlanu).
+
+    Returns:
+        HttpResponseRedirect: Redirects to the plan details.
+    """
+    etap = get_object_or_404(EtapPlanu.objects.select_related('plan'), id=id)
+    edytor = _edytor_planu(request, etap.plan, "zmiana kolejności")
+    if isinstance(edytor, HttpResponseForbidden):
+        return edytor
+    if request.method == "POST":
+        try:
+            edytor.reorder(etap, [e for e in request.POST.get('elementy', '').split(',') if e.strip()])
+            messages.success(request, f"Zmieniono kolejność atrakcji: {etap.nazwa}.")
+        except ValueError:
+            messages.error(request, "Nieprawidłowa kolejność atrakcji.")
+    return redirect('plany:szczegoly_planu', id=etap.plan_id)
+
+@login_required
+def zmien_start(request, id):
+    """
+    Changes the start address of a stage (POST 'adres_startowy'); only the leg to its
+    first attraction is recomputed.
+
+    Args:
+        request (HttpRequest): The HTTP request (POST).
+        id (int): ID of the stage (EtapPlanu).
+
+    Returns:
+        HttpResponseRedirect: Redirects to the plan details.
+    """
+    etap = get_object_or_404(EtapPlanu.objects.select_related('plan'), id=id)
+    edytor = _edytor_planu(request, etap.plan, "zmiana adresu startowego")
+    if isinstance(edytor, HttpResponseForbidden):
+        return edytor
+    if request.method == "POST":
+        edytor.change_start(etap, request.POST.get('adres_startowy', '').strip())
+        messages.success(request, f"Zmieniono adres startowy: {etap.nazwa}.")
+    return redirect('plany:szczegoly_planu', id=etap.plan_id)
 
 @login_required
 def usun_plan(request, id):